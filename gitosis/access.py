@@ -3,27 +3,10 @@ import os, logging
 from gitosis import group
 from gitosis.gitoliteConfig import GitoliteConfigException
 
-def haveAccess(config, user, mode, path):
-    """
-    Map request for write access to allowed path.
-
-    Note for read-only access, the caller should check for write
-    access too.
-
-    Returns ``None`` for no access, or a tuple of toplevel directory
-    containing repositories and a relative path to the physical repository.
-    """
-    detail = []
-    log = logging.getLogger('gitosis.access.haveAccess')
-
-    log.debug(
-        'Access check for %(user)r as %(mode)r on %(path)r...'
-        % dict(
-        user=user,
-        mode=mode,
-        path=path,
-        ))
+# strongest first
+MODES = ('RW+', 'R')
 
+def _lookup(config, path, log):
     basename, ext = os.path.splitext(path)
     if ext == '.git':
         log.debug(
@@ -42,48 +25,128 @@ def haveAccess(config, user, mode, path):
 
     if not repo:
         log.warning("No repo contains path '%s'" % path)
-        return
 
-    mapping = None
+    return (repo, path)
+
+def _check(config, user, repo, mode, membership, log):
+    """
+    Returns ``None`` for no access, else ``user`` if it is listed
+    directly or the name of the group that grants access.
+    """
     try:
         users = config.get_repo(repo, mode)
     except GitoliteConfigException:
         log.exception("When get '%s' of '%s':" % (mode, repo))
         return
 
-    if users:
-        if user in users:
-            mapping = path
-        else:
-            for groupname in group.getMembership(config=config, user=user):
-                if groupname in users:
-                    mapping = path
-                    detail.append("as group '%s'" % groupname)
-                    break
-            
-    if mapping is not None:
-        if detail:
-            detail = '(%s)' % ', '.join(detail)
-        else:
-            detail = ''
+    if not users:
+        return
 
-        log.debug(
-            'Access ok for %(user)r as %(mode)r on %(path)r(%(detail)s)'
-            % dict(
-            user=user,
-            mode=mode,
-            path=path,
-            detail=detail
-            ))
+    if user in users:
+        return user
 
-        prefix = config.get_gitosis('repositories')
-        if prefix == None:
-            prefix = 'repositories'
+    for groupname in membership:
+        if groupname in users:
+            return groupname
 
-        log.debug(
-            'Using prefix %(prefix)r for %(path)r'
-            % dict(
-            prefix=prefix,
-            path=mapping,
-            ))
-        return (prefix, mapping)
+def _prefix(config, path, log):
+    prefix = config.get_gitosis('repositories')
+    if prefix == None:
+        prefix = 'repositories'
+
+    log.debug(
+        'Using prefix %(prefix)r for %(path)r'
+        % dict(
+        prefix=prefix,
+        path=path,
+        ))
+    return prefix
+
+def haveAccess(config, user, mode, path):
+    """
+    Map request for write access to allowed path.
+
+    Note for read-only access, the caller should check for write
+    access too.
+
+    Returns ``None`` for no access, or a tuple of toplevel directory
+    containing repositories and a relative path to the physical repository.
+    """
+    log = logging.getLogger('gitosis.access.haveAccess')
+
+    log.debug(
+        'Access check for %(user)r as %(mode)r on %(path)r...'
+        % dict(
+        user=user,
+        mode=mode,
+        path=path,
+        ))
+
+    repo, mapping = _lookup(config, path, log)
+    if not repo:
+        return
+
+    via = _check(config, user, repo, mode,
+                 group.getMembership(config=config, user=user), log)
+    if via is None:
+        return
+
+    if via != user:
+        detail = "(as group '%s')" % via
+    else:
+        detail = ''
+
+    log.debug(
+        'Access ok for %(user)r as %(mode)r on %(path)r%(detail)s'
+        % dict(
+        user=user,
+        mode=mode,
+        path=path,
+        detail=detail
+        ))
+
+    return (_prefix(config, mapping, log), mapping)
+
+def getAccess(config, user, path):
+    """
+    Find the strongest access ``user`` has to ``path``, in one go.
+
+    Returns ``None`` for no access, or a tuple of the mode (``'RW+'``
+    or ``'R'``), the toplevel directory containing repositories, a
+    relative path to the physical repository, and the group that
+    granted the access (``None`` if ``user`` is listed directly).
+    """
+    log = logging.getLogger('gitosis.access.getAccess')
+
+    log.debug(
+        'Access check for %(user)r on %(path)r...'
+        % dict(
+        user=user,
+        path=path,
+        ))
+
+    repo, mapping = _lookup(config, path, log)
+    if not repo:
+        return
+
+    membership = config.get_membership(user)
+    for mode in MODES:
+        via = _check(config, user, repo, mode, membership, log)
+        if via is not None:
+            break
+    else:
+        return
+
+    if via == user:
+        via = None
+
+    log.debug(
+        'Access %(mode)r for %(user)r on %(path)r (via %(via)r)'
+        % dict(
+        user=user,
+        mode=mode,
+        path=path,
+        via=via,
+        ))
+
+    return (mode, _prefix(config, mapping, log), mapping, via)
@@ -0,0 +1,192 @@
+"""
+Answer ``gitosis-serve`` access questions from a long-running process.
+
+``gitosis-accessd`` keeps the parsed config and its membership indexes
+in memory and listens on a UNIX socket. ``gitosis-serve`` sends it the
+user and ``SSH_ORIGINAL_COMMAND`` and gets back the command to run, or
+the reason it was denied, without parsing anything itself. When the
+daemon is not running ``gitosis-serve`` does the work in-process.
+
+The config is reloaded, and swapped in whole, as soon as the
+post-update hook publishes a new one.
+"""
+
+import errno
+import logging
+import os
+import signal
+import socket
+import sys
+import threading
+import SocketServer
+
+from gitosis import app
+from gitosis import serve
+from gitosis import gitoliteConfig
+
+log = logging.getLogger('gitosis.accessd')
+
+class AccessRequestHandler(SocketServer.BaseRequestHandler):
+    def handle(self):
+        self.request.settimeout(self.server.timeout)
+        try:
+            request = serve.recv_all(self.request)
+        except socket.error, e:
+            log.warning('Cannot read request: %s', e)
+            return
+
+        try:
+            user, command = request.split('\0', 1)
+        except ValueError:
+            reply = (serve.ACCESSD_FAILED, 'malformed request')
+        else:
+            reply = self.server.answer(user, command)
+
+        try:
+            self.request.sendall('%s\t%s' % reply)
+        except socket.error, e:
+            log.warning('Cannot send reply: %s', e)
+
+class AccessServer(SocketServer.ThreadingMixIn,
+                   SocketServer.UnixStreamServer):
+    daemon_threads = True
+    timeout = 10.0
+
+    def __init__(self, path, read_config):
+        """
+        @param path: socket to listen on.
+
+        @param read_config: callable filling in a fresh
+        ``GitoliteConfig`` from the config file.
+        """
+        try:
+            os.unlink(path)
+        except OSError, e:
+            if e.errno != errno.ENOENT:
+                raise
+        SocketServer.UnixStreamServer.__init__(
+            self, path, AccessRequestHandler)
+
+        self.read_config = read_config
+        self.config_path = None
+        self.current = (None, None)
+        self.reload_lock = threading.Lock()
+        # access checks run concurrently, but creating a repository
+        # (temporary files named after the pid, projects.list, the
+        # inventory) is one thread at a time
+        self.create_lock = threading.Lock()
+
+    def _stamp(self):
+        # the hook renames the new config into place, so this changes
+        # on every publish
+        st = os.stat(self.config_path)
+        return (st.st_ino, st.st_mtime, st.st_size)
+
+    def reload(self, force=False):
+        """
+        Load the config again if it changed, keep the old one if the
+        new one can't be read.
+        """
+        self.reload_lock.acquire()
+        try:
+            stamp, cfg = self.current
+            try:
+                new_stamp = self._stamp()
+            except OSError, e:
+                log.error('Cannot stat config: %s', e)
+                return cfg
+            if new_stamp == stamp and not force:
+                return cfg
+
+            new_cfg = gitoliteConfig.GitoliteConfig()
+            try:
+                self.read_config(new_cfg)
+            except (app.CannotReadConfigError,
+                    gitoliteConfig.GitoliteConfigException), e:
+                log.error('Keeping the old config: %s', e)
+                return cfg
+
+            log.info('Loaded config %r', self.config_path)
+            self.current = (new_stamp, new_cfg)
+            return new_cfg
+        finally:
+            self.reload_lock.release()
+
+    def config(self):
+        stamp, cfg = self.current
+        try:
+            if cfg is not None and self._stamp() == stamp:
+                return cfg
+        except OSError:
+            pass
+        return self.reload()
+
+    def answer(self, user, command):
+        cfg = self.config()
+        if cfg is None:
+            return (serve.ACCESSD_FAILED, 'no config loaded')
+
+        try:
+            newcmd = serve.serve(cfg=cfg, user=user, command=command,
+                                 create_lock=self.create_lock)
+        except serve.ServingError, e:
+            log.info('Denied %r for %r: %s', command, user, e)
+            return (serve.ACCESSD_DENIED, e.__class__.__name__)
+        except Exception, e:
+            log.exception('Failed to serve %r for %r', command, user)
+            return (serve.ACCESSD_FAILED, str(e))
+
+        log.debug('Serving %r for %r', newcmd, user)
+        return (serve.ACCESSD_OK, newcmd)
+
+class Main(app.App):
+    def get_defaults(self):
+        defaults = super(Main, self).get_defaults()
+        defaults.update(
+            socket=os.path.expanduser(serve.ACCESSD_SOCKET),
+            )
+        return defaults
+
+    def create_parser(self):
+        parser = super(Main, self).create_parser()
+        parser.set_usage('%prog [OPTS]')
+        parser.set_description(
+            'Answer gitosis-serve access checks from memory')
+        parser.add_option('--socket',
+                          metavar='FILE',
+                          help='listen on UNIX socket FILE',
+                          )
+        return parser
+
+    def handle_args(self, parser, cfg, options, args):
+        super(Main, self).handle_args(parser, cfg, options, args)
+
+        os.umask(0022)
+        # serve() hands out paths relative to the home directory
+        os.chdir(os.path.expanduser('~'))
+
+        def read_config(new_cfg):
+            self.read_config(options, new_cfg)
+
+        server = AccessServer(options.socket, read_config)
+        server.config_path = options.config
+        server.current = (server._stamp(), cfg)
+
+        signal.signal(
+            signal.SIGHUP,
+            lambda signum, frame: server.reload(force=True))
+        signal.signal(
+            signal.SIGTERM,
+            lambda signum, frame: sys.exit(0))
+
+        log.info('Listening on %r', options.socket)
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+            try:
+                os.unlink(options.socket)
+            except OSError:
+                pass
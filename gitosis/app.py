@@ -1,7 +1,6 @@
 import os
 import sys
 import logging
-import optparse
 import errno
 from gitosis import gitoliteConfig
 
@@ -16,6 +15,12 @@ class CannotReadConfigError(Exception):
 class ConfigFileDoesNotExistError(CannotReadConfigError):
     """Configuration does not exist"""
 
+class Options(object):
+    """Parsed options, for when optparse is not worth importing"""
+
+    def __init__(self, **kw):
+        self.__dict__.update(kw)
+
 class App(object):
     name = None
 
@@ -26,8 +31,7 @@ class App(object):
 
     def main(self):
         self.setup_basic_logging()
-        parser = self.create_parser()
-        (options, args) = parser.parse_args()
+        (parser, options, args) = self.parse_args()
         cfg = self.create_config(options)
         try:
             self.read_config(options, cfg)
@@ -40,11 +44,20 @@ class App(object):
     def setup_basic_logging(self):
         logging.basicConfig()
 
-    def create_parser(self):
-        parser = optparse.OptionParser()
-        parser.set_defaults(
+    def parse_args(self):
+        parser = self.create_parser()
+        (options, args) = parser.parse_args()
+        return (parser, options, args)
+
+    def get_defaults(self):
+        return dict(
             config=os.path.expanduser('~/.gitosis.conf'),
             )
+
+    def create_parser(self):
+        import optparse
+        parser = optparse.OptionParser()
+        parser.set_defaults(**self.get_defaults())
         parser.add_option('--config',
                           metavar='FILE',
                           help='read config from FILE',
@@ -67,10 +80,17 @@ class App(object):
             else:
                 raise CannotReadConfigError(str(e))
         try:
-            cfg.load(conffile)
+            data = conffile.read()
         finally:
             conffile.close()
 
+        # the post-update hook leaves a pre-parsed snapshot next to
+        # the config, use it as long as it was made from this content
+        if gitoliteConfig.read_snapshot(cfg, options.config, data):
+            log.debug('Loaded config snapshot for %r', options.config)
+        else:
+            cfg.load(data.splitlines())
+
     def setup_logging(self, cfg):
         try:
             loglevel = cfg.get_gitosis('loglevel')
@@ -0,0 +1,69 @@
+"""
+Answer sshd's ``AuthorizedKeysCommand`` from the gitosis key index.
+
+Instead of sshd reading through every key in ``authorized_keys`` on
+each login, it runs ``gitosis-authorized-keys %f`` (or ``%t %k``) and
+gets back just the forced-command line for the offered key, looked up
+by fingerprint in the index the post-update hook writes to
+``ssh-key-index-path``.
+"""
+
+import logging
+import sys
+
+from gitosis import app
+from gitosis import ssh
+from gitosis import util
+
+log = logging.getLogger('gitosis.authorized_keys')
+
+class Main(app.App):
+    def get_defaults(self):
+        defaults = super(Main, self).get_defaults()
+        defaults.update(
+            index=None,
+            )
+        return defaults
+
+    def create_parser(self):
+        parser = super(Main, self).create_parser()
+        parser.set_usage('%prog [OPTS] FINGERPRINT|TYPE KEY')
+        parser.set_description(
+            'Print the authorized_keys line for an SSH key')
+        parser.add_option('--index',
+                          metavar='FILE',
+                          help='look the key up in index FILE',
+                          )
+        return parser
+
+    def read_config(self, options, cfg):
+        # the config is only needed to find the index
+        if options.index is None:
+            super(Main, self).read_config(options, cfg)
+
+    def handle_args(self, parser, cfg, options, args):
+        if len(args) == 1:
+            (fingerprint,) = args
+        elif len(args) == 2:
+            fingerprint = ssh.keyFingerprint(' '.join(args))
+            if fingerprint is None:
+                log.error('Cannot parse SSH key %r', ' '.join(args))
+                sys.exit(1)
+        else:
+            parser.error('Missing argument FINGERPRINT.')
+
+        path = options.index
+        if path is None:
+            path = util.getSSHKeyIndexPath(config=cfg)
+        if path is None:
+            log.error('No ssh-key-index-path configured')
+            sys.exit(1)
+
+        try:
+            lines = ssh.lookupKeyIndex(path, fingerprint)
+        except (IOError, OSError), e:
+            log.error('Cannot read key index: %s', e)
+            sys.exit(1)
+
+        for line in lines:
+            print line
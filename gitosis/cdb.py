@@ -0,0 +1,117 @@
+"""
+Constant databases, in D. J. Bernstein's cdb format.
+
+A cdb is written once, in one go, and then only read: a lookup is a
+hash, a read of the table slot and a read of the record, without
+loading or parsing the rest of the file. Keys may repeat; lookups see
+the values in the order they were added.
+
+The format is compatible with the cdb tools: a 2048 byte header of
+256 (position, slot count) pairs, the records as (key length, value
+length, key, value), then the 256 open-addressing hash tables of
+(hash, record position) slots, all numbers little-endian 32 bit.
+"""
+
+import struct
+
+_PAIR = struct.Struct('<II')
+_HEADER_SIZE = 256 * _PAIR.size
+
+class CdbError(Exception):
+    """Invalid constant database"""
+
+    def __str__(self):
+        return '%s: %s' % (self.__doc__, ': '.join(self.args))
+
+def cdb_hash(key):
+    h = 5381
+    for c in key:
+        h = (((h << 5) + h) ^ ord(c)) & 0xffffffff
+    return h
+
+class CdbWriter(object):
+    """
+    Write a constant database to ``fp``, which must be seekable and
+    positioned at its start.
+    """
+
+    def __init__(self, fp):
+        self.fp = fp
+        self.pos = _HEADER_SIZE
+        self.tables = [[] for i in xrange(256)]
+        fp.write('\0' * _HEADER_SIZE)
+
+    def add(self, key, value):
+        self.fp.write(_PAIR.pack(len(key), len(value)))
+        self.fp.write(key)
+        self.fp.write(value)
+        h = cdb_hash(key)
+        self.tables[h & 0xff].append((h, self.pos))
+        self.pos += _PAIR.size + len(key) + len(value)
+        if self.pos > 0xffffffff:
+            raise CdbError('database too large')
+
+    def finish(self):
+        header = []
+        for entries in self.tables:
+            # twice as many slots as entries keeps probing short
+            slots = [(0, 0)] * (2 * len(entries))
+            for h, pos in entries:
+                i = (h >> 8) % len(slots)
+                while slots[i][1]:
+                    i = (i + 1) % len(slots)
+                slots[i] = (h, pos)
+
+            header.append(_PAIR.pack(self.pos, len(slots)))
+            self.fp.write(''.join(_PAIR.pack(h, pos) for h, pos in slots))
+            self.pos += _PAIR.size * len(slots)
+
+        self.fp.seek(0)
+        self.fp.write(''.join(header))
+        self.fp.flush()
+
+class Cdb(object):
+    """
+    Look keys up in the constant database open as ``fp``.
+    """
+
+    def __init__(self, fp):
+        self.fp = fp
+
+    def _read(self, pos, size):
+        self.fp.seek(pos)
+        data = self.fp.read(size)
+        if len(data) != size:
+            raise CdbError('truncated at %d' % pos)
+        return data
+
+    def getall(self, key):
+        """
+        Generate the values stored under ``key``, in insertion order.
+        """
+        h = cdb_hash(key)
+        table, nslots = _PAIR.unpack(
+            self._read((h & 0xff) * _PAIR.size, _PAIR.size))
+        if not nslots:
+            return
+
+        i = (h >> 8) % nslots
+        for n in xrange(nslots):
+            slot_h, pos = _PAIR.unpack(
+                self._read(table + i * _PAIR.size, _PAIR.size))
+            if not pos:
+                return
+            if slot_h == h:
+                klen, vlen = _PAIR.unpack(self._read(pos, _PAIR.size))
+                if klen == len(key) \
+                   and self._read(pos + _PAIR.size, klen) == key:
+                    yield self._read(pos + _PAIR.size + klen, vlen)
+            i = (i + 1) % nslots
+
+    def get(self, key, default=None):
+        """
+        Return the first value stored under ``key``, or ``default``.
+        """
+        for value in self.getall(key):
+            return value
+        return default
@@ -0,0 +1,107 @@
+"""
+Decide what ``git daemon`` may publish, as its ``--access-hook``.
+
+``git daemon --export-all --access-hook=gitosis-daemon-access`` runs
+this for every request, with the service and the path to the
+repository. It is allowed when ``daemon`` is listed by name among
+those who may read the repository, the same rule that decides where
+``git-daemon-export-ok`` goes, so publishing a repository takes a
+config change and nothing else. Groups don't count, ``@all`` meaning
+every SSH user doesn't publish anything.
+"""
+
+import logging
+import os
+import sys
+
+from gitosis import app
+from gitosis import util
+from gitosis.gitoliteConfig import GitoliteConfigException
+
+log = logging.getLogger('gitosis.daemon_access')
+
+# the user git daemon requests are checked as
+DAEMON_USER = 'daemon'
+
+SERVICES_READONLY = [
+    'upload-pack',
+    'upload-archive',
+    ]
+
+class DaemonAccessError(Exception):
+    """Daemon access error"""
+
+    def __str__(self):
+        return '%s' % self.__doc__
+
+class UnknownServiceError(DaemonAccessError):
+    """Service not available"""
+
+class NotPublishedError(DaemonAccessError):
+    """Repository not published"""
+
+def check(cfg, service, path):
+    """
+    Check that git daemon may run ``service`` on the repository at
+    ``path``.
+
+    Returns the repository name, or raises a ``DaemonAccessError``.
+    """
+    if service not in SERVICES_READONLY:
+        raise UnknownServiceError()
+
+    path = os.path.normpath(path)
+    repositories = os.path.normpath(util.getRepositoryDir(cfg))
+    for prefix in (repositories, os.path.realpath(repositories)):
+        prefix = prefix.rstrip('/') + '/'
+        if path.startswith(prefix):
+            path = path[len(prefix):]
+            break
+    else:
+        raise NotPublishedError()
+
+    if path.endswith('.git'):
+        path = path[:-len('.git')]
+
+    users = None
+    try:
+        reponame = cfg.lookup_repo(path)
+        if reponame:
+            users = cfg.get_repo(reponame, 'R')
+    except GitoliteConfigException:
+        log.exception("When check '%s'" % path)
+    if not users or DAEMON_USER not in users:
+        raise NotPublishedError()
+    return path
+
+class Main(app.App):
+    def parse_args(self):
+        # git daemon runs us as "HOOK SERVICE PATH HOST CANONICAL_HOST
+        # IP PORT" for every request, that doesn't need optparse
+        args = sys.argv[1:]
+        if args and not [arg for arg in args if arg.startswith('-')]:
+            return (None, app.Options(**self.get_defaults()), args)
+        return super(Main, self).parse_args()
+
+    def create_parser(self):
+        parser = super(Main, self).create_parser()
+        parser.set_usage('%prog [OPTS] SERVICE PATH [HOST...]')
+        parser.set_description(
+            'Allow git daemon to publish repositories readable by daemon')
+        return parser
+
+    def handle_args(self, parser, cfg, options, args):
+        if len(args) < 2:
+            if parser is None:
+                parser = self.create_parser()
+            parser.error('Missing arguments SERVICE and PATH.')
+        service, path = args[:2]
+
+        try:
+            reponame = check(cfg, service, path)
+        except DaemonAccessError, e:
+            # git daemon passes this on to the client
+            print e
+            log.info('Denied %s on %r: %s', service, path, e)
+            sys.exit(1)
+        log.debug('Allowed %s on %r', service, reponame)
@@ -0,0 +1,301 @@
+"""
+Read and change git config files, like a repository's ``config``.
+
+Only what props need: looking values up and setting them, leaving
+every other line of the file as it was. Parsed files are cached by
+path, and reused as long as the file's inode, mtime and size stay
+the same, so several props looking at one repository's config read
+it once.
+"""
+
+import logging
+import os
+import re
+import threading
+
+from gitosis import util
+
+log = logging.getLogger('gitosis.gitconfig')
+
+_SECTION_RE = re.compile(
+    r'\s*\[\s*(?P<section>[A-Za-z0-9.-]+)'
+    + r'(?:\s+"(?P<subsection>(?:[^"\\\n]|\\.)*)")?\s*\]')
+_NAME_RE = re.compile(r'\s*(?P<name>[A-Za-z][A-Za-z0-9-]*)\s*(?P<eq>=?)')
+
+_ESCAPES = {
+    'n': '\n',
+    't': '\t',
+    'b': '\b',
+    }
+
+class GitConfigError(Exception):
+    """Cannot parse git config"""
+
+    def __str__(self):
+        return '%s: %s' % (self.__doc__, ': '.join(self.args))
+
+def _split_section(section):
+    # "[foo.bar]" is the old way of saying '[foo "bar"]'
+    section, dot, subsection = section.lower().partition('.')
+    if not dot:
+        subsection = None
+    return (section, subsection)
+
+def _scan_value(lines, i, text):
+    """
+    Parse the value starting with ``text``, in the middle of line
+    ``i``, and maybe continued on the next lines.
+
+    Returns the value and the index of the line after it.
+    """
+    out = []
+    keep = 0
+    quoted = False
+    pos = 0
+    while True:
+        if pos >= len(text) or text[pos] == '\n':
+            if quoted:
+                raise GitConfigError('unterminated quote', lines[i])
+            return (''.join(out[:keep]), i + 1)
+        c = text[pos]
+        pos += 1
+        if c == '\\':
+            if pos >= len(text) or text[pos] == '\n':
+                # continued on the next line
+                i += 1
+                if i >= len(lines):
+                    return (''.join(out[:keep]), i)
+                text = lines[i]
+                pos = 0
+                continue
+            c = _ESCAPES.get(text[pos], text[pos])
+            pos += 1
+            out.append(c)
+            keep = len(out)
+        elif c == '"':
+            quoted = not quoted
+        elif not quoted and c in '#;':
+            pos = len(text)
+        elif not quoted and c.isspace():
+            # as git does, unquoted whitespace reads as spaces
+            if out:
+                out.append(' ')
+        else:
+            out.append(c)
+            keep = len(out)
+
+def _format_value(value):
+    v = value.replace('\\', '\\\\').replace('"', '\\"')
+    v = v.replace('\n', '\\n').replace('\t', '\\t')
+    if v != v.strip() or '#' in v or ';' in v:
+        v = '"%s"' % v
+    return v
+
+class GitConfig(object):
+    """
+    A parsed git config file, as a list of ``lines``.
+    """
+
+    def __init__(self, lines):
+        self.lines = list(lines)
+        self._parse()
+
+    def _parse(self):
+        # (section, subsection) -> the index of the line to add new
+        # variables after, for the last of its sections
+        self._ends = {}
+        # (section, subsection, name) -> [(first, last, prefix,
+        # value)], the lines each assignment takes, the text before it
+        # on the first one and what it sets
+        self._vars = {}
+
+        lines = self.lines
+        key = None
+        i = 0
+        while i < len(lines):
+            line = lines[i]
+            rest = line
+            prefix = ''
+            m = _SECTION_RE.match(line)
+            if m is not None:
+                key = _split_section(m.group('section'))
+                if m.group('subsection') is not None:
+                    subsection = re.sub(r'\\(.)', r'\1',
+                                        m.group('subsection'))
+                    key = (key[0], subsection)
+                self._ends[key] = i
+                prefix = line[:m.end()]
+                rest = line[m.end():]
+
+            stripped = rest.strip()
+            if not stripped or stripped[0] in '#;':
+                i += 1
+                continue
+            if key is None:
+                raise GitConfigError('variable outside a section', line)
+            m = _NAME_RE.match(rest)
+            if m is None:
+                raise GitConfigError('bad line', line)
+
+            first = i
+            if m.group('eq'):
+                value, i = _scan_value(lines, i, rest[m.end():])
+            else:
+                # a plain "name" means true
+                value = True
+                i += 1
+            var = key + (m.group('name').lower(),)
+            self._vars.setdefault(var, []).append(
+                (first, i - 1, prefix, value))
+            self._ends[key] = i - 1
+
+    def copy(self):
+        other = GitConfig.__new__(GitConfig)
+        other.lines = list(self.lines)
+        other._ends = self._ends
+        other._vars = self._vars
+        return other
+
+    def data(self):
+        return ''.join(self.lines)
+
+    def get(self, section, name, subsection=None):
+        """
+        Return the value of ``section.name``, or ``None`` if it is not
+        set. When set more than once, the last one counts, like in git.
+        """
+        assignments = self._vars.get((section.lower(), subsection,
+                                      name.lower()))
+        if not assignments:
+            return None
+        return assignments[-1][3]
+
+    def get_all(self, section, name, subsection=None):
+        """
+        Return every value ``section.name`` is set to, in order.
+        """
+        assignments = self._vars.get((section.lower(), subsection,
+                                      name.lower()), [])
+        return [value for (first, last, prefix, value) in assignments]
+
+    def set(self, section, name, value, subsection=None):
+        """
+        Set ``section.name`` to ``value``, replacing every earlier
+        assignment, and adding the section if it is missing.
+
+        Returns whether anything changed.
+        """
+        key = (section.lower(), subsection)
+        assignments = self._vars.get(key + (name.lower(),), [])
+        if len(assignments) == 1 and assignments[0][3] == value:
+            return False
+
+        line = '\t%s = %s\n' % (name, _format_value(value))
+        lines = self.lines
+        if assignments:
+            # the last one becomes the new value, the rest go away
+            for n, (first, last, prefix, old) in enumerate(
+                    reversed(assignments)):
+                new = []
+                if prefix:
+                    new.append(prefix + '\n')
+                if n == 0:
+                    new.append(line)
+                lines[first:last + 1] = new
+        elif key in self._ends:
+            end = self._ends[key]
+            if not lines[end].endswith('\n'):
+                lines[end] += '\n'
+            lines.insert(end + 1, line)
+        else:
+            if lines and not lines[-1].endswith('\n'):
+                lines[-1] += '\n'
+            if subsection is None:
+                lines.append('[%s]\n' % section)
+            else:
+                lines.append('[%s "%s"]\n' % (
+                    section, subsection.replace('\\', '\\\\').replace(
+                        '"', '\\"')))
+            lines.append(line)
+        self._parse()
+        return True
+
+# path -> ((inode, mtime, size), GitConfig)
+_cache = {}
+_cache_lock = threading.Lock()
+_CACHE_SIZE = 4096
+
+def _stamp(st):
+    return (st.st_ino, st.st_mtime, st.st_size)
+
+def _remember(path, stamp, config):
+    _cache_lock.acquire()
+    try:
+        if len(_cache) >= _CACHE_SIZE:
+            _cache.clear()
+        _cache[path] = (stamp, config)
+    finally:
+        _cache_lock.release()
+
+def read(path):
+    """
+    Return the parsed git config file at ``path``, for the caller to
+    change as it likes.
+    """
+    stamp = _stamp(os.stat(path))
+    cached = _cache.get(path)
+    if cached is not None and cached[0] == stamp:
+        return cached[1].copy()
+
+    f = file(path)
+    try:
+        data = f.read()
+    finally:
+        f.close()
+    config = GitConfig(data.splitlines(True))
+    _remember(path, stamp, config)
+    return config.copy()
+
+def write(path, config):
+    """
+    Write ``config`` to ``path`` unless it has it already.
+
+    Returns whether ``path`` was written.
+    """
+    cached = _cache.get(path)
+    old = None
+    if cached is not None and cached[0] == _stamp(os.stat(path)):
+        old = cached[1].data()
+    written = util.write_file_if_changed(path, config.data(), old=old)
+    _remember(path, _stamp(os.stat(path)), config.copy())
+    return written
+
+class ConfigProp(util.RepoProp):
+    """
+    A prop kept as ``section.key`` in the repository's git config.
+    """
+    section = None
+    key = None
+
+    def _path(self, repobase, name):
+        return os.path.join(repobase, name + '.git', 'config')
+
+    def apply(self, repobase, name, reponame, val):
+        try:
+            return util.RepoProp.apply(self, repobase, name, reponame, val)
+        except GitConfigError, e:
+            # leave a config git cannot make sense of either to a human
+            log.warning('Skipped %s: %s', self._path(repobase, name), e)
+            return None
+
+    def current(self, repobase, name, reponame, val):
+        config = read(self._path(repobase, name))
+        # set once, or set() still has duplicates to clean up
+        return config.get_all(self.section, self.key) == [val]
+
+    def action(self, repobase, name, reponame, val):
+        path = self._path(repobase, name)
+        config = read(path)
+        if not config.set(self.section, self.key, val):
+            return False
+        return write(path, config)
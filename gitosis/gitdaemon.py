@@ -1,7 +1,6 @@
 import errno
 import logging
 import os
-from gitosis.gitoliteConfig import GitoliteConfigException
 
 log = logging.getLogger('gitosis.gitdaemon')
 from gitosis import util
@@ -10,40 +9,47 @@ def export_ok_path(repopath):
     p = os.path.join(repopath, 'git-daemon-export-ok')
     return p
 
+def is_exported(repopath):
+    return os.path.exists(export_ok_path(repopath))
+
 def allow_export(repopath):
+    """
+    Returns whether ``repopath`` was not exported before.
+    """
     p = export_ok_path(repopath)
+    if os.path.exists(p):
+        return False
     file(p, 'a').close()
+    return True
 
 def deny_export(repopath):
+    """
+    Returns whether ``repopath`` was exported before.
+    """
     p = export_ok_path(repopath)
     try:
         os.unlink(p)
     except OSError, e:
         if e.errno == errno.ENOENT:
-            pass
+            return False
         else:
             raise
+    return True
 
-class DaemonProp(util.RepoProp):
+class DaemonProp(util.ReaderProp):
     name = "daemon"
+    reader = "daemon"
 
-    def _get(self, config, reponame):
-        try:
-            users = config.get_repo(reponame, 'R')
-        except GitoliteConfigException:
-            log.exception('Failed to get users that can read(Only) repo \'%s\'' % reponame)
-            return
-
-        if users and 'daemon' in users:
-            return True
-
-        return False
+    def current(self, repobase, name, reponame, enable):
+        # one stat, then only the repositories that flip get written
+        path = os.path.join(repobase, name + '.git')
+        return is_exported(path) == enable
 
     def action(self, repobase, name, reponame, enable):
         path = os.path.join(repobase, name + '.git')
         if enable:
             log.debug('Allow %r', path)
-            allow_export(path)
+            return allow_export(path)
         else:
             log.debug('Deny %r', path)
-            deny_export(path)
+            return deny_export(path)
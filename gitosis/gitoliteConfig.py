@@ -2,8 +2,18 @@
 	A gitolite style config Parser&writer
 """
 
+import os
 import re
+import hashlib
+import cPickle as pickle
 from cStringIO import StringIO
+from collections import OrderedDict
+
+from gitosis.pathmatch import PathMatcher
+from gitosis.group import GroupResolver
+
+# Bump whenever the layout of the pickled state changes
+SNAPSHOT_VERSION = 6
 
 class GitoliteConfigException(Exception):
 	pass
@@ -99,11 +109,27 @@ def _write_section(cfg, name, section):
 
 	for k in section:
 		v = section[k]
-		if type(v) == list:
-			v = _words_to_line(v)
+		if type(v) == frozenset:
+			v = _words_to_line(sorted(v))
 
 		print >>cfg, "\t%s\t = %s" % (k, v)
 
+def _to_acl(words, acls):
+	"""
+	Make the read-only set of ``words``, sharing equal sets and strings
+	across the whole config through ``acls``.
+	"""
+	acl = frozenset(intern(word) for word in words)
+	return acls.setdefault(acl, acl)
+
+def _compile_path_regex(repo, path_regex):
+	try:
+		return re.compile(path_regex)
+	except re.error:
+		raise GitoliteConfigException, \
+		      "Bad regex \'%s\' for repo \'%s\'" \
+		      % (path_regex, repo)
+
 class GitoliteConfig(object):
 	def __init__(self):
 		self.__global = {
@@ -113,11 +139,23 @@ class GitoliteConfig(object):
 				'extProps'	: '',
 			},
 		}
-		self.__groups = {}
-		self.__repos = {}
+		# Keep declaration order, the first path_regex to match wins
+		self.__groups = OrderedDict()
+		self.__repos = OrderedDict()
+
+	def __invalidate(self):
+		"""Drop everything derived from the groups and repos"""
+		for attr in ('_GitoliteConfig__path_regexes',
+			     '_GitoliteConfig__path_matcher',
+			     '_GitoliteConfig__membership'):
+			try:
+				delattr(self, attr)
+			except AttributeError:
+				pass
 
 	def load(self, lines):
 		section_open_pattern = re.compile("(gitosis|repo)(\s|$)")
+		self.__invalidate()
 
 		line_cnt = 0
 		section_open = None
@@ -181,6 +219,80 @@ class GitoliteConfig(object):
 			_type[name] = section
 			section_open = None
 
+		self.tokenize()
+
+	def tokenize(self):
+		"""
+		Split every member list and ACL into words, once, at load.
+
+		After this the getters only read, so a loaded config can be
+		shared between threads. Entries that fail to split are left
+		alone and keep raising from the getters.
+		"""
+		acls = {}
+
+		for grpname in self.__groups:
+			members = self.__groups[grpname]
+			if type(members) == frozenset:
+				continue
+			try:
+				words = _line_to_words(members)
+			except GitoliteConfigException:
+				continue
+			self.__groups[grpname] = _to_acl(words, acls)
+
+		for reponame in self.__repos:
+			section = self.__repos[reponame]
+			for option in ('RW+', 'R'):
+				val = section.get(option)
+				if val is None or type(val) == frozenset:
+					continue
+				try:
+					words = _line_to_words(val)
+				except GitoliteConfigException:
+					continue
+				section[option] = _to_acl(words, acls)
+
+	def dump_snapshot(self, fp, digest):
+		state = {
+			'version'	: SNAPSHOT_VERSION,
+			'digest'	: digest,
+			'global'	: self.__global,
+			'groups'	: self.__groups,
+			'repos'		: self.__repos,
+			'path_regexes'	: self.__list_path_regexes(),
+			'membership'	: self.__membership_index(),
+		}
+		pickle.dump(state, fp, pickle.HIGHEST_PROTOCOL)
+
+	def load_snapshot(self, fp, digest):
+		"""
+		Restore from a snapshot written by dump_snapshot().
+
+		Returns False, leaving the config untouched, if the snapshot
+		is unreadable, of another version or not made from a source
+		with the given digest.
+		"""
+		try:
+			state = pickle.load(fp)
+		except Exception:
+			return False
+
+		if type(state) != dict \
+		   or state.get('version') != SNAPSHOT_VERSION \
+		   or state.get('digest') != digest:
+			return False
+
+		self.__invalidate()
+		self.__global = state['global']
+		self.__groups = state['groups']
+		self.__repos = state['repos']
+
+		self.__path_regexes = state['path_regexes']
+		self.__membership = state['membership']
+
+		return True
+
 	def serialize(self):
 		cfg = StringIO()
 
@@ -191,8 +303,8 @@ class GitoliteConfig(object):
 
 		for name in self.__groups:
 			members = self.__groups[name]
-			if type(members) == list:
-				members = _words_to_line(members)
+			if type(members) == frozenset:
+				members = _words_to_line(sorted(members))
 			print >>cfg, "%s\t = %s" % (name, members)
 		print >>cfg
 
@@ -209,14 +321,18 @@ class GitoliteConfig(object):
 	def set_group_members(self, grpname, members):
 		assert type(members) == list
 		assert grpname.startswith('@')
-		self.__groups[grpname] = members
+		self.__groups[grpname] = _to_acl(members, {})
+		self.__invalidate()
 
 	def set_repo(self, reponame, option, val):
 		if option in ('RW+', 'R'):
 			assert type(val) == list
+			val = _to_acl(val, {})
 
 		section = self.__repos.get(reponame, {})
 		section[option] = val
+		if option == 'path_regex':
+			self.__invalidate()
 
 		self.__repos[reponame] = section
 
@@ -226,9 +342,9 @@ class GitoliteConfig(object):
 		except KeyError:
 			return
 
-		if type(members) != list:
-			members = _line_to_words(members)
-			self.__groups[grpname] = members
+		if type(members) != frozenset:
+			# only left as a string when it could not be split
+			members = _to_acl(_line_to_words(members), {})
 
 		return members
 
@@ -244,38 +360,154 @@ class GitoliteConfig(object):
 			return
 
 		if option in ('RW+', 'R'):
-			if type(val) != list:
-				val = _line_to_words(val)
-				section[option] = val
+			if type(val) != frozenset:
+				val = _to_acl(_line_to_words(val), {})
 
 		return val
 
+	def __list_path_regexes(self):
+		try:
+			return self.__path_regexes
+		except AttributeError:
+			pass
+
+		path_regexes = []
+		for repo in self.__repos:
+			path_regex = self.__repos[repo].get('path_regex', None)
+			if path_regex:
+				path_regexes.append((repo, path_regex))
+		self.__path_regexes = path_regexes
+		return path_regexes
+
 	def lookup_repo(self, path):
 		if self.__repos.has_key(path):
 			return path
 
 		try:
-			repo_patterns = self.__repo_patterns
+			path_matcher = self.__path_matcher
 		except AttributeError:
-			repo_patterns = {}
-			for repo in self.__repos:
-				path_regex = self.__repos[repo].get('path_regex', None)
-				if path_regex:
-					try:
-						r = re.compile(path_regex)
-						repo_patterns[r] = repo
-					except re.error:
-						raise GitoliteConfigException, \
-						      "Bad regex \'%s\' for repo \'%s\'" \
-						      % (path_regex, repo)
-			self.__repo_patterns = repo_patterns
+			path_matcher = PathMatcher(
+				[(_compile_path_regex(repo, path_regex), repo)
+				 for repo, path_regex in self.__list_path_regexes()])
+			self.__path_matcher = path_matcher
+
+		return path_matcher.match(path)
+
+	def __membership_index(self):
+		try:
+			return self.__membership
+		except AttributeError:
+			pass
 
-		for p in repo_patterns:
-			if p.match(path):
-				return repo_patterns[p]
+		# member (user or @group) -> groups listing it directly
+		parents = OrderedDict()
+		for grpname in self.__groups:
+			members = self.__groups[grpname]
+			if type(members) != frozenset:
+				# could not be split, get_group_members() complains
+				continue
+			for member in members:
+				parents.setdefault(member, []).append(grpname)
+
+		resolver = GroupResolver(parents)
+		resolver.find_cycles()
+
+		self.__membership = resolver
+		return resolver
+
+	def get_membership(self, user):
+		"""
+		All groups ``user`` is in, directly or through other groups,
+		nearest first and always ending with ``@all``.
+		"""
+		return self.__membership_index().membership(user)
+
+	def get_group_closure(self, grpname):
+		"""
+		All groups the group ``grpname`` is in, directly or not.
+		"""
+		return self.__membership_index().membership(grpname)
+
+	def changes_since(self, old):
+		"""
+		Compare with config ``old``.
+
+		Returns whether the gitosis section changed, and the sets of
+		groups and of repos that were added, removed or changed. If
+		the order path_regex repos are tried in changed, they are all
+		reported.
+		"""
+		global_changed = self.__global != old.__global
+
+		groups = set()
+		for grpname in set(self.__groups) | set(old.__groups):
+			if self.__groups.get(grpname) != old.__groups.get(grpname):
+				groups.add(grpname)
+
+		repos = set()
+		for reponame in set(self.__repos) | set(old.__repos):
+			if self.__repos.get(reponame) != old.__repos.get(reponame):
+				repos.add(reponame)
+
+		new_order = [repo for repo, path_regex in self.__list_path_regexes()]
+		old_order = [repo for repo, path_regex in old.__list_path_regexes()]
+		if new_order != old_order:
+			repos.update(new_order)
+			repos.update(old_order)
+
+		return (global_changed, groups, repos)
 
 	def groups(self):
 		return [grp for grp in self.__groups]
 
 	def repos(self):
 		return [repo for repo in self.__repos]
+
+def config_digest(data):
+	return hashlib.sha1(data).hexdigest()
+
+def snapshot_path(path):
+	"""
+	Where the snapshot of config file ``path`` lives; symlinks (like
+	``~/.gitosis.conf``) are followed, so it sits next to the real file.
+	"""
+	return os.path.realpath(path) + '.snapshot'
+
+def write_snapshot(path):
+	"""
+	Parse config file ``path`` and store the result in its snapshot.
+	"""
+	f = file(path, 'r')
+	try:
+		data = f.read()
+	finally:
+		f.close()
+
+	cfg = GitoliteConfig()
+	cfg.load(data.splitlines())
+
+	snapshot = snapshot_path(path)
+	tmp = '%s.%d.tmp' % (snapshot, os.getpid())
+	f = file(tmp, 'wb')
+	try:
+		cfg.dump_snapshot(f, config_digest(data))
+	finally:
+		f.close()
+	os.rename(tmp, snapshot)
+
+def read_snapshot(cfg, path, data):
+	"""
+	Load ``cfg`` from the snapshot of config file ``path``, whose
+	current content is ``data``.
+
+	Returns False if there is no usable snapshot for that content.
+	"""
+	try:
+		f = file(snapshot_path(path), 'rb')
+	except (IOError, OSError):
+		return False
+
+	try:
+		return cfg.load_snapshot(f, config_digest(data))
+	finally:
+		f.close()
@@ -27,11 +27,12 @@ To plug this into ``gitweb``, you have two choices.
 
 import os, logging
 import fcntl
-import re
+import heapq
+import threading
 
-from gitosis.gitoliteConfig import GitoliteConfigException
 
 log = logging.getLogger('gitosis.gitweb')
+from gitosis import gitconfig
 from gitosis import util
 
 def _escape_filename(s):
@@ -40,8 +41,50 @@ def _escape_filename(s):
     s = s.replace('"', '\\"')
     return s
 
-_repos_allow = []
-_repos_disallow = []
+class Projects(object):
+    """
+    The repositories GitwebProp found allowed or denied in gitweb, for
+    ProjectList to write out.
+
+    Every run applying props gets one of its own.
+    """
+
+    def __init__(self, listed=None):
+        """
+        @param listed: the projects in projects.list before the run,
+        as ProjectList.listed() returns them, to tell which additions
+        change anything.
+        """
+        self.allow = set()
+        self.disallow = set()
+        self.listed = listed
+        # GitwebProp may be triggered from several threads at once
+        self.__lock = threading.Lock()
+
+    def add(self, repopath, enable):
+        """
+        Returns whether this changes what the list says about
+        ``repopath``; always when nothing is known about it yet.
+        """
+        self.__lock.acquire()
+        try:
+            if repopath in self.allow:
+                was = True
+            elif repopath in self.disallow:
+                was = False
+            elif self.listed is not None:
+                was = repopath in self.listed
+            else:
+                was = None
+            if enable:
+                self.allow.add(repopath)
+                self.disallow.discard(repopath)
+            else:
+                self.disallow.add(repopath)
+                self.allow.discard(repopath)
+        finally:
+            self.__lock.release()
+        return was != enable
 
 class ProjectList(object):
     log = logging.getLogger('gitosis.gitweb.ProjectList')
@@ -77,88 +120,90 @@ class ProjectList(object):
         self.__lock.close()
         self.__lock = None
 
-    def refresh(self):
-        tmp = self.plist_path + '.tmp'
-
+    def listed(self):
+        """
+        Return the set of projects in the list.
+        """
+        data = util.read_file(self.plist_path)
+        if not data:
+            return set()
+        # "PATH OWNER", with the owner optional
+        return set(l.strip().split(' ', 1)[0] for l in data.splitlines()
+                   if l.strip())
+
+    def _write(self, projects, old=None):
+        # one line per project, no trailing newline
+        util.write_file_if_changed(
+            self.plist_path, '\n'.join(projects), old=old)
+
+    def refresh(self, projects):
+        """
+        Make the allowed ``projects`` the whole list.
+        """
         self.lock()
-        f = file(tmp, 'w')
-
         try:
-            if _repos_allow:
-                f.write('\n'.join(_repos_allow))
-        except:
-            f.close()
-            os.remove(tmp)
+            self._write(sorted(projects.allow))
+        finally:
             self.unlock()
 
-            raise
-        else:
-            f.close()
-            os.rename(tmp, self.plist_path)
-            self.unlock()
-    
-    def update(self):
-        tmp = self.plist_path + '.tmp'
+    def update(self, projects):
+        """
+        Add the allowed ``projects`` to the list and drop the denied
+        ones, keeping the rest as they are.
+        """
+        allow = projects.allow
+        disallow = projects.disallow
 
         self.lock()
-        f = file(tmp, 'w')
-
         try:
-            pj_list = file(self.plist_path, 'r')
-        except IOError:
-            pj_list = []
-
-        try:
-            for l in pj_list:
-                _l = l.strip()
-                if _l and _l not in _repos_disallow:
-                    f.write(l)
-                    if _l in _repos_allow:
-                        _repos_allow.remove(_l)
-
-            if _repos_allow:
-                f.write('\n')
-                f.write('\n'.join(_repos_allow))
-        except:
-            f.close()
-            os.remove(tmp)
-            self.unlock()
-
-            raise
-        else:
-            f.close()
-            os.rename(tmp, self.plist_path)
+            old = util.read_file(self.plist_path)
+            kept = []
+            in_order = True
+            if old:
+                for l in old.splitlines():
+                    # "PATH OWNER", with the owner optional
+                    l = l.strip()
+                    if not l:
+                        continue
+                    path = l.split(' ', 1)[0]
+                    if path in disallow or path in allow:
+                        continue
+                    if kept:
+                        if l == kept[-1]:
+                            continue
+                        if l < kept[-1]:
+                            in_order = False
+                    kept.append(l)
+            if not in_order:
+                # not written by us, sort it this once
+                kept = sorted(set(kept))
+            # both sorted, so one pass merges them
+            self._write(heapq.merge(kept, sorted(allow)), old=old)
+        finally:
             self.unlock()
 
 
-class GitwebProp(util.RepoProp):
+class GitwebProp(util.ReaderProp):
     name = "gitweb"
-
-    def __init__(self):
-        global _repos_allow, _repos_disallow
-        _repos_allow = []
-        _repos_disallow = []
-
-    def _get(self, config, reponame):
-        try:
-            users = config.get_repo(reponame, 'R')
-        except GitoliteConfigException:
-            log.exception('Failed to get users that can read(Only) repo \'%s\'' % reponame)
-            return
-
-        if users and 'gitweb' in users:
-            return True
-
-        return False
+    reader = "gitweb"
+
+    def __init__(self, projects=None):
+        """
+        @param projects: the Projects to report to, a new one by
+        default.
+        """
+        super(GitwebProp, self).__init__()
+        if projects is None:
+            projects = Projects()
+        self.projects = projects
 
     def action(self, repobase, name, reponame, enable):
         repopath = name + '.git'
         if enable:
             log.debug('Allow %r', repopath)
-            _repos_allow.append(repopath)
         else:
-            _repos_disallow.append(repopath)
             log.debug('Deny %r', repopath)
+        return self.projects.add(repopath, enable)
 
 class DescriptionProp(util.RepoProp):
     name = 'description'
@@ -169,53 +214,18 @@ class DescriptionProp(util.RepoProp):
             name + '.git',
             'description',
             )
-        tmp = '%s.%d.tmp' % (path, os.getpid())
-        f = file(tmp, 'w')
-        try:
-            print >>f, description
-        finally:
-            f.close()
-        os.rename(tmp, path)
-
-class OwnerProp(util.RepoProp):
+        return util.write_file_if_changed(path, description + '\n')
+
+def set_owner(gitcfg, owner):
+    """
+    Return the lines of git config ``gitcfg`` with ``gitweb.owner``
+    set to ``owner``.
+    """
+    config = gitconfig.GitConfig(gitcfg)
+    config.set('gitweb', 'owner', owner)
+    return config.lines
+
+class OwnerProp(gitconfig.ConfigProp):
     name = 'owner'
-
-    def action(self, repobase, name, reponame, owner):
-        path = os.path.join(
-            repobase,
-            name + '.git',
-            'config',
-            )
-
-        _r_sec = re.compile('\s*\[[^\]]*\]')
-        _r_owner = re.compile('\s*owner\s?=')
-
-        gitcfg = open(path, 'r')
-
-        tmp = '%s.%d.tmp' % (path, os.getpid())
-        f = file(tmp, 'w')
-
-        try:
-            for l in gitcfg:
-                f.write(l)
-                if l.strip() == '[gitweb]':
-                    break
-            else:
-                f.write('[gitweb]\n')
-
-            for l in gitcfg:
-                if _r_sec.match(l):
-                    f.write('\towner = %s\n' % owner)
-                    f.write(l)
-                    break
-                elif _r_owner.match(l):
-                    f.write('\towner = %s\n' % owner)
-                    break
-            else:
-                f.write('\towner = %s\n' % owner)
-
-            for l in gitcfg:
-                f.write(l)
-        finally:
-            f.close()
-        os.rename(tmp, path)
+    section = 'gitweb'
+    key = 'owner'
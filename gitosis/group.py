@@ -1,48 +1,229 @@
 import logging
-from gitosis.gitoliteConfig import GitoliteConfigException
 
-def _getMembership(config, user, seen):
-    log = logging.getLogger('gitosis.group.getMembership')
+def _walk_chain(chain):
+    while chain is not None:
+        segment, chain = chain
+        for g in segment:
+            yield g
 
-    for group in config.groups():
+class GroupResolver(object):
+    """
+    Expand which groups a user or group is in, directly or not.
+
+    Expansions are built a strongly connected component at a time, in
+    the reverse topological order Tarjan's algorithm finds them in, so
+    each one is put together from the memoized expansions of the
+    groups above it, and every group is walked once however many names
+    reach it. A group listed in a single other group shares that one's
+    expansion instead of copying it, so a long chain of nested groups
+    costs as much as its length. Cycles (``@a = @b``, ``@b = @a``)
+    therefore can't recurse forever; ``find_cycles()`` reports them
+    once, with the path that closes each.
+    """
+
+    log = logging.getLogger('gitosis.group.GroupResolver')
+
+    def __init__(self, parents):
+        """
+        @param parents: member (user or @group) -> groups listing it
+        directly, in declaration order.
+        """
+        self.parents = parents
+        self.closures = {}
+        self.memberships = {}
+        self.cycles = None
+        # name -> its expansion as a chain of (tuple, next chain)
+        # segments, shared with those of the groups above it
+        self._chains = {}
+
+    def __getstate__(self):
+        # only what it is made from: the caches change shape, and the
+        # chains nest as deep as the groups do, too deep to pickle
+        return {'parents': self.parents, 'cycles': self.cycles}
+
+    def __setstate__(self, state):
+        self.__init__(state['parents'])
+        self.cycles = state['cycles']
+
+    def resolve(self, name):
+        """
+        Groups ``name`` is listed in, directly or not, nearest first,
+        not including itself.
+        """
+        try:
+            return self.closures[name]
+        except KeyError:
+            pass
+
+        # several threads may resolve at once: chains are only ever
+        # added, each after those of everything above it, so the
+        # worst that happens is building one twice
+        chains = self._chains
+        if name not in chains:
+            for component in self._components(name, {}, chains):
+                members = frozenset(component)
+                for node in component:
+                    chains[node] = self._chain(node, members)
+
+        found = tuple(_walk_chain(chains[name]))
+        self.closures[name] = found
+        return found
+
+    def _chain(self, name, component):
+        parents = self.parents.get(name, ())
+        chains = self._chains
+        if len(parents) == 1 and parents[0] not in component:
+            parent = parents[0]
+            return ((parent,), chains[parent])
+
+        # walk the groups in ``component``, taking the expansion of
+        # those outside it, all resolved already, as it is
+        found = []
+        seen = set([name])
+        work = [iter(parents)]
+        while work:
+            for parent in work[-1]:
+                if parent in seen:
+                    continue
+                seen.add(parent)
+                found.append(parent)
+                if parent in component:
+                    work.append(iter(self.parents.get(parent, ())))
+                    break
+                for g in _walk_chain(chains[parent]):
+                    if g not in seen:
+                        seen.add(g)
+                        found.append(g)
+            else:
+                work.pop()
+        if not found:
+            return None
+        return (tuple(found), None)
+
+    def membership(self, name):
+        """
+        Like resolve(), but with the implicit ``@all``: everybody, user
+        or group, is in the groups listing ``@all``, and users end with
+        ``@all`` itself.
+        """
         try:
-            members = config.get_group_members(group)
-        except GitoliteConfigException:
-            log.exception("When list members of '%s':" % group)
-            members = None
-
-        if members:
-            # @all is the only group where membership needs to be
-            # bootstrapped like this, anything else gets started from the
-            # username itself
-            if (user in members
-                or '@all' in members):
-                log.debug('found %(user)r in %(group)r' % dict(
-                    user=user,
-                    group=group,
-                    ))
-                seen.add(group)
-                yield group
-
-                for member_of in _getMembership(
-                    config, group, seen,
-                    ):
-                    yield member_of
+            return self.memberships[name]
+        except KeyError:
+            pass
+
+        found = []
+        seen = set([name])
+        for g in self.resolve(name) + self.resolve('@all'):
+            if g not in seen:
+                seen.add(g)
+                found.append(g)
+        if not name.startswith('@'):
+            found.append('@all')
+
+        found = tuple(found)
+        self.memberships[name] = found
+        return found
+
+    def find_cycles(self):
+        """
+        Return the membership cycles as paths, like ``['@a', '@b',
+        '@a']``, warning about each the first time they are looked for.
+        """
+        if self.cycles is not None:
+            return self.cycles
+
+        self.cycles = []
+        parents = self.parents
+        index = {}
+        for start in parents:
+            if start in index:
+                continue
+            for component in self._components(start, index, ()):
+                first = component[0]
+                if len(component) > 1 \
+                   or first in parents.get(first, ()):
+                    self._report_cycle(component)
+        return self.cycles
+
+    def _components(self, start, index, done):
+        """
+        Generate the strongly connected components reachable from
+        ``start``, each after all those it reaches, as lists starting
+        with the first member found. Members of ``done`` are left out,
+        and not looked past.
+        """
+        # Tarjan's algorithm, iterative so deep hierarchies don't hit
+        # the recursion limit
+        parents = self.parents
+        lowlink = {start: len(index)}
+        index[start] = lowlink[start]
+        stack = [start]
+        on_stack = set(stack)
+        work = [(start, iter(parents.get(start, ())))]
+
+        while work:
+            node, it = work[-1]
+            for parent in it:
+                if parent in done:
+                    continue
+                if parent not in index:
+                    index[parent] = lowlink[parent] = len(index)
+                    stack.append(parent)
+                    on_stack.add(parent)
+                    work.append((parent, iter(parents.get(parent, ()))))
+                    break
+                if parent in on_stack:
+                    lowlink[node] = min(lowlink[node], index[parent])
+            else:
+                work.pop()
+                if work:
+                    up = work[-1][0]
+                    lowlink[up] = min(lowlink[up], lowlink[node])
+                if lowlink[node] == index[node]:
+                    component = []
+                    while True:
+                        member = stack.pop()
+                        on_stack.discard(member)
+                        component.append(member)
+                        if member == node:
+                            break
+                    component.reverse()
+                    yield component
 
+    def _report_cycle(self, component):
+        # shortest way from the first group back to itself
+        first = component[0]
+        members = set(component)
+        came_from = {}
+        queue = [first]
+        for node in queue:
+            if first in came_from:
+                break
+            for parent in self.parents.get(node, ()):
+                if parent in members and parent not in came_from:
+                    came_from[parent] = node
+                    queue.append(parent)
+
+        path = [first]
+        node = came_from[first]
+        while node != first:
+            path.append(node)
+            node = came_from[node]
+        path.append(first)
+        path.reverse()
+
+        self.cycles.append(path)
+        self.log.warning('Group membership cycle: %s', ' -> '.join(path))
 
 def getMembership(config, user):
     """
     Generate groups ``user`` is member of, according to ``config``
 
-    :type config: RawConfigParser
+    Answered from the membership index ``config`` builds once per load,
+    nearest groups first and ``@all`` last.
+
+    :type config: GitoliteConfig
     :type user: str
-    :param _seen: internal use only
     """
-
-    seen = set()
-    for member_of in _getMembership(config, user, seen):
+    for member_of in config.get_membership(user):
         yield member_of
-
-    # everyone is always a member of group "all"
-    yield '@all'
-
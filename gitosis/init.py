@@ -7,7 +7,6 @@ import logging
 import os
 import sys
 
-from pkg_resources import resource_filename
 from cStringIO import StringIO
 from gitosis.gitoliteConfig import GitoliteConfig
 
@@ -16,6 +15,7 @@ from gitosis import run_hook
 from gitosis import ssh
 from gitosis import util
 from gitosis import app
+from gitosis import templates
 
 log = logging.getLogger('gitosis.init')
 
@@ -65,6 +65,11 @@ def symlink_config(git_dir):
         )
     os.rename(tmp, dst)
 
+def template_dir(name):
+    # templates are installed as a real directory, see setup.py; no
+    # need for pkg_resources to find them
+    return os.path.join(os.path.dirname(templates.__file__), name)
+
 def init_admin_repository(
     git_dir,
     pubkey,
@@ -72,7 +77,7 @@ def init_admin_repository(
     ):
     repository.init(
         path=git_dir,
-        template=resource_filename('gitosis.templates', 'admin')
+        template=template_dir('admin')
         )
     repository.init(
         path=git_dir,
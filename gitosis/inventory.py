@@ -0,0 +1,159 @@
+"""
+Keep an inventory of the repositories on disk.
+
+The inventory lists, one per line and sorted, every repository under
+the repositories dir, the config repo it belongs to and the
+fingerprint of the prop values last applied to it, separated by tabs.
+It lives in the generated files dir, is updated by the post-update
+hook and by ``gitosis-serve`` creating repositories, and saves walking
+the repositories dir to find them again.
+
+Repositories made or removed by hand are only noticed by
+``gitosis-rescan`` (or a full run of the post-update hook), which
+reconciles the inventory with the disk.
+"""
+
+import fcntl
+import logging
+import os
+
+from gitosis import app
+from gitosis import gitweb
+from gitosis import util
+from gitosis.gitoliteConfig import GitoliteConfigException
+
+log = logging.getLogger('gitosis.inventory')
+
+class Inventory(object):
+    def __init__(self, path):
+        self.path = path
+
+    def read(self):
+        """
+        Return a dict of repository name to (config repo, prop
+        fingerprint), or ``None`` if there is no inventory yet.
+        """
+        data = util.read_file(self.path)
+        if data is None:
+            return None
+        entries = {}
+        for line in data.splitlines():
+            try:
+                name, reponame, fingerprint = line.split('\t')
+            except ValueError:
+                log.warning('Ignored bad inventory line: %r', line)
+                continue
+            entries[name] = (reponame, fingerprint)
+        return entries
+
+    def names(self):
+        """
+        Return the sorted repository names, or ``None`` if there is no
+        inventory yet.
+        """
+        entries = self.read()
+        if entries is None:
+            return None
+        return sorted(entries)
+
+    def _write(self, entries):
+        lines = []
+        for name in sorted(entries):
+            if '\t' in name or '\n' in name:
+                log.warning('Cannot keep %r in the inventory', name)
+                continue
+            reponame, fingerprint = entries[name]
+            lines.append('%s\t%s\t%s\n' % (name, reponame, fingerprint))
+        util.write_file_if_changed(self.path, ''.join(lines))
+
+    def _locked(self, fn, *args):
+        lock = file(self.path + '.lock', 'w')
+        try:
+            fcntl.flock(lock.fileno(), fcntl.LOCK_EX)
+            return fn(*args)
+        finally:
+            lock.close()
+
+    def update(self, entries):
+        """
+        Add or replace ``entries``, a dict like read() returns.
+
+        Does nothing if there is no inventory yet: only a scan of the
+        whole disk can start one.
+        """
+        def _update():
+            current = self.read()
+            if current is None:
+                return
+            current.update(entries)
+            self._write(current)
+        self._locked(_update)
+
+    def replace(self, entries):
+        """
+        Make ``entries`` the whole inventory.
+        """
+        self._locked(self._write, entries)
+
+def rescan(cfg, props):
+    """
+    Reconcile the inventory with the repositories on disk, applying
+    the props of those that are new to it or whose config changed
+    since.
+
+    Returns the number of repositories visited.
+    """
+    inventory = Inventory(util.getInventoryPath(config=cfg))
+    known = inventory.read() or {}
+    repodir = util.RepositoryDir(cfg, props)
+
+    found = {}
+    to_visit = []
+    for name in repodir.names():
+        entry = known.get(name)
+        if entry is None or not entry[0]:
+            to_visit.append(name)
+            continue
+        try:
+            reponame = cfg.lookup_repo(name)
+        except GitoliteConfigException:
+            # let visit_one() complain
+            to_visit.append(name)
+            continue
+        fingerprint = util.prop_fingerprint(
+            [(p.name, util.prop_value(p, cfg, reponame)) for p in props])
+        if (reponame, fingerprint) != entry:
+            to_visit.append(name)
+        else:
+            found[name] = entry
+
+    repodir.visit(to_visit)
+    found.update(repodir.visited)
+    for name in sorted(set(known) - set(found)):
+        log.info('Repository %r is gone', name)
+    inventory.replace(found)
+    return len(to_visit)
+
+class Main(app.App):
+    def create_parser(self):
+        parser = super(Main, self).create_parser()
+        parser.set_usage('%prog [OPTS]')
+        parser.set_description(
+            'Bring the repository inventory in line with the disk')
+        return parser
+
+    def handle_args(self, parser, cfg, options, args):
+        if args:
+            parser.error('Unexpected arguments.')
+
+        # run_hook uses this module
+        from gitosis import run_hook
+
+        os.umask(0022)
+        generated = util.getGeneratedFilesDir(config=cfg)
+        plist = gitweb.ProjectList(os.path.join(generated, 'projects.list'))
+        projects = gitweb.Projects(plist.listed())
+        visited = rescan(cfg, run_hook.load_props(cfg, projects))
+        if visited:
+            plist.update(projects)
+        log.info('Visited %d repositories', visited)
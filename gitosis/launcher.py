@@ -0,0 +1,256 @@
+"""
+Write ``gitosis-*`` launchers that don't go through ``pkg_resources``.
+
+The wrappers setuptools generates for the console_scripts look their
+entry point up through ``pkg_resources`` on every run, which costs more
+than the rest of an access check. These launchers import ``Main`` from
+its module and call ``Main.run()`` like the wrappers do, with the
+package compiled up front so nothing is compiled at run time either.
+
+With ``--zipapp FILE`` the commands run per connection or per push
+share one executable archive holding just the bytecode, and the
+launchers are symlinks to it; the archive picks the command from the
+name it was run as. ``gitosis-init`` stays a plain launcher, as it
+needs the templates as a real directory for ``git init``.
+
+With ``--no-site`` the interpreter is run with ``-S`` and skips the
+``site`` module. gitosis itself needs nothing from site-packages, but
+extension props that do must not be combined with it.
+
+Run as ``python -m gitosis.launcher --bindir DIR`` after every install
+or upgrade of gitosis.
+"""
+
+import compileall
+import errno
+import logging
+import os
+import sys
+import zipfile
+
+log = logging.getLogger('gitosis.launcher')
+
+# as in setup.py
+ENTRY_POINTS = [
+    ('gitosis-serve', 'gitosis.serve'),
+    ('gitosis-run-hook', 'gitosis.run_hook'),
+    ('gitosis-init', 'gitosis.init'),
+    ('gitosis-accessd', 'gitosis.accessd'),
+    ('gitosis-authorized-keys', 'gitosis.authorized_keys'),
+    ('gitosis-rescan', 'gitosis.inventory'),
+    ('gitosis-daemon-access', 'gitosis.daemon_access'),
+    ]
+
+# gitosis-init needs gitosis/templates on disk
+ZIPAPP_COMMANDS = [
+    'gitosis-serve',
+    'gitosis-run-hook',
+    'gitosis-accessd',
+    'gitosis-authorized-keys',
+    'gitosis-rescan',
+    'gitosis-daemon-access',
+    ]
+
+LAUNCHER = """\
+#!%(python)s%(flags)s
+# %(name)s, written by gitosis.launcher
+import sys
+sys.path.insert(0, %(path)r)
+from %(module)s import Main
+sys.exit(Main.run())
+"""
+
+ZIPAPP_MAIN = """\
+# written by gitosis.launcher
+import os
+import sys
+
+COMMANDS = %(commands)r
+
+name = os.path.basename(sys.argv[0])
+try:
+    module = COMMANDS[name]
+except KeyError:
+    sys.exit('%%s: run as one of %%s' %% (
+        name, ', '.join(sorted(COMMANDS))))
+Main = __import__(module, {}, {}, ['Main']).Main
+sys.exit(Main.run())
+"""
+
+def _package_dir():
+    return os.path.dirname(os.path.abspath(__file__))
+
+def _flags(no_site):
+    if no_site:
+        return ' -S'
+    return ''
+
+def _replace(path, tmp):
+    try:
+        os.unlink(path)
+    except OSError, e:
+        if e.errno != errno.ENOENT:
+            raise
+    os.rename(tmp, path)
+
+def _write_executable(path, data):
+    tmp = '%s.%d.tmp' % (path, os.getpid())
+    f = file(tmp, 'wb')
+    try:
+        f.write(data)
+    finally:
+        f.close()
+    os.chmod(tmp, 0755)
+    os.rename(tmp, path)
+
+def _symlink(target, path):
+    tmp = '%s.%d.tmp' % (path, os.getpid())
+    try:
+        os.unlink(tmp)
+    except OSError, e:
+        if e.errno != errno.ENOENT:
+            raise
+    os.symlink(target, tmp)
+    _replace(path, tmp)
+
+# compileall only takes a regexp-like object to skip files by
+class _SkipTests(object):
+    def search(self, path):
+        test_dir = os.path.join(_package_dir(), 'test')
+        return path == test_dir or path.startswith(test_dir + os.sep)
+
+def compile_package():
+    """
+    Compile the gitosis package to bytecode, so no launcher has to.
+
+    Returns false if some module could not be compiled or written.
+    """
+    return compileall.compile_dir(
+        _package_dir(),
+        rx=_SkipTests(),
+        quiet=1,
+        )
+
+def write_launcher(path, module, python=None, no_site=False):
+    """
+    Write a script at ``path`` running ``module``'s ``Main.run()``.
+    """
+    if python is None:
+        python = sys.executable
+    _write_executable(path, LAUNCHER % dict(
+        python=python,
+        flags=_flags(no_site),
+        name=os.path.basename(path),
+        path=os.path.dirname(_package_dir()),
+        module=module,
+        ))
+
+def write_zipapp(path, python=None, no_site=False):
+    """
+    Write an executable archive with the compiled gitosis package,
+    running the command in ``ZIPAPP_COMMANDS`` it is invoked as.
+    """
+    if python is None:
+        python = sys.executable
+    commands = dict(
+        (name, module)
+        for (name, module) in ENTRY_POINTS
+        if name in ZIPAPP_COMMANDS
+        )
+    if sys.flags.optimize:
+        suffix = '.pyo'
+    else:
+        suffix = '.pyc'
+
+    package = _package_dir()
+    tmp = '%s.%d.tmp' % (path, os.getpid())
+    f = file(tmp, 'wb')
+    try:
+        f.write('#!%s%s\n' % (python, _flags(no_site)))
+        archive = zipfile.ZipFile(f, 'w', zipfile.ZIP_DEFLATED)
+        archive.writestr(
+            '__main__.py', ZIPAPP_MAIN % dict(commands=commands))
+        for dirpath, dirnames, filenames in os.walk(package):
+            dirnames[:] = sorted(
+                d for d in dirnames
+                if d != 'test'
+                and os.path.exists(os.path.join(dirpath, d, '__init__.py')))
+            for filename in sorted(filenames):
+                if not filename.endswith('.py'):
+                    continue
+                compiled = os.path.join(dirpath, filename[:-3] + suffix)
+                if not os.path.exists(compiled):
+                    raise RuntimeError(
+                        'Not compiled: %s' % os.path.join(dirpath, filename))
+                name = os.path.join(
+                    'gitosis',
+                    os.path.relpath(compiled, package),
+                    )
+                archive.write(compiled, name)
+        archive.close()
+    finally:
+        f.close()
+    os.chmod(tmp, 0755)
+    _replace(path, tmp)
+
+def install(bindir, python=None, zipapp=None, no_site=False):
+    """
+    Write launchers for all of ``ENTRY_POINTS`` into ``bindir``,
+    replacing the setuptools wrappers if they are there.
+    """
+    if not compile_package():
+        log.warning('Could not compile all of %s', _package_dir())
+
+    if zipapp is not None:
+        zipapp = os.path.abspath(zipapp)
+        write_zipapp(zipapp, python=python, no_site=no_site)
+        log.info('Wrote %s', zipapp)
+
+    for name, module in ENTRY_POINTS:
+        path = os.path.join(bindir, name)
+        if zipapp is not None and name in ZIPAPP_COMMANDS:
+            _symlink(zipapp, path)
+        else:
+            write_launcher(path, module, python=python, no_site=no_site)
+        log.info('Wrote %s', path)
+
+def main(args=None):
+    import optparse
+    logging.basicConfig(level=logging.INFO)
+    parser = optparse.OptionParser()
+    parser.set_usage('%prog --bindir DIR [OPTS]')
+    parser.set_description(
+        'Write gitosis launchers that skip pkg_resources')
+    parser.add_option('--bindir',
+                      metavar='DIR',
+                      help='write the launchers into DIR',
+                      )
+    parser.add_option('--python',
+                      metavar='FILE',
+                      default=sys.executable,
+                      help='run the launchers with interpreter FILE',
+                      )
+    parser.add_option('--zipapp',
+                      metavar='FILE',
+                      help='put the hot commands in archive FILE',
+                      )
+    parser.add_option('--no-site',
+                      action='store_true',
+                      default=False,
+                      help='run the interpreter with -S',
+                      )
+    (options, args) = parser.parse_args(args)
+    if args:
+        parser.error('not expecting arguments')
+    if options.bindir is None:
+        parser.error('Missing option --bindir')
+
+    install(
+        bindir=options.bindir,
+        python=options.python,
+        zipapp=options.zipapp,
+        no_site=options.no_site,
+        )
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,137 @@
+"""
+Match a repository path against the ``path_regex`` of many repos at once.
+"""
+
+import re
+import sre_constants
+import sre_parse
+
+# Python's re refuses patterns with 100 groups or more
+_MAX_GROUPS = 99
+
+# Constructs that refer to group numbers or change flags for the whole
+# pattern, they can't be pasted into an alternation with others
+_UNFOLDABLE_RE = re.compile(r'\\[1-9]|\(\?P=|\(\?\(|\(\?[iLmsux]')
+
+def _foldable(r):
+    return not (r.groupindex or _UNFOLDABLE_RE.search(r.pattern))
+
+def literal_prefix(r):
+    """
+    Return the literal text every path matching ``r`` starts with.
+    """
+    if r.flags & re.IGNORECASE:
+        return ''
+
+    try:
+        parsed = sre_parse.parse(r.pattern, r.flags)
+    except (sre_constants.error, RuntimeError):
+        return ''
+
+    prefix = []
+    for op, av in parsed:
+        if (op == sre_constants.AT and not prefix
+            and av in (sre_constants.AT_BEGINNING,
+                       sre_constants.AT_BEGINNING_STRING)):
+            continue
+        # quantified literals show up as repeats, so they end it too
+        if op != sre_constants.LITERAL or av >= 128:
+            break
+        prefix.append(chr(av))
+    return ''.join(prefix)
+
+class PathMatcher(object):
+    """
+    Find the first repo, in declaration order, whose pattern matches.
+
+    Patterns starting with literal text are indexed by it in a trie, so
+    only those whose prefix the path starts with get tried. The rest
+    are folded, in runs, into one alternation of named groups each.
+    Either way a lookup costs a handful of ``match()`` calls instead of
+    one per pattern.
+    """
+
+    def __init__(self, patterns):
+        """
+        @param patterns: (compiled regex, repo) pairs, in order.
+        """
+        self.patterns = []
+        # trie node: (children by character, indices of patterns
+        # whose literal prefix ends here)
+        self.trie = ({}, [])
+        self.steps = []
+
+        run = []
+        ngroups = 0
+        for index, (r, repo) in enumerate(patterns):
+            self.patterns.append((r, repo))
+
+            prefix = literal_prefix(r)
+            if prefix:
+                node = self.trie
+                for c in prefix:
+                    node = node[0].setdefault(c, ({}, []))
+                node[1].append(index)
+                continue
+
+            if not _foldable(r):
+                self._fold(run)
+                run, ngroups = [], 0
+                self.steps.append((r, (index, repo)))
+                continue
+
+            if ngroups + r.groups + 1 > _MAX_GROUPS:
+                self._fold(run)
+                run, ngroups = [], 0
+            run.append((index, r, repo))
+            ngroups += r.groups + 1
+        self._fold(run)
+
+    def _fold(self, run):
+        if not run:
+            return
+        if len(run) == 1:
+            index, r, repo = run[0]
+            self.steps.append((r, (index, repo)))
+            return
+
+        alternatives = []
+        repos = {}
+        for index, r, repo in run:
+            name = '_p%d' % index
+            alternatives.append('(?P<%s>%s)' % (name, r.pattern))
+            repos[name] = (index, repo)
+        self.steps.append((re.compile('|'.join(alternatives)), repos))
+
+    def _match_unprefixed(self, path):
+        for r, hit in self.steps:
+            m = r.match(path)
+            if m is None:
+                continue
+            if type(hit) == dict:
+                # the alternative's own group closes last
+                return hit[m.lastgroup]
+            return hit
+        return (None, None)
+
+    def candidates(self, path):
+        """Indices of the prefixed patterns worth trying on ``path``"""
+        found = []
+        node = self.trie
+        for c in path:
+            node = node[0].get(c)
+            if node is None:
+                break
+            found.extend(node[1])
+        found.sort()
+        return found
+
+    def match(self, path):
+        first, repo = self._match_unprefixed(path)
+        for index in self.candidates(path):
+            if first is not None and index > first:
+                break
+            r, candidate = self.patterns[index]
+            if r.match(path):
+                return candidate
+        return repo
@@ -1,11 +1,15 @@
 import errno
+import logging
 import os
 import re
+import shutil
 import subprocess
 import sys
 
 from gitosis import util
 
+log = logging.getLogger('gitosis.repository')
+
 class GitError(Exception):
     """git failed"""
 
@@ -15,10 +19,105 @@ class GitError(Exception):
 class GitInitError(Exception):
     """git init failed"""
 
+# in a skeleton repository, what git it was made with
+SKELETON_STAMP = 'gitosis-git-stamp'
+
+def _git_stamp(_git):
+    """
+    Identify the git executable that would run as ``_git``, without
+    running it, or return ``None`` if it cannot be found.
+    """
+    if os.sep in _git:
+        candidates = [_git]
+    else:
+        candidates = [
+            os.path.join(d, _git)
+            for d in os.environ.get('PATH', os.defpath).split(os.pathsep)
+            ]
+    for path in candidates:
+        if os.access(path, os.X_OK):
+            path = os.path.realpath(path)
+            st = os.stat(path)
+            return '%s %d %d %d\n' % (
+                path, st.st_ino, st.st_mtime, st.st_size)
+    return None
+
+def _git_init(path, template, _git):
+    args = [
+        _git,
+        '--git-dir=.',
+        'init',
+        ]
+    if template is not None:
+        args.append('--template=%s' % template)
+    returncode = subprocess.call(
+        args=args,
+        cwd=path,
+        stdout=sys.stderr,
+        close_fds=True,
+        )
+    if returncode != 0:
+        raise GitInitError('exit status %d' % returncode)
+
+def _copy_tree(src, dst):
+    os.mkdir(dst, 0750)
+    for name in os.listdir(src):
+        if name == SKELETON_STAMP:
+            continue
+        s = os.path.join(src, name)
+        d = os.path.join(dst, name)
+        if os.path.isdir(s):
+            _copy_tree(s, d)
+            os.chmod(d, os.stat(s).st_mode & 07777)
+        else:
+            shutil.copyfile(s, d)
+            os.chmod(d, os.stat(s).st_mode & 07777)
+
+def prepare_skeleton(skeleton, _git=None):
+    """
+    Make sure ``skeleton`` holds a fresh repository made by the
+    installed git, to copy new repositories from.
+
+    Returns whether it does.
+    """
+    if _git is None:
+        _git = 'git'
+    stamp = _git_stamp(_git)
+    if stamp is None:
+        return False
+    if util.read_file(os.path.join(skeleton, SKELETON_STAMP)) == stamp:
+        return True
+
+    tmp = '%s.%d.tmp' % (skeleton, os.getpid())
+    stale = '%s.%d.old' % (skeleton, os.getpid())
+    shutil.rmtree(tmp, True)
+    util.mkdir(tmp, 0750)
+    try:
+        _git_init(tmp, None, _git)
+        util.write_file_if_changed(os.path.join(tmp, SKELETON_STAMP), stamp)
+        # move the stale one aside rather than deleting it in place,
+        # so the skeleton is gone only between two renames
+        try:
+            os.rename(skeleton, stale)
+        except OSError, e:
+            if e.errno != errno.ENOENT:
+                raise
+        try:
+            os.rename(tmp, skeleton)
+        except OSError, e:
+            # someone was faster
+            if e.errno not in (errno.EEXIST, errno.ENOTEMPTY):
+                raise
+    finally:
+        shutil.rmtree(tmp, True)
+        shutil.rmtree(stale, True)
+    return util.read_file(os.path.join(skeleton, SKELETON_STAMP)) == stamp
+
 def init(
     path,
     template=None,
     _git=None,
+    skeleton=None,
     ):
     """
     Create a git repository at C{path} (if missing).
@@ -32,26 +131,45 @@ def init(
     @param template: Template directory, to pass to C{git init}.
 
     @type template: str
+
+    @param skeleton: Where to keep a repository made by C{git init}
+    once, to copy instead of running git for every new repository.
+    Not used with C{template}, or if C{path} exists already.
+
+    @type skeleton: str
     """
     if _git is None:
         _git = 'git'
 
+    if skeleton is not None and template is None \
+       and not os.path.exists(path):
+        try:
+            fresh = prepare_skeleton(skeleton, _git=_git)
+        except (GitInitError, IOError, OSError), e:
+            log.warning('Cannot prepare skeleton repository: %s', e)
+            fresh = False
+        if fresh:
+            # a repository appears complete or not at all
+            tmp = '%s.%d.tmp' % (path, os.getpid())
+            shutil.rmtree(tmp, True)
+            try:
+                try:
+                    _copy_tree(skeleton, tmp)
+                    os.chmod(tmp, 0750)
+                    os.rename(tmp, path)
+                    return
+                except (IOError, OSError), e:
+                    if e.errno in (errno.EEXIST, errno.ENOTEMPTY) \
+                       and os.path.isdir(path):
+                        # someone else created it meanwhile
+                        return
+                    # like the skeleton being rebuilt under us
+                    log.warning('Cannot copy skeleton repository: %s', e)
+            finally:
+                shutil.rmtree(tmp, True)
+
     util.mkdir(path, 0750)
-    args = [
-        _git,
-        '--git-dir=.',
-        'init',
-        ]
-    if template is not None:
-        args.append('--template=%s' % template)
-    returncode = subprocess.call(
-        args=args,
-        cwd=path,
-        stdout=sys.stderr,
-        close_fds=True,
-        )
-    if returncode != 0:
-        raise GitInitError('exit status %d' % returncode)
+    _git_init(path, template, _git)
 
 
 class GitFastImportError(GitError):
@@ -172,7 +290,122 @@ class GitHasInitialCommitError(GitError):
 class GitRevParseError(GitError):
     """rev-parse failed"""
 
+_OBJECT_ID_RE = re.compile('^(?:[0-9a-f]{40}|[0-9a-f]{64})$')
+
+class _UnusualRefs(Exception):
+    """Refs not stored as files and packed-refs"""
+
+def _read_packed_refs(git_dir):
+    refs = {}
+    try:
+        f = file(os.path.join(git_dir, 'packed-refs'))
+    except IOError, e:
+        if e.errno == errno.ENOENT:
+            return refs
+        raise _UnusualRefs(str(e))
+    try:
+        for line in f:
+            if line.startswith('#') or line.startswith('^'):
+                # header, or what the tag above peels to
+                continue
+            try:
+                object_id, name = line.split()
+            except ValueError:
+                raise _UnusualRefs('bad packed-refs line %r' % line)
+            refs[name] = object_id
+    finally:
+        f.close()
+    return refs
+
+def _resolve_ref(git_dir, ref):
+    """
+    Return the object ``ref`` points to in ``git_dir``, following
+    symbolic refs, or ``None`` if it doesn't exist (like the branch
+    ``HEAD`` names before the first commit).
+
+    Raises ``_UnusualRefs`` when the refs are kept in a way this
+    doesn't know, for the caller to ask git instead.
+    """
+    if os.path.exists(os.path.join(git_dir, 'commondir')) \
+       or os.path.isdir(os.path.join(git_dir, 'reftable')):
+        # worktrees share refs with another git dir; reftable
+        # needs git to read it
+        raise _UnusualRefs(git_dir)
+    if not os.path.isfile(os.path.join(git_dir, 'HEAD')):
+        raise _UnusualRefs('no HEAD in %s' % git_dir)
+
+    packed = None
+    # as many levels of symbolic refs as git follows
+    for i in xrange(5):
+        try:
+            data = util.read_file(os.path.join(git_dir, ref))
+        except IOError, e:
+            raise _UnusualRefs(str(e))
+        if data is not None:
+            data = data.strip()
+            if data.startswith('ref: '):
+                ref = data[len('ref: '):]
+                continue
+            if _OBJECT_ID_RE.match(data):
+                return data
+            raise _UnusualRefs('bad ref %s: %r' % (ref, data))
+
+        if packed is None:
+            packed = _read_packed_refs(git_dir)
+        return packed.get(ref)
+    raise _UnusualRefs('symbolic refs nested too deep: %s' % ref)
+
+def resolve_ref(git_dir, ref='HEAD'):
+    """
+    Return the object ``ref`` (``HEAD``, or a full ref name like
+    ``refs/heads/master``) points to in ``git_dir``, or ``None`` if it
+    doesn't exist.
+
+    Reads the ref files and ``packed-refs`` directly, and only asks
+    git for refs kept any other way.
+    """
+    try:
+        return _resolve_ref(git_dir, ref)
+    except _UnusualRefs:
+        pass
+    child = subprocess.Popen(
+        args=[
+            'git',
+            '--git-dir=.',
+            'rev-parse',
+            '--verify',
+            '--quiet',
+            ref,
+            ],
+        cwd=git_dir,
+        stdout=subprocess.PIPE,
+        close_fds=True,
+        )
+    got = child.stdout.read()
+    returncode = child.wait()
+    if returncode != 0:
+        return None
+    return got.strip()
+
+def head_ref(git_dir):
+    """
+    Return the ref ``HEAD`` of ``git_dir`` points to, or ``None`` if
+    it is detached or can't be read.
+    """
+    try:
+        data = util.read_file(os.path.join(git_dir, 'HEAD'))
+    except IOError:
+        return None
+    if data is None or not data.startswith('ref: '):
+        return None
+    return data[len('ref: '):].strip()
+
 def has_initial_commit(git_dir):
+    try:
+        return _resolve_ref(git_dir, 'HEAD') is not None
+    except _UnusualRefs:
+        pass
+
     child = subprocess.Popen(
         args=[
             'git',
@@ -194,3 +427,144 @@ def has_initial_commit(git_dir):
         return True
     else:
         raise GitHasInitialCommitError('Unknown git HEAD: %r' % got)
+
+def rev_parse(git_dir, rev):
+    """
+    Return the commit ``rev`` names in ``git_dir``, or ``None`` if it
+    doesn't name one.
+    """
+    if rev == 'HEAD' or rev.startswith('refs/heads/'):
+        # branches can only point to commits, no need to peel
+        try:
+            return _resolve_ref(git_dir, rev)
+        except _UnusualRefs:
+            pass
+    child = subprocess.Popen(
+        args=[
+            'git',
+            '--git-dir=.',
+            'rev-parse',
+            '--verify',
+            '--quiet',
+            '%s^{commit}' % rev,
+            ],
+        cwd=git_dir,
+        stdout=subprocess.PIPE,
+        close_fds=True,
+        )
+    got = child.stdout.read()
+    returncode = child.wait()
+    if returncode != 0:
+        return None
+    return got.strip()
+
+class GitDiffTreeError(GitError):
+    """git diff-tree failed"""
+
+def diff_tree(git_dir, old, new):
+    """
+    Generate ``(status, path)`` for every file that differs between
+    commits ``old`` and ``new``, renames showing as a delete and an add.
+    """
+    child = subprocess.Popen(
+        args=[
+            'git',
+            '--git-dir=.',
+            'diff-tree',
+            '-r',
+            '-z',
+            '--no-renames',
+            '--name-status',
+            old,
+            new,
+            ],
+        cwd=git_dir,
+        stdout=subprocess.PIPE,
+        close_fds=True,
+        )
+    got = child.stdout.read()
+    returncode = child.wait()
+    if returncode != 0:
+        raise GitDiffTreeError('exit status %d' % returncode)
+    fields = got.split('\0')
+    for i in xrange(0, len(fields) - 1, 2):
+        yield (fields[i], fields[i + 1])
+
+class GitLsTreeError(GitError):
+    """git ls-tree failed"""
+
+class GitCatFileError(GitError):
+    """git cat-file failed"""
+
+def read_files(git_dir, rev, paths):
+    """
+    Return a dict of the regular files at or under ``paths`` in commit
+    ``rev`` to their contents.
+
+    Everything comes straight from the object store, through one
+    ``git ls-tree`` and one ``git cat-file --batch``: no index, no
+    work tree, no temporary files.
+    """
+    child = subprocess.Popen(
+        args=[
+            'git',
+            '--git-dir=.',
+            'ls-tree',
+            '-r',
+            '-z',
+            rev,
+            '--',
+            ] + list(paths),
+        cwd=git_dir,
+        stdout=subprocess.PIPE,
+        close_fds=True,
+        )
+    got = child.stdout.read()
+    returncode = child.wait()
+    if returncode != 0:
+        raise GitLsTreeError('exit status %d' % returncode)
+
+    files = []
+    for entry in got.split('\0'):
+        if not entry:
+            continue
+        info, path = entry.split('\t', 1)
+        mode, type_, sha1 = info.split()
+        # the checkout would have made symlinks and submodules
+        # something else than files
+        if type_ == 'blob' and mode in ('100644', '100755'):
+            files.append((path, sha1))
+    if not files:
+        return {}
+
+    child = subprocess.Popen(
+        args=[
+            'git',
+            '--git-dir=.',
+            'cat-file',
+            '--batch',
+            ],
+        cwd=git_dir,
+        stdin=subprocess.PIPE,
+        stdout=subprocess.PIPE,
+        close_fds=True,
+        )
+    got = child.communicate(
+        ''.join('%s\n' % sha1 for path, sha1 in files))[0]
+    if child.returncode != 0:
+        raise GitCatFileError('exit status %d' % child.returncode)
+
+    contents = {}
+    pos = 0
+    for path, sha1 in files:
+        end = got.find('\n', pos)
+        header = got[pos:end].split()
+        if end < 0 or len(header) != 3 or header[:2] != [sha1, 'blob']:
+            raise GitCatFileError(
+                'unexpected reply for %s' % path, got[pos:end])
+        pos = end + 1
+        size = int(header[2])
+        contents[path] = got[pos:pos + size]
+        # each object is followed by a newline
+        pos += size + 1
+    return contents
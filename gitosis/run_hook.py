@@ -12,30 +12,50 @@ from gitosis import repository
 from gitosis import ssh
 from gitosis import gitweb
 from gitosis import gitdaemon
+from gitosis import inventory
 from gitosis import app
 from gitosis import util
+from gitosis import gitoliteConfig
+from gitosis import access
 
 log = logging.getLogger('gitosis.run_hook')
 
-def post_update(cfg, git_dir):
-    export = os.path.join(git_dir, 'gitosis-export')
+# the admin commit the hook last applied, under the admin repository
+APPLIED = 'gitosis-applied'
+
+class _FullRebuild(Exception):
+    """Incremental update not possible"""
+
+def read_applied(git_dir):
     try:
-        shutil.rmtree(export)
-    except OSError, e:
+        f = file(os.path.join(git_dir, APPLIED))
+    except IOError, e:
         if e.errno == errno.ENOENT:
-            pass
+            return None
         else:
             raise
-    repository.export(git_dir=git_dir, path=export)
-    os.rename(
-        os.path.join(export, 'gitosis.conf'),
-        os.path.join(export, '..', 'gitosis.conf'),
-        )
-    # re-read config to get up-to-date settings
-    cfg.load(file(os.path.join(export, '..', 'gitosis.conf'), 'r'))
+    try:
+        return f.read().strip() or None
+    finally:
+        f.close()
 
+def write_applied(git_dir, commit):
+    path = os.path.join(git_dir, APPLIED)
+    tmp = '%s.%d.tmp' % (path, os.getpid())
+    f = file(tmp, 'w')
+    try:
+        print >>f, commit
+    finally:
+        f.close()
+    os.rename(tmp, path)
+
+def load_props(cfg, projects=None):
+    """
+    The props to apply, with GitwebProp reporting to ``projects``.
+    """
     props = (gitdaemon.DaemonProp(),
-      gitweb.GitwebProp(), gitweb.DescriptionProp(), gitweb.OwnerProp())
+      gitweb.GitwebProp(projects), gitweb.DescriptionProp(),
+      gitweb.OwnerProp())
 
     ext_props = cfg.get_gitosis('extProps') or ()
     if ext_props:
@@ -48,7 +68,10 @@ def post_update(cfg, git_dir):
             assert mod_, "'%s': empty module name" % file_
             assert ext_ == '.py', "the extname of '%s' is not '.py'" % file_
 
-            sys.path.append(dir_)
+            # gitosis-accessd loads them for every repository it
+            # creates, for as long as it runs
+            if dir_ not in sys.path:
+                sys.path.append(dir_)
             mod_ = __import__(mod_)
             ext_props_ = mod_.get_props()
         except (AssertionError, ImportError) as e:
@@ -62,17 +85,243 @@ def post_update(cfg, git_dir):
         else:
             ext_props = ext_props_
 
-    util.RepositoryDir(cfg, props + ext_props).travel()
-    generated = util.getGeneratedFilesDir(config=cfg)
-    gitweb.ProjectList(
-                      os.path.join(generated, 'projects.list')
-                      ).refresh()
+    return props + ext_props
+
+def _snapshot(git_dir):
+    try:
+        gitoliteConfig.write_snapshot(
+            os.path.join(git_dir, 'gitosis.conf'))
+    except (gitoliteConfig.GitoliteConfigException, IOError, OSError), e:
+        # gitosis-serve falls back to parsing the config itself
+        log.warning('Cannot write config snapshot: %s', e)
+
+def _read_admin(git_dir, rev, with_keys=True):
+    """
+    Return the gitosis.conf of admin commit ``rev``, and a dict of the
+    files directly in its keydir to their contents (empty unless
+    ``with_keys``).
+    """
+    paths = ['gitosis.conf']
+    if with_keys:
+        paths.append('keydir')
+    files = repository.read_files(git_dir, rev, paths)
+    try:
+        config = files.pop('gitosis.conf')
+    except KeyError:
+        raise gitoliteConfig.GitoliteConfigException(
+            'No gitosis.conf in %s' % rev)
 
+    keys = {}
+    for path, data in files.iteritems():
+        filename = path[len('keydir/'):]
+        if '/' not in filename:
+            keys[filename] = data
+    return (config, keys)
+
+def _write_config(git_dir, data):
+    path = os.path.join(git_dir, 'gitosis.conf')
+    tmp = '%s.%d.tmp' % (path, os.getpid())
+    f = file(tmp, 'w')
+    try:
+        f.write(data)
+    finally:
+        f.close()
+    os.rename(tmp, path)
+    _snapshot(git_dir)
+
+def _write_keys(cfg, keys):
     authorized_keys = util.getSSHAuthorizedKeysPath(config=cfg)
     ssh.writeAuthorizedKeys(
         path=authorized_keys,
-        keydir=os.path.join(export, 'keydir'),
+        keys=ssh.readKeyBlobs(keys),
         )
+    key_index = util.getSSHKeyIndexPath(config=cfg)
+    if key_index is not None:
+        ssh.writeKeyIndex(
+            path=key_index,
+            keys=ssh.readKeyBlobs(keys),
+            )
+
+def _full_rebuild(cfg, git_dir, rev):
+    (data, keys) = _read_admin(git_dir, rev)
+    _write_config(git_dir, data)
+    # re-read config to get up-to-date settings
+    cfg.load(data.splitlines())
+
+    generated = util.getGeneratedFilesDir(config=cfg)
+    plist = gitweb.ProjectList(os.path.join(generated, 'projects.list'))
+    projects = gitweb.Projects(plist.listed())
+    repodir = util.RepositoryDir(cfg, load_props(cfg, projects))
+    repodir.travel()
+    plist.refresh(projects)
+    inventory.Inventory(
+        util.getInventoryPath(config=cfg)).replace(repodir.visited)
+
+    _write_keys(cfg, keys)
+
+    # older versions checked the admin repository out here
+    shutil.rmtree(os.path.join(git_dir, 'gitosis-export'), True)
+
+def _affected_repos(old_cfg, cfg, groups, repos):
+    """
+    The config repos whose props may come out different: the changed
+    ones, and those granting access to a changed group or to a group
+    containing one.
+    """
+    groups = set(groups)
+    for c in (old_cfg, cfg):
+        for grpname in list(groups):
+            groups.update(c.get_group_closure(grpname))
+
+    affected = set(repos)
+    if not groups:
+        return affected
+    for c in (old_cfg, cfg):
+        for reponame in c.repos():
+            for mode in access.MODES:
+                try:
+                    users = c.get_repo(reponame, mode)
+                except gitoliteConfig.GitoliteConfigException:
+                    continue
+                if users and not users.isdisjoint(groups):
+                    affected.add(reponame)
+    return affected
+
+def _update_repos(old_cfg, cfg, affected):
+    """
+    Apply the props of the repositories on disk whose config repo is
+    in ``affected``, or was before.
+    """
+    walk = False
+    for reponame in affected:
+        if cfg.get_repo(reponame, 'path_regex') \
+           or old_cfg.get_repo(reponame, 'path_regex'):
+            walk = True
+
+    generated = util.getGeneratedFilesDir(config=cfg)
+    plist = gitweb.ProjectList(os.path.join(generated, 'projects.list'))
+    projects = gitweb.Projects(plist.listed())
+    repodir = util.RepositoryDir(cfg, load_props(cfg, projects))
+    known = inventory.Inventory(util.getInventoryPath(config=cfg))
+    if walk:
+        names = known.names()
+        if names is None:
+            names = repodir.names()
+    else:
+        names = [
+            name for name in sorted(affected)
+            if os.path.isdir(os.path.join(
+                repodir.repositories, name + '.git'))
+            ]
+
+    to_visit = []
+    for name in names:
+        try:
+            old = old_cfg.lookup_repo(name)
+            new = cfg.lookup_repo(name)
+        except gitoliteConfig.GitoliteConfigException:
+            # let visit_one() complain
+            pass
+        else:
+            if old == new and new not in affected:
+                continue
+            if old and not new:
+                # has to leave projects.list, which update() can't do
+                raise _FullRebuild('%r is no longer configured' % name)
+        to_visit.append(name)
+    repodir.visit(to_visit)
+    known.update(repodir.visited)
+    plist.update(projects)
+    log.info('Updated %d repositories', len(to_visit))
+
+def _incremental(cfg, git_dir, old, new):
+    conf_changed = False
+    keys_changed = False
+    for (status, path) in repository.diff_tree(git_dir, old, new):
+        if path == 'gitosis.conf':
+            conf_changed = True
+        elif path.startswith('keydir/'):
+            keys_changed = True
+    log.info('Changed since %s: config %s, keys %s',
+             old[:12], conf_changed and 'yes' or 'no',
+             keys_changed and 'yes' or 'no')
+
+    if not (conf_changed or keys_changed):
+        return
+    (data, keys) = _read_admin(git_dir, new, with_keys=keys_changed)
+
+    if conf_changed:
+        old_cfg = gitoliteConfig.GitoliteConfig()
+        try:
+            old_data = repository.read_files(
+                git_dir, old, ['gitosis.conf'])['gitosis.conf']
+            old_cfg.load(old_data.splitlines())
+        except (KeyError, repository.GitError,
+                gitoliteConfig.GitoliteConfigException), e:
+            raise _FullRebuild('cannot read old config: %s' % e)
+
+        new_cfg = gitoliteConfig.GitoliteConfig()
+        new_cfg.load(data.splitlines())
+        _write_config(git_dir, data)
+
+        # compare fresh copies, cfg may have been loaded before
+        (global_changed, groups, repos) = new_cfg.changes_since(old_cfg)
+        if global_changed:
+            raise _FullRebuild('the gitosis section changed')
+        affected = _affected_repos(old_cfg, new_cfg, groups, repos)
+        if affected:
+            _update_repos(old_cfg, new_cfg, affected)
+
+    # re-read config to get up-to-date settings
+    cfg.load(data.splitlines())
+    if keys_changed:
+        _write_keys(cfg, keys)
+
+def post_update(cfg, git_dir, full=False, old=None):
+    """
+    Make the server match the newest gitosis-admin commit.
+
+    Only what changed since the commit applied last time (or ``old``,
+    if that is not known) is redone: the repositories whose config
+    changed and the keys if keydir changed. Everything is rebuilt
+    when ``full`` is set, or the changes can't be worked out.
+    """
+    new = repository.rev_parse(git_dir, 'HEAD')
+    applied = read_applied(git_dir)
+    if applied is not None:
+        old = applied
+
+    if full or new is None or old is None:
+        log.info('Rebuilding everything')
+        _full_rebuild(cfg, git_dir, new or 'HEAD')
+    elif old == new:
+        log.info('Nothing changed since %s', old[:12])
+    else:
+        try:
+            _incremental(cfg, git_dir, old, new)
+        except (_FullRebuild, repository.GitDiffTreeError), e:
+            log.info('Rebuilding everything: %s', e)
+            _full_rebuild(cfg, git_dir, new)
+
+    if new is not None:
+        write_applied(git_dir, new)
+
+def _received_head(git_dir, fp):
+    """
+    The old value of the current branch from post-receive input
+    ``fp``, or ``None``.
+    """
+    head = repository.head_ref(git_dir)
+    if head is None:
+        return None
+
+    for line in fp:
+        try:
+            old, new, ref = line.split()
+        except ValueError:
+            continue
+        if ref == head and old.strip('0'):
+            return old
 
 class Main(app.App):
     def create_parser(self):
@@ -80,6 +329,11 @@ class Main(app.App):
         parser.set_usage('%prog [OPTS] HOOK')
         parser.set_description(
             'Perform gitosis actions for a git hook')
+        parser.add_option('--full',
+                          action='store_true',
+                          default=False,
+                          help='rebuild everything, not just what changed',
+                          )
         return parser
 
     def handle_args(self, parser, cfg, options, args):
@@ -97,7 +351,12 @@ class Main(app.App):
 
         if hook == 'post-update':
             log.info('Running hook %s', hook)
-            post_update(cfg, git_dir)
+            post_update(cfg, git_dir, full=options.full)
+            log.info('Done.')
+        elif hook == 'post-receive':
+            log.info('Running hook %s', hook)
+            post_update(cfg, git_dir, full=options.full,
+                        old=_received_head(git_dir, sys.stdin))
             log.info('Done.')
         else:
             log.warning('Ignoring unknown hook: %r', hook)
@@ -8,10 +8,9 @@ import logging
 
 import sys, os, re
 
+# only what access checking needs; repository creation, which is rare,
+# imports the rest itself
 from gitosis import access
-from gitosis import repository
-from gitosis import gitweb
-from gitosis import gitdaemon
 from gitosis import app
 from gitosis import util
 
@@ -19,6 +18,17 @@ log = logging.getLogger('gitosis.serve')
 
 ALLOW_RE = re.compile("^'/*(?P<path>[a-zA-Z0-9][a-zA-Z0-9@._-]*(/[a-zA-Z0-9][a-zA-Z0-9@._-]*)*)'$")
 
+# where gitosis-accessd listens by default
+ACCESSD_SOCKET = '~/.gitosis-accessd.sock'
+
+# a request to gitosis-accessd is "USER\0COMMAND", ended by the client
+# shutting down its side of the connection; the reply is one of these,
+# a tab and the command to run, the ServingError subclass raised, or
+# an explanation
+ACCESSD_OK = 'ok'
+ACCESSD_DENIED = 'denied'
+ACCESSD_FAILED = 'failed'
+
 COMMANDS_READONLY = [
     'git-upload-pack',
     'git upload-pack',
@@ -59,11 +69,106 @@ class WriteAccessDenied(AccessDenied):
 class ReadAccessDenied(AccessDenied):
     """Repository read access denied"""
 
+class AccessdUnavailable(Exception):
+    """Access daemon cannot answer"""
+
+    def __str__(self):
+        return '%s: %s' % (self.__doc__, ': '.join(self.args))
+
+def recv_all(sock):
+    chunks = []
+    while True:
+        chunk = sock.recv(4096)
+        if not chunk:
+            break
+        chunks.append(chunk)
+    return ''.join(chunks)
+
+def ask_accessd(path, user, command, timeout=10.0):
+    """
+    Ask gitosis-accessd listening at ``path`` to serve ``command`` for
+    ``user``.
+
+    Returns the new command like ``serve()`` does, raises the same
+    ``ServingError`` it would have, or raises ``AccessdUnavailable``
+    when the question has to be answered in-process instead.
+    """
+    import socket
+
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        try:
+            sock.settimeout(timeout)
+            sock.connect(path)
+            sock.sendall('%s\0%s' % (user, command))
+            sock.shutdown(socket.SHUT_WR)
+            reply = recv_all(sock)
+        except socket.error, e:
+            raise AccessdUnavailable(str(e))
+    finally:
+        sock.close()
+
+    try:
+        status, arg = reply.split('\t', 1)
+    except ValueError:
+        raise AccessdUnavailable('bad reply %r' % reply)
+
+    if status == ACCESSD_OK:
+        return arg
+    elif status == ACCESSD_DENIED:
+        error = globals().get(arg)
+        if isinstance(error, type) and issubclass(error, ServingError):
+            raise error()
+    raise AccessdUnavailable(arg)
+
+def create(cfg, repobase, reponame):
+    """
+    Create repository ``reponame`` under ``repobase`` and apply its props.
+    """
+    from gitosis import repository
+    from gitosis import gitweb
+    from gitosis import inventory
+    from gitosis import run_hook
+
+    repopath = reponame + '.git'
+    fullpath = os.path.join(repobase, repopath)
+
+    # create leading directories
+    p = repobase
+    components = repopath.split(os.sep)[:-1]
+    for c in components: # Check
+        if c.endswith('.git'):
+            raise BadRepositoryPath()
+    for c in components:
+        p = os.path.join(p, c)
+        util.mkdir(p, 0750)
+
+    repository.init(
+        path=fullpath,
+        skeleton=util.getSkeletonPath(config=cfg),
+        )
+    projects = gitweb.Projects()
+    repodir = util.RepositoryDir(cfg, run_hook.load_props(cfg, projects))
+    repodir.visit_one(reponame)
+    generated = util.getGeneratedFilesDir(config=cfg)
+    gitweb.ProjectList(
+                      os.path.join(generated, 'projects.list')
+                      ).update(projects)
+    inventory.Inventory(
+        util.getInventoryPath(config=cfg)).update(repodir.visited)
+
 def serve(
     cfg,
     user,
     command,
+    create_lock=None,
     ):
+    """
+    Check ``command`` from ``user`` and return the command to run.
+
+    @param create_lock: held while creating a missing repository, for
+    callers serving from several threads; access checks don't take it.
+    """
     if '\n' in command:
         raise CommandMayNotContainNewlineError()
 
@@ -103,26 +208,21 @@ def serve(
         if not user:
             raise BadEncodedID()
 
-    newpath = access.haveAccess(
+    granted = access.getAccess(
             config=cfg,
             user=user,
-            mode='RW+',
             path=path)
 
-    if newpath == None:
+    if granted == None:
         if verb in COMMANDS_WRITE:
             raise WriteAccessDenied()
         else:
-            newpath = access.haveAccess(
-                config=cfg,
-                user=user,
-                mode='R',
-                path=path)
-
-            if newpath == None:
-                raise ReadAccessDenied()
-    
-    (repobase, reponame) = newpath
+            raise ReadAccessDenied()
+
+    (mode, repobase, reponame, via) = granted
+    if verb in COMMANDS_WRITE and mode != 'RW+':
+        raise WriteAccessDenied()
+
     assert not reponame.endswith('.git'), \
            'git extension should have been stripped: %r' % reponame
     repopath = reponame + '.git'
@@ -131,51 +231,15 @@ def serve(
         # it doesn't exist on the filesystem, but the configuration
         # refers to it, we're serving a write request, and the user is
         # authorized to do that: create the repository on the fly
-
-        # create leading directories
-        p = repobase
-        components = repopath.split(os.sep)[:-1]
-        for c in components: # Check
-            if c.endswith('.git'):
-                raise BadRepositoryPath()
-        for c in components:
-            p = os.path.join(p, c)
-            util.mkdir(p, 0750)
-
-        props = (gitdaemon.DaemonProp(),
-          gitweb.GitwebProp(), gitweb.DescriptionProp(), gitweb.OwnerProp())
-
-        ext_props = cfg.get_gitosis('extProps') or ()
-        if ext_props:
-            try:
-                ext_props_expanded = os.path.join(
-                  os.path.expanduser('~'), ext_props)
-                dir_ = os.path.dirname(ext_props_expanded)
-                file_ = os.path.basename(ext_props_expanded)
-                mod_, ext_ = os.path.splitext(file_)
-                assert mod_, "'%s': empty module name" % file_
-                assert ext_ == '.py', "the extname of '%s' is not '.py'" % file_
-
-                sys.path.append(dir_)
-                mod_ = __import__(mod_)
-                ext_props_ = mod_.get_props()
-            except (AssertionError, ImportError) as e:
-                log.warning("Invalid extProps value '%s': %s" % \
-                  (ext_props, str(e)))
-                ext_props = ()
-            except:
-                log.warning("Bad module '%s': %s" % \
-                  (ext_props, str(sys.exc_info()[1])))
-                ext_props = ()
-            else:
-                ext_props = ext_props_
-
-        repository.init(path=fullpath)
-        util.RepositoryDir(cfg, props + ext_props).visit_one(reponame)
-        generated = util.getGeneratedFilesDir(config=cfg)
-        gitweb.ProjectList(
-                          os.path.join(generated, 'projects.list')
-                          ).update()
+        if create_lock is not None:
+            create_lock.acquire()
+        try:
+            # unless another thread did while we waited
+            if not os.path.exists(fullpath):
+                create(cfg, repobase, reponame)
+        finally:
+            if create_lock is not None:
+                create_lock.release()
 
     # put the verb back together with the new path
     newcmd = "%(verb)s '%(path)s'" % dict(
@@ -185,17 +249,43 @@ def serve(
     return newcmd
 
 class Main(app.App):
+    def get_defaults(self):
+        defaults = super(Main, self).get_defaults()
+        defaults.update(
+            accessd=os.path.expanduser(ACCESSD_SOCKET),
+            )
+        return defaults
+
+    def parse_args(self):
+        # authorized_keys runs us as plain "gitosis-serve USER", that
+        # doesn't need optparse
+        args = sys.argv[1:]
+        if len(args) == 1 and not args[0].startswith('-'):
+            return (None, app.Options(**self.get_defaults()), args)
+        return super(Main, self).parse_args()
+
     def create_parser(self):
         parser = super(Main, self).create_parser()
         parser.set_usage('%prog [OPTS] USER')
         parser.set_description(
             'Allow restricted git operations under DIR')
+        parser.add_option('--accessd',
+                          metavar='FILE',
+                          help='ask gitosis-accessd listening on FILE first',
+                          )
         return parser
 
+    def read_config(self, options, cfg):
+        # deferred to handle_args(), gitosis-accessd usually has the
+        # config parsed already
+        pass
+
     def handle_args(self, parser, cfg, options, args):
         try:
             (user,) = args
         except ValueError:
+            # the fast path in parse_args() only lets one argument by
+            assert parser is not None
             parser.error('Missing argument USER.')
 
         main_log = logging.getLogger('gitosis.serve.main')
@@ -213,11 +303,22 @@ class Main(app.App):
         os.chdir(os.path.expanduser('~'))
 
         try:
-            newcmd = serve(
-                cfg=cfg,
-                user=user,
-                command=cmd,
-                )
+            try:
+                newcmd = ask_accessd(options.accessd, user, cmd)
+            except AccessdUnavailable, e:
+                main_log.debug('%s, serving in-process', e)
+                try:
+                    super(Main, self).read_config(options, cfg)
+                except app.CannotReadConfigError, e:
+                    main_log.error(str(e))
+                    sys.exit(1)
+                self.setup_logging(cfg)
+
+                newcmd = serve(
+                    cfg=cfg,
+                    user=user,
+                    command=cmd,
+                    )
         except ServingError, e:
             main_log.error('%s', e)
             sys.exit(1)
@@ -1,5 +1,11 @@
 import os, errno, re
+import base64
+import hashlib
 import logging
+from cStringIO import StringIO
+
+from gitosis import cdb
+from gitosis import util
 
 log = logging.getLogger('gitosis.ssh')
 
@@ -9,11 +15,12 @@ def isSafeUsername(user):
     match = _ACCEPTABLE_USER_RE.match(user)
     return (match is not None)
 
-def readKeys(keydir):
+def _keyFiles(filenames):
     """
-    Read SSH public keys from ``keydir/*.pub``
+    Pick the ``*.pub`` files from ``filenames``, sorted so the output
+    doesn't change with directory order, and with the user for each.
     """
-    for filename in os.listdir(keydir):
+    for filename in sorted(filenames):
         if filename.startswith('.'):
             continue
         basename, ext = os.path.splitext(filename)
@@ -24,6 +31,13 @@ def readKeys(keydir):
             log.warn('Unsafe SSH username in keyfile: %r', filename)
             continue
 
+        yield (filename, basename)
+
+def readKeys(keydir):
+    """
+    Read SSH public keys from ``keydir/*.pub``
+    """
+    for filename, basename in _keyFiles(os.listdir(keydir)):
         path = os.path.join(keydir, filename)
         f = file(path)
         for line in f:
@@ -31,12 +45,25 @@ def readKeys(keydir):
             yield (basename, line)
         f.close()
 
+def readKeyBlobs(blobs):
+    """
+    Like readKeys(), from the dict ``blobs`` of file names in keydir to
+    their contents.
+    """
+    for filename, basename in _keyFiles(blobs):
+        lines = blobs[filename].split('\n')
+        if lines[-1] == '':
+            # ended in a newline
+            del lines[-1]
+        for line in lines:
+            yield (basename, line)
+
 COMMENT = '### autogenerated by gitosis, DO NOT EDIT'
 
-def generateAuthorizedKeys(keys):
-    TEMPLATE=('command="gitosis-serve %(user)s",no-port-forwarding,'
-              +'no-X11-forwarding,no-agent-forwarding,no-pty %(key)s')
+TEMPLATE=('command="gitosis-serve %(user)s",no-port-forwarding,'
+          +'no-X11-forwarding,no-agent-forwarding,no-pty %(key)s')
 
+def generateAuthorizedKeys(keys):
     yield COMMENT
     for (user, key) in keys:
         yield TEMPLATE % dict(user=user, key=key)
@@ -60,31 +87,79 @@ def filterAuthorizedKeys(fp):
             continue
         yield line
 
-def writeAuthorizedKeys(path, keydir):
-    tmp = '%s.%d.tmp' % (path, os.getpid())
+def _writeIfChanged(path, data, old):
+    if util.write_file_if_changed(path, data, old=old, sync=True):
+        log.info('Wrote %s', path)
+        return True
+    log.info('Unchanged: %s', path)
+    return False
+
+def writeAuthorizedKeys(path, keydir=None, keys=None):
+    """
+    Put the keys in ``keydir``, or the ``(user, key)`` pairs ``keys``,
+    into the authorized_keys file at ``path``, keeping whatever else
+    is in it.
+
+    Returns whether ``path`` had to be written.
+    """
+    if keys is None:
+        keys = readKeys(keydir)
+    old = util.read_file(path)
+    lines = []
+    if old is not None:
+        lines.extend(filterAuthorizedKeys(old.splitlines(True)))
+    lines.extend(generateAuthorizedKeys(keys))
+    return _writeIfChanged(
+        path, ''.join('%s\n' % line for line in lines), old)
+
+def keyFingerprint(key):
+    """
+    Return the OpenSSH SHA256 fingerprint (as in ``ssh-keygen -l``,
+    or sshd's ``%f``) of public key line ``key``, or ``None`` if it
+    doesn't look like a key.
+    """
+    parts = key.split(None, 2)
+    if len(parts) < 2:
+        return None
     try:
-        in_ = file(path)
-    except IOError, e:
-        if e.errno == errno.ENOENT:
-            in_ = None
-        else:
-            raise
+        blob = base64.b64decode(parts[1])
+    except TypeError:
+        return None
+    if not blob:
+        return None
+    digest = hashlib.sha256(blob).digest()
+    return 'SHA256:' + base64.b64encode(digest).rstrip('=')
+
+def writeKeyIndex(path, keydir=None, keys=None):
+    """
+    Write the constant database ``gitosis-authorized-keys`` answers
+    from, mapping the fingerprint of every key in ``keydir`` (or of
+    the ``(user, key)`` pairs ``keys``) to its authorized_keys line.
+
+    Returns whether ``path`` had to be written.
+    """
+    if keys is None:
+        keys = readKeys(keydir)
+    out = StringIO()
+    writer = cdb.CdbWriter(out)
+    for (user, key) in keys:
+        if not key.strip():
+            continue
+        fingerprint = keyFingerprint(key)
+        if fingerprint is None:
+            log.warn('Unparseable SSH key for %r: %r', user, key)
+            continue
+        writer.add(fingerprint, TEMPLATE % dict(user=user, key=key))
+    writer.finish()
+    return _writeIfChanged(path, out.getvalue(), util.read_file(path))
 
+def lookupKeyIndex(path, fingerprint):
+    """
+    Return the authorized_keys lines for the key with ``fingerprint``
+    in the index at ``path``.
+    """
+    f = file(path, 'rb')
     try:
-        out = file(tmp, 'w')
-        try:
-            if in_ is not None:
-                for line in filterAuthorizedKeys(in_):
-                    print >>out, line
-
-            keygen = readKeys(keydir)
-            for line in generateAuthorizedKeys(keygen):
-                print >>out, line
-
-            os.fsync(out)
-        finally:
-            out.close()
+        return list(cdb.Cdb(f).getall(fingerprint))
     finally:
-        if in_ is not None:
-            in_.close()
-    os.rename(tmp, path)
+        f.close()
@@ -0,0 +1,75 @@
+"""
+Benchmark group membership resolution on deep and wide hierarchies.
+
+Run as ``python -m gitosis.test.bench_groups``.
+"""
+
+import sys
+import time
+
+from gitosis.gitoliteConfig import GitoliteConfig
+
+def deep_config(depth):
+    # @g0 = user, @g1 = @g0, ... one long chain
+    lines = ['@g0 = jdoe']
+    for i in xrange(1, depth):
+        lines.append('@g%d = @g%d' % (i, i - 1))
+    return lines
+
+def wide_config(width, users):
+    # every team is in every division: lots of diamonds
+    lines = []
+    for i in xrange(width):
+        lines.append('@team%d = %s' % (
+            i, ' '.join('u%d_%d' % (i, j) for j in xrange(users))))
+    for i in xrange(width // 10):
+        lines.append('@division%d = %s' % (
+            i, ' '.join('@team%d' % j for j in xrange(width))))
+    lines.append('@company = %s' % ' '.join(
+        '@division%d' % i for i in xrange(width // 10)))
+    return lines
+
+def recursive_membership(cfg, user, seen=None):
+    # what group._getMembership did before the index
+    for group in cfg.groups():
+        members = cfg.get_group_members(group)
+        if members and user in members:
+            yield group
+            for member_of in recursive_membership(cfg, group):
+                yield member_of
+
+def measure(name, lines, user, recursive=True):
+    cfg = GitoliteConfig()
+    cfg.load(lines)
+
+    start = time.time()
+    indexed = cfg.get_membership(user)
+    index_time = time.time() - start
+
+    start = time.time()
+    for i in xrange(1000):
+        cfg.get_membership(user)
+    lookup_time = (time.time() - start) / 1000
+
+    if recursive:
+        start = time.time()
+        old = set(recursive_membership(cfg, user))
+        old_time = '%9.3f ms' % ((time.time() - start) * 1000)
+        assert old == set(indexed[:-1])
+    else:
+        old_time = '      n/a'
+
+    print '%-28s %6d groups: recursive %s  index build %9.3f ms  ' \
+          'lookup %7.4f ms' % (
+        name, len(lines), old_time, index_time * 1000, lookup_time * 1000)
+
+def main(args):
+    sys.setrecursionlimit(10000)
+    measure('deep (200)', deep_config(200), 'jdoe')
+    measure('deep (20000)', deep_config(20000), 'jdoe', recursive=False)
+    measure('wide (200 teams x 20)', wide_config(200, 20), 'u7_3')
+    measure('wide (2000 teams x 20)', wide_config(2000, 20), 'u7_3',
+            recursive=False)
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
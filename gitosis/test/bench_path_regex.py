@@ -0,0 +1,62 @@
+"""
+Benchmark ``GitoliteConfig.lookup_repo`` with many ``path_regex`` repos.
+
+Run as ``python -m gitosis.test.bench_path_regex [COUNT]``.
+"""
+
+import re
+import sys
+import timeit
+
+from gitosis.gitoliteConfig import GitoliteConfig
+
+# literal prefixes go through the trie, the others get folded
+SHAPES = [
+    ('prefixed', '^team%d/[a-z]+$'),
+    ('unprefixed', '^(team%d)/[a-z]+$'),
+    ]
+
+def make_config(count, shape):
+    lines = []
+    for i in xrange(count):
+        lines.append('repo team%d' % i)
+        lines.append('\tpath_regex = ' + shape % i)
+        lines.append('\tR = @all')
+    cfg = GitoliteConfig()
+    cfg.load(lines)
+    return cfg
+
+def linear_lookup(patterns, path):
+    # what lookup_repo did before the patterns were folded
+    for r, repo in patterns:
+        if r.match(path):
+            return repo
+
+def main(args):
+    count = 5000
+    if args:
+        count = int(args[0])
+    number = 200
+
+    for name, shape in SHAPES:
+        cfg = make_config(count, shape)
+        patterns = [(re.compile(cfg.get_repo(repo, 'path_regex')), repo)
+                    for repo in cfg.repos()]
+        paths = ['team0/foo', 'team%d/foo' % (count // 2),
+                 'team%d/foo' % (count - 1), 'nomatch/foo']
+
+        for path in paths:
+            assert linear_lookup(patterns, path) == cfg.lookup_repo(path)
+
+        print '%d %s path_regex repos, %d lookups per path' % (
+            count, name, number)
+        for path in paths:
+            linear = timeit.timeit(
+                lambda: linear_lookup(patterns, path), number=number)
+            matched = timeit.timeit(
+                lambda: cfg.lookup_repo(path), number=number)
+            print '  %-16s linear %8.3f ms  lookup_repo %8.3f ms' % (
+                path, linear * 1000 / number, matched * 1000 / number)
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
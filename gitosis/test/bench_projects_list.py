@@ -0,0 +1,71 @@
+"""
+Benchmark ``gitweb.ProjectList.update`` on a long ``projects.list``.
+
+Run as ``python -m gitosis.test.bench_projects_list [COUNT]``.
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+from gitosis import gitweb
+
+def list_update(path, allow, disallow):
+    # what ProjectList.update did before, with lists
+    allow = list(allow)
+    tmp = path + '.tmp'
+    f = file(tmp, 'w')
+    for l in file(path):
+        _l = l.strip()
+        if _l and _l not in disallow:
+            f.write(l)
+            if _l in allow:
+                allow.remove(_l)
+    if allow:
+        f.write('\n')
+        f.write('\n'.join(sorted(allow)))
+    f.close()
+    os.rename(tmp, path)
+
+def main(args):
+    count = 100000
+    if args:
+        count = int(args[0])
+
+    existing = ['team%d/repo%d.git' % (i // 100, i) for i in xrange(count)]
+    existing.sort()
+    # a push touching 1% of the projects: some already listed, some
+    # new, some going away
+    allow = existing[::200] + ['new/repo%d.git' % i
+                               for i in xrange(count // 200)]
+    disallow = existing[1::1000]
+
+    tmp = tempfile.mkdtemp(prefix='gitosis-bench-projects-')
+    try:
+        path = os.path.join(tmp, 'projects.list')
+        print '%d projects, %d allowed, %d denied' % (
+            count, len(allow), len(disallow))
+
+        file(path, 'w').write('\n'.join(existing))
+        start = time.time()
+        list_update(path, allow, disallow)
+        print '  lists  %8.3f s' % (time.time() - start)
+        old = sorted(l.strip() for l in file(path) if l.strip())
+
+        file(path, 'w').write('\n'.join(existing))
+        projects = gitweb.Projects()
+        for repopath in allow:
+            projects.add(repopath, True)
+        for repopath in disallow:
+            projects.add(repopath, False)
+        start = time.time()
+        gitweb.ProjectList(path).update(projects)
+        print '  sets   %8.3f s' % (time.time() - start)
+        assert file(path).read().splitlines() == old
+    finally:
+        shutil.rmtree(tmp)
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,93 @@
+"""
+Measure what starting ``gitosis-serve`` costs in imports.
+
+Like ``python -X importtime`` (which Python 2 lacks): every import made
+on the gitosis-serve hot path is timed, cumulative and self, and the
+whole start-up is compared with importing what serve used to import
+eagerly.
+
+Run as ``python -m gitosis.test.bench_serve_import [RUNS]``.
+"""
+
+import os
+import subprocess
+import sys
+import time
+
+# hot path: argument parsing and an access check, as for a fetch
+HOT_PATH = """\
+import sys
+sys.argv = ['gitosis-serve', 'jdoe']
+from gitosis import serve
+from gitosis.gitoliteConfig import GitoliteConfig
+serve.Main().parse_args()
+cfg = GitoliteConfig()
+cfg.load(['repo foo', 'R = jdoe'])
+serve.access.getAccess(config=cfg, user='jdoe', path='foo')
+"""
+
+# what gitosis.serve and gitosis.app used to pull in up front
+EAGER = """\
+import optparse, base64
+from gitosis import repository, gitweb, gitdaemon
+"""
+
+IMPORTTIME = """\
+import __builtin__, sys, time
+_import = __builtin__.__import__
+_stack = []
+_times = []
+def _timed(name, *a, **kw):
+    if name in sys.modules:
+        return _import(name, *a, **kw)
+    _stack.append(0.0)
+    start = time.time()
+    try:
+        return _import(name, *a, **kw)
+    finally:
+        took = time.time() - start
+        nested = _stack.pop()
+        if _stack:
+            _stack[-1] += took
+        _times.append((took - nested, took, len(_stack), name))
+__builtin__.__import__ = _timed
+%s
+__builtin__.__import__ = _import
+print 'import time:  self [us] | cumulative | imported package'
+for self_, cumulative, depth, name in _times:
+    print 'import time: %%9d | %%10d | %%s%%s' %% (
+        self_ * 1e6, cumulative * 1e6, '  ' * depth, name)
+"""
+
+def _topdir():
+    return os.path.dirname(os.path.dirname(os.path.dirname(
+        os.path.abspath(__file__))))
+
+def run(code):
+    start = time.time()
+    returncode = subprocess.call(
+        args=[sys.executable, '-c', code],
+        cwd=_topdir(),
+        )
+    assert returncode == 0
+    return time.time() - start
+
+def main(args):
+    runs = 20
+    if args:
+        runs = int(args[0])
+
+    subprocess.call(
+        args=[sys.executable, '-c', IMPORTTIME % HOT_PATH],
+        cwd=_topdir(),
+        )
+
+    print
+    for name, code in (('interpreter only', 'pass'),
+                       ('hot path', HOT_PATH),
+                       ('hot path + old eager imports', EAGER + HOT_PATH)):
+        best = min(run(code) for i in xrange(runs))
+        print '%-30s best of %d: %7.2f ms' % (name, runs, best * 1000)
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,101 @@
+"""
+Benchmark repository discovery on a synthetic tree of many repos.
+
+Run as ``python -m gitosis.test.bench_walk [COUNT]``.
+"""
+
+import errno
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+from gitosis import util
+
+def make_tree(topdir, count):
+    # team/project/NAME.git, with the usual directories inside each
+    # repo and some non-repo directories along the way
+    for i in xrange(count):
+        team = os.path.join(topdir, 'team%d' % (i // 1000))
+        project = os.path.join(team, 'project%d' % (i // 50))
+        if i % 1000 == 0:
+            os.mkdir(team)
+            os.mkdir(os.path.join(team, 'attic'))
+        if i % 50 == 0:
+            os.mkdir(project)
+            os.mkdir(os.path.join(project, 'docs'))
+        repo = os.path.join(project, 'repo%d.git' % i)
+        os.mkdir(repo)
+        for sub in ('objects', 'refs', 'hooks', 'info'):
+            os.mkdir(os.path.join(repo, sub))
+        file(os.path.join(repo, 'HEAD'), 'w').close()
+
+def os_walk_names(repositories):
+    # what RepositoryDir.names did before walk_repositories
+    def _error(e):
+        if e.errno == errno.ENOENT:
+            pass
+        else:
+            raise e
+
+    for (dirpath, dirnames, filenames) \
+            in os.walk(repositories, onerror=_error):
+        if dirpath == repositories:
+            reldir = '.'
+        else:
+            reldir = dirpath[len(repositories + '/'):]
+
+        to_recurse = []
+        repos = []
+        for dirname in dirnames:
+            if dirname.endswith('.git'):
+                repos.append(dirname)
+            else:
+                to_recurse.append(dirname)
+        dirnames[:] = to_recurse
+
+        for repo in repos:
+            name, ext = os.path.splitext(repo)
+            if reldir != '.':
+                name = os.path.join(reldir, name)
+            yield name
+
+def best_of(n, walker, topdir):
+    best = None
+    for i in xrange(n):
+        start = time.time()
+        found = 0
+        for name in walker(topdir):
+            found += 1
+        took = time.time() - start
+        if best is None or took < best:
+            best = took
+    return best, found
+
+def main(args):
+    count = 50000
+    if args:
+        count = int(args[0])
+
+    tmp = tempfile.mkdtemp(prefix='gitosis-bench-walk-')
+    try:
+        start = time.time()
+        make_tree(tmp, count)
+        print 'made %d repos in %.1f s, listing with %s' % (
+            count, time.time() - start,
+            util._get_scandir() and 'scandir' or 'listdir and stat')
+
+        assert sorted(os_walk_names(tmp)) \
+            == sorted(util.walk_repositories(tmp))
+
+        for label, walker in [('os.walk', os_walk_names),
+                              ('walk_repositories',
+                               util.walk_repositories)]:
+            took, found = best_of(3, walker, tmp)
+            print '  %-18s %8.3f s  %d repos' % (label, took, found)
+    finally:
+        shutil.rmtree(tmp)
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
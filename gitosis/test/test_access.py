@@ -4,6 +4,7 @@ import logging
 from ConfigParser import RawConfigParser
 
 from gitosis import access
+from gitosis.test.util import gitolite
 
 def test_write_no_simple():
     cfg = RawConfigParser()
@@ -148,3 +149,42 @@ def test_dotgit():
     cfg.set('group fooers', 'writable', 'foo/bar')
     eq(access.haveAccess(config=cfg, user='jdoe', mode='writable', path='foo/bar.git'),
        ('repositories', 'foo/bar'))
+
+def test_gitolite_nestedGroup():
+    cfg = gitolite("""\
+@devs = jdoe
+@staff = @devs
+repo foo/bar
+	RW+ = @staff
+""")
+    eq(access.haveAccess(config=cfg, user='jdoe', mode='RW+', path='foo/bar'),
+       ('repositories', 'foo/bar'))
+    eq(access.haveAccess(config=cfg, user='wsmith', mode='RW+', path='foo/bar'),
+       None)
+
+def test_gitolite_all():
+    cfg = gitolite("""\
+gitosis
+	repositories = some/path
+repo foo
+	path_regex = ^foo/
+	R = @all
+""")
+    eq(access.haveAccess(config=cfg, user='jdoe', mode='R', path='foo/x.git'),
+       ('some/path', 'foo/x'))
+    eq(access.haveAccess(config=cfg, user='jdoe', mode='RW+', path='foo/x'),
+       None)
+
+def test_getAccess_strongest():
+    cfg = gitolite("""\
+@devs = jdoe
+repo foo
+	RW+ = @devs
+	R = jdoe wsmith
+""")
+    eq(access.getAccess(config=cfg, user='jdoe', path='foo.git'),
+       ('RW+', 'repositories', 'foo', '@devs'))
+    eq(access.getAccess(config=cfg, user='wsmith', path='foo'),
+       ('R', 'repositories', 'foo', None))
+    eq(access.getAccess(config=cfg, user='danny', path='foo'), None)
+    eq(access.getAccess(config=cfg, user='jdoe', path='bar'), None)
@@ -0,0 +1,125 @@
+from nose.tools import eq_ as eq
+from gitosis.test.util import assert_raises
+
+import os
+import threading
+
+from gitosis import accessd
+from gitosis import app
+from gitosis import repository
+from gitosis import serve
+from gitosis.test.util import maketemp, writeFile
+
+CONFIG = """\
+gitosis
+	repositories = %(repos)s
+	generate-files-in = %(generated)s
+repo new
+	path_regex = ^new/
+	RW+ = jdoe
+repo foo
+	RW+ = jdoe
+	R = wsmith
+"""
+
+class _Options(object):
+    def __init__(self, config):
+        self.config = config
+
+def _start(tmp):
+    repos = os.path.join(tmp, 'repositories')
+    os.mkdir(repos)
+    repository.init(os.path.join(repos, 'foo.git'))
+    config = os.path.join(tmp, 'gitosis.conf')
+    writeFile(config, CONFIG % dict(repos=repos, generated=tmp))
+
+    def read_config(cfg):
+        app.App().read_config(_Options(config), cfg)
+
+    path = os.path.join(tmp, 'accessd.sock')
+    server = accessd.AccessServer(path, read_config)
+    server.config_path = config
+    thread = threading.Thread(target=server.serve_forever)
+    thread.setDaemon(True)
+    thread.start()
+    return (server, path, repos)
+
+def test_query_unavailable():
+    tmp = maketemp()
+    assert_raises(
+        serve.AccessdUnavailable,
+        serve.ask_accessd,
+        os.path.join(tmp, 'nonexistent.sock'),
+        'jdoe',
+        "git-upload-pack 'foo'",
+        )
+
+def test_query_serve():
+    tmp = maketemp()
+    server, path, repos = _start(tmp)
+    try:
+        eq(serve.ask_accessd(path, 'jdoe', "git-receive-pack 'foo'"),
+           "git-receive-pack '%s/foo.git'" % repos)
+        eq(serve.ask_accessd(path, 'wsmith', "git upload-pack 'foo.git'"),
+           "git upload-pack '%s/foo.git'" % repos)
+        assert_raises(
+            serve.WriteAccessDenied,
+            serve.ask_accessd, path, 'wsmith', "git-receive-pack 'foo'")
+        assert_raises(
+            serve.ReadAccessDenied,
+            serve.ask_accessd, path, 'danny', "git-upload-pack 'foo'")
+        assert_raises(
+            serve.UnknownCommandError,
+            serve.ask_accessd, path, 'jdoe', "evil 'foo'")
+    finally:
+        server.shutdown()
+        server.server_close()
+
+def test_query_reload():
+    tmp = maketemp()
+    server, path, repos = _start(tmp)
+    try:
+        assert_raises(
+            serve.ReadAccessDenied,
+            serve.ask_accessd, path, 'danny', "git-upload-pack 'foo'")
+
+        # published the way the post-update hook does it
+        config = os.path.join(tmp, 'gitosis.conf')
+        writeFile(config, (CONFIG + '\tR = danny\n') % dict(
+            repos=repos, generated=tmp))
+
+        eq(serve.ask_accessd(path, 'danny', "git-upload-pack 'foo'"),
+           "git-upload-pack '%s/foo.git'" % repos)
+    finally:
+        server.shutdown()
+        server.server_close()
+
+def test_query_concurrent():
+    tmp = maketemp()
+    server, path, repos = _start(tmp)
+    try:
+        # a repository being created doesn't hold up access checks
+        server.create_lock.acquire()
+        try:
+            eq(serve.ask_accessd(path, 'wsmith', "git-upload-pack 'foo'",
+                                 timeout=5.0),
+               "git-upload-pack '%s/foo.git'" % repos)
+        finally:
+            server.create_lock.release()
+
+        # and creating the same one from many threads makes it once
+        got = []
+        def push():
+            got.append(serve.ask_accessd(
+                path, 'jdoe', "git-receive-pack 'new/bar'"))
+        threads = [threading.Thread(target=push) for i in xrange(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        eq(got, ["git-receive-pack '%s/new/bar.git'" % repos] * 8)
+        eq(repository.has_initial_commit(
+            os.path.join(repos, 'new', 'bar.git')), False)
+    finally:
+        server.shutdown()
+        server.server_close()
@@ -0,0 +1,58 @@
+from nose.tools import eq_ as eq
+
+import os
+import sys
+from cStringIO import StringIO
+
+from gitosis import app
+from gitosis import authorized_keys
+from gitosis import ssh
+from gitosis.gitoliteConfig import GitoliteConfig
+from gitosis.test.test_ssh import KEY_ED25519
+from gitosis.test.util import maketemp, mkdir, writeFile
+
+def _run(cfg, index, *args):
+    main = authorized_keys.Main()
+    options = app.Options(index=index)
+    old_stdout = sys.stdout
+    sys.stdout = StringIO()
+    try:
+        main.handle_args(main.create_parser(), cfg, options, list(args))
+        return sys.stdout.getvalue()
+    finally:
+        sys.stdout = old_stdout
+
+def _index(tmp):
+    keydir = os.path.join(tmp, 'keys')
+    mkdir(keydir)
+    writeFile(os.path.join(keydir, 'jdoe.pub'), KEY_ED25519+'\n')
+    path = os.path.join(tmp, 'authorized_keys.cdb')
+    ssh.writeKeyIndex(path=path, keydir=keydir)
+    return path
+
+LINE = ('command="gitosis-serve jdoe",no-port-forwarding,no-X11-forwarding,'
+        +'no-agent-forwarding,no-pty %s\n' % KEY_ED25519)
+
+def test_fingerprint():
+    tmp = maketemp()
+    got = _run(GitoliteConfig(), _index(tmp),
+               'SHA256:NI93Uc1CvCk2KFOmOWXGjXOYD1rTRXi7XoBBJUOde54')
+    eq(got, LINE)
+
+def test_typeAndKey():
+    tmp = maketemp()
+    got = _run(GitoliteConfig(), _index(tmp), *KEY_ED25519.split()[:2])
+    eq(got, LINE)
+
+def test_unknown():
+    tmp = maketemp()
+    got = _run(GitoliteConfig(), _index(tmp), 'SHA256:nope')
+    eq(got, '')
+
+def test_indexFromConfig():
+    tmp = maketemp()
+    cfg = GitoliteConfig()
+    cfg.load(['gitosis', 'ssh-key-index-path = %s' % _index(tmp)])
+    got = _run(cfg, None,
+               'SHA256:NI93Uc1CvCk2KFOmOWXGjXOYD1rTRXi7XoBBJUOde54')
+    eq(got, LINE)
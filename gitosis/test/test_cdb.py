@@ -0,0 +1,53 @@
+from nose.tools import eq_ as eq
+from gitosis.test.util import assert_raises
+
+from cStringIO import StringIO
+
+from gitosis import cdb
+
+def _build(items):
+    f = StringIO()
+    writer = cdb.CdbWriter(f)
+    for key, value in items:
+        writer.add(key, value)
+    writer.finish()
+    return cdb.Cdb(StringIO(f.getvalue()))
+
+def test_hash():
+    # same as the reference implementation
+    eq(cdb.cdb_hash(''), 5381)
+    eq(cdb.cdb_hash('a'), 177604)
+    eq(cdb.cdb_hash('one'), 193420161)
+
+def test_empty():
+    db = _build([])
+    eq(db.get('foo'), None)
+    eq(db.get('', 'dflt'), 'dflt')
+
+def test_simple():
+    db = _build([('one', '1'), ('two', '2'), ('', 'empty')])
+    eq(db.get('one'), '1')
+    eq(db.get('two'), '2')
+    eq(db.get(''), 'empty')
+    eq(db.get('three'), None)
+
+def test_duplicates():
+    db = _build([('k', 'first'), ('other', 'x'), ('k', 'second')])
+    eq(db.get('k'), 'first')
+    eq(list(db.getall('k')), ['first', 'second'])
+
+def test_many():
+    items = [('key%d' % i, 'value%d' % i) for i in xrange(5000)]
+    db = _build(items)
+    for key, value in items:
+        eq(db.get(key), value)
+    eq(db.get('key5000'), None)
+
+def test_truncated():
+    f = StringIO()
+    writer = cdb.CdbWriter(f)
+    writer.add('one', '1')
+    writer.finish()
+    db = cdb.Cdb(StringIO(f.getvalue()[:2060]))
+    e = assert_raises(cdb.CdbError, db.get, 'one')
+    assert str(e).startswith('Invalid constant database: truncated')
@@ -0,0 +1,82 @@
+from nose.tools import eq_ as eq
+
+import os
+import subprocess
+import sys
+
+from gitosis import daemon_access
+from gitosis.test.util import assert_raises, gitolite, maketemp, writeFile
+
+CONFIG = """\
+gitosis
+	repositories = %s
+@public = daemon
+repo foo
+	R = daemon
+repo bar
+	R = jdoe
+repo team
+	path_regex = ^team/
+	R = daemon @public
+repo public
+	R = @public
+repo secret
+	RW+ = alice
+	R = @all
+"""
+
+def test_check():
+    tmp = maketemp()
+    cfg = gitolite(CONFIG % tmp)
+    eq(daemon_access.check(
+        cfg, 'upload-pack', os.path.join(tmp, 'foo.git')), 'foo')
+    eq(daemon_access.check(
+        cfg, 'upload-archive', os.path.join(tmp, 'team', 'x.git') + '/'),
+       'team/x')
+    assert_raises(
+        daemon_access.NotPublishedError,
+        daemon_access.check,
+        cfg, 'upload-pack', os.path.join(tmp, 'bar.git'))
+    assert_raises(
+        daemon_access.NotPublishedError,
+        daemon_access.check,
+        cfg, 'upload-pack', os.path.join(tmp, 'nonexistent.git'))
+    # only daemon listed by name publishes, like git-daemon-export-ok
+    assert_raises(
+        daemon_access.NotPublishedError,
+        daemon_access.check,
+        cfg, 'upload-pack', os.path.join(tmp, 'public.git'))
+    assert_raises(
+        daemon_access.NotPublishedError,
+        daemon_access.check,
+        cfg, 'upload-pack', os.path.join(tmp, 'secret.git'))
+    assert_raises(
+        daemon_access.NotPublishedError,
+        daemon_access.check,
+        cfg, 'upload-pack', '/elsewhere/foo.git')
+    assert_raises(
+        daemon_access.UnknownServiceError,
+        daemon_access.check,
+        cfg, 'receive-pack', os.path.join(tmp, 'foo.git'))
+
+def _run(tmp, service, path):
+    config = os.path.join(tmp, 'gitosis.conf')
+    writeFile(config, CONFIG % tmp)
+    child = subprocess.Popen(
+        args=[sys.executable, '-c',
+              'from gitosis.daemon_access import Main; Main.run()',
+              '--config', config,
+              service, path, 'example.com', 'example.com',
+              '127.0.0.1', '9418'],
+        cwd=os.path.dirname(os.path.dirname(os.path.dirname(
+            os.path.abspath(__file__)))),
+        stdout=subprocess.PIPE,
+        )
+    got = child.communicate()[0]
+    return (child.returncode, got)
+
+def test_main():
+    tmp = maketemp()
+    eq(_run(tmp, 'upload-pack', os.path.join(tmp, 'foo.git')), (0, ''))
+    eq(_run(tmp, 'upload-pack', os.path.join(tmp, 'bar.git')),
+       (1, 'Repository not published\n'))
@@ -0,0 +1,87 @@
+from nose.tools import eq_ as eq
+
+import os
+
+from gitosis import gitconfig
+from gitosis.test.util import assert_raises, maketemp, readFile, writeFile
+
+def _config(text):
+    return gitconfig.GitConfig(text.splitlines(True))
+
+def test_get():
+    config = _config('''\
+[core]
+	bare = true
+# comment
+[ gitweb ]
+	Owner = John  Doe ; the owner
+	url = "http://example.com/#foo"
+	multi = one\\
+two
+[remote "origin"]
+	url = git://example.com/foo
+[gitweb]
+	owner = Jane Doe
+[Foo.Bar]
+	flag
+''')
+    eq(config.get('core', 'bare'), 'true')
+    eq(config.get('gitweb', 'owner'), 'Jane Doe')
+    eq(config.get('gitweb', 'url'), 'http://example.com/#foo')
+    eq(config.get('gitweb', 'multi'), 'onetwo')
+    eq(config.get('remote', 'url', 'origin'), 'git://example.com/foo')
+    eq(config.get('remote', 'url'), None)
+    eq(config.get('foo', 'flag', 'bar'), True)
+    eq(config.get('gitweb', 'nonexistent'), None)
+    eq(config.get_all('gitweb', 'owner'), ['John  Doe', 'Jane Doe'])
+    eq(config.get_all('gitweb', 'nonexistent'), [])
+
+def test_set_new_section():
+    config = _config('[core]\n\tbare = true')
+    eq(config.set('gitweb', 'owner', 'jdoe'), True)
+    eq(config.data(), '[core]\n\tbare = true\n[gitweb]\n\towner = jdoe\n')
+    eq(config.set('gitweb', 'owner', 'jdoe'), False)
+
+def test_set_existing_section():
+    config = _config('[gitweb ]\n\turl = x\n\n[core]\n\tbare = true\n')
+    eq(config.set('gitweb', 'owner', 'John Doe'), True)
+    eq(config.data(), '[gitweb ]\n\turl = x\n\towner = John Doe\n'
+       + '\n[core]\n\tbare = true\n')
+
+def test_set_replaces_all():
+    config = _config('[gitweb]\n\towner = a\n[core]\n\tbare = true\n'
+                     + '[gitweb] owner = b\n\tOWNER = c\n')
+    eq(config.set('gitweb', 'owner', 'd'), True)
+    eq(config.data(), '[gitweb]\n[core]\n\tbare = true\n'
+       + '[gitweb]\n\towner = d\n')
+    eq(config.get('gitweb', 'owner'), 'd')
+
+def test_set_quotes():
+    config = _config('')
+    config.set('gitweb', 'owner', ' John "JD" Doe; #1 ')
+    eq(config.data(), '[gitweb]\n\towner = " John \\"JD\\" Doe; #1 "\n')
+    eq(_config(config.data()).get('gitweb', 'owner'), ' John "JD" Doe; #1 ')
+
+def test_bad():
+    assert_raises(gitconfig.GitConfigError, _config, 'bare = true\n')
+    assert_raises(gitconfig.GitConfigError, _config, '[core]\n\tx = "a\n')
+
+def test_read_write_cache():
+    tmp = maketemp()
+    path = os.path.join(tmp, 'config')
+    writeFile(path, '[core]\n\tbare = true\n')
+    config = gitconfig.read(path)
+    eq(config.get('core', 'bare'), 'true')
+    assert gitconfig.read(path) is not config
+    eq(gitconfig._cache[path][0], gitconfig._stamp(os.stat(path)))
+
+    config.set('core', 'bare', 'false')
+    eq(gitconfig.write(path, config), True)
+    eq(readFile(path), '[core]\n\tbare = false\n')
+    st = os.stat(path)
+    eq(gitconfig.write(path, gitconfig.read(path)), False)
+    eq(os.stat(path).st_ino, st.st_ino)
+
+    # changed behind our back
+    writeFile(path, '[core]\n\tbare = maybe\n')
+    eq(gitconfig.read(path).get('core', 'bare'), 'maybe')
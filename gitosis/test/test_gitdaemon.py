@@ -4,6 +4,7 @@ import os
 from ConfigParser import RawConfigParser
 
 from gitosis import gitdaemon
+from gitosis import gitweb
 from gitosis.test.util import maketemp, writeFile
 
 def exported(path):
@@ -153,3 +154,46 @@ def test_git_daemon_export_ok_allowed_global():
     eq(exported(os.path.join(tmp, 'foo.git')), True)
     eq(exported(os.path.join(tmp, 'quux.git')), True)
     eq(exported(os.path.join(tmp, 'thud.git')), False)
+
+def test_daemonProp_noop():
+    from gitosis.gitoliteConfig import GitoliteConfig
+    tmp = maketemp()
+    path = os.path.join(tmp, 'foo.git')
+    os.mkdir(path)
+    cfg = GitoliteConfig()
+    cfg.load(['repo foo', 'R = daemon'])
+    prop = gitdaemon.DaemonProp()
+    eq(prop.trigger(cfg, tmp, 'foo', 'foo'), True)
+    eq(exported(path), True)
+    st = os.stat(gitdaemon.export_ok_path(path))
+    eq(prop.trigger(cfg, tmp, 'foo', 'foo'), False)
+    eq(os.stat(gitdaemon.export_ok_path(path)).st_ino, st.st_ino)
+
+    cfg = GitoliteConfig()
+    cfg.load(['repo foo', 'R = jdoe'])
+    eq(prop.trigger(cfg, tmp, 'foo', 'foo'), True)
+    eq(exported(path), False)
+    eq(prop.trigger(cfg, tmp, 'foo', 'foo'), False)
+
+def test_daemonProp_sharedRepo():
+    from gitosis.gitoliteConfig import GitoliteConfig
+    tmp = maketemp()
+    os.mkdir(os.path.join(tmp, 'sub'))
+    for name in ('one', 'two', 'three'):
+        os.mkdir(os.path.join(tmp, 'sub', name + '.git'))
+    cfg = GitoliteConfig()
+    cfg.load(['repo sub', 'path_regex = ^sub/', 'R = daemon'])
+    prop = gitdaemon.DaemonProp()
+    other = gitweb.GitwebProp()
+    for name in ('one', 'two', 'three'):
+        eq(prop.trigger(cfg, tmp, 'sub/' + name, 'sub'), True)
+        eq(other.trigger(cfg, tmp, 'sub/' + name, 'sub'), True)
+    eq(other.projects.disallow,
+       set(['sub/one.git', 'sub/two.git', 'sub/three.git']))
+    assert exported(os.path.join(tmp, 'sub', 'two.git'))
+    eq(prop.trigger(cfg, tmp, 'sub/two', 'sub'), False)
+
+    # a change to the same config object is seen right away
+    cfg.set_repo('sub', 'R', ['jdoe'])
+    eq(prop.trigger(cfg, tmp, 'sub/two', 'sub'), True)
+    eq(exported(os.path.join(tmp, 'sub', 'two.git')), False)
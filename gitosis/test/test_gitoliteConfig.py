@@ -0,0 +1,133 @@
+from nose.tools import eq_ as eq
+
+import os
+
+from gitosis import gitoliteConfig
+from gitosis.test.util import maketemp, writeFile, assert_raises
+
+CONFIG = """\
+gitosis
+	repositories = repos
+
+@admins = jdoe 'john smith'
+
+repo foo
+	RW+ = @admins
+	R = daemon gitweb
+	description = blah blah
+
+repo bar
+	path_regex = ^bar/
+	R = @all
+"""
+
+def test_snapshot_roundtrip():
+    tmp = maketemp()
+    path = os.path.join(tmp, 'gitosis.conf')
+    writeFile(path, CONFIG)
+    gitoliteConfig.write_snapshot(path)
+    assert os.path.exists(gitoliteConfig.snapshot_path(path))
+
+    cfg = gitoliteConfig.GitoliteConfig()
+    eq(gitoliteConfig.read_snapshot(cfg, path, CONFIG), True)
+    eq(cfg.get_gitosis('repositories'), 'repos')
+    eq(cfg.get_group_members('@admins'), frozenset(['jdoe', 'john smith']))
+    eq(cfg.get_repo('foo', 'RW+'), frozenset(['@admins']))
+    eq(cfg.get_repo('foo', 'description'), 'blah blah')
+    eq(cfg.lookup_repo('bar/baz'), 'bar')
+
+def test_snapshot_stale():
+    tmp = maketemp()
+    path = os.path.join(tmp, 'gitosis.conf')
+    writeFile(path, CONFIG)
+    gitoliteConfig.write_snapshot(path)
+
+    cfg = gitoliteConfig.GitoliteConfig()
+    eq(gitoliteConfig.read_snapshot(cfg, path, CONFIG + '\n@x = y\n'),
+       False)
+    eq(cfg.repos(), [])
+
+def test_snapshot_missing():
+    tmp = maketemp()
+    path = os.path.join(tmp, 'gitosis.conf')
+    writeFile(path, CONFIG)
+    cfg = gitoliteConfig.GitoliteConfig()
+    eq(gitoliteConfig.read_snapshot(cfg, path, CONFIG), False)
+
+def test_snapshot_followsSymlink():
+    tmp = maketemp()
+    path = os.path.join(tmp, 'gitosis.conf')
+    writeFile(path, CONFIG)
+    link = os.path.join(tmp, 'link.conf')
+    os.symlink(path, link)
+    gitoliteConfig.write_snapshot(link)
+    assert os.path.exists(path + '.snapshot')
+
+    cfg = gitoliteConfig.GitoliteConfig()
+    eq(gitoliteConfig.read_snapshot(cfg, link, CONFIG), True)
+
+def test_lookup_repo_declarationOrder():
+    cfg = gitoliteConfig.GitoliteConfig()
+    cfg.load("""\
+repo zzz
+	path_regex = ^team/
+repo aaa
+	path_regex = ^team/special/
+repo team/exact
+	R = @all
+""".splitlines())
+    eq(cfg.repos(), ['zzz', 'aaa', 'team/exact'])
+    eq(cfg.lookup_repo('team/special/x'), 'zzz')
+    eq(cfg.lookup_repo('team/exact'), 'team/exact')
+    eq(cfg.lookup_repo('other'), None)
+
+def test_path_regexes_cached():
+    cfg = gitoliteConfig.GitoliteConfig()
+    cfg.load(['repo team', 'path_regex = ^team/'])
+    eq(cfg.lookup_repo('team/x'), 'team')
+    eq(cfg._GitoliteConfig__path_regexes, [('team', '^team/')])
+    cfg.set_repo('other', 'path_regex', '^other/')
+    eq(cfg.lookup_repo('other/x'), 'other')
+    eq(cfg._GitoliteConfig__path_regexes,
+       [('team', '^team/'), ('other', '^other/')])
+    cfg.load(['repo more', 'path_regex = ^more/'])
+    eq(cfg.lookup_repo('more/x'), 'more')
+
+def test_acls_shared():
+    cfg = gitoliteConfig.GitoliteConfig()
+    cfg.load("""\
+@devs = jdoe wsmith
+repo foo
+	RW+ = @devs
+	R = gitweb daemon
+repo bar
+	RW+ = @devs
+	R = daemon  gitweb
+""".splitlines())
+    eq(cfg.get_repo('foo', 'R'), frozenset(['daemon', 'gitweb']))
+    assert cfg.get_repo('foo', 'R') is cfg.get_repo('bar', 'R')
+    assert cfg.get_repo('foo', 'RW+') is cfg.get_repo('bar', 'RW+')
+
+def test_acls_badQuoting():
+    cfg = gitoliteConfig.GitoliteConfig()
+    cfg.load("""\
+@devs = 'jdoe
+@ops = wsmith
+repo foo
+	R = @ops 'x
+	RW+ = @ops
+""".splitlines())
+    assert_raises(gitoliteConfig.GitoliteConfigException,
+                  cfg.get_group_members, '@devs')
+    assert_raises(gitoliteConfig.GitoliteConfigException,
+                  cfg.get_repo, 'foo', 'R')
+    eq(cfg.get_repo('foo', 'RW+'), frozenset(['@ops']))
+    eq(cfg.get_membership('wsmith'), ('@ops', '@all'))
+
+def test_serialize_sorted():
+    cfg = gitoliteConfig.GitoliteConfig()
+    cfg.set_group_members('@admins', ['wsmith', 'jdoe'])
+    cfg.set_repo('foo', 'RW+', ['@admins', 'danny'])
+    got = cfg.serialize().getvalue()
+    assert '@admins\t = jdoe wsmith\n' in got, got
+    assert '\tRW+\t = @admins danny\n' in got, got
@@ -222,3 +222,155 @@ def test_description_again():
         )
     got = readFile(os.path.join(path, 'description'))
     eq(got, 'foodesc\n')
+
+def test_descriptionProp_noop():
+    from gitosis.gitoliteConfig import GitoliteConfig
+    tmp = maketemp()
+    path = os.path.join(tmp, 'foo.git')
+    os.mkdir(path)
+    cfg = GitoliteConfig()
+    cfg.load(['repo foo', 'description = foodesc'])
+    prop = gitweb.DescriptionProp()
+    eq(prop.trigger(cfg, tmp, 'foo', 'foo'), True)
+    got = readFile(os.path.join(path, 'description'))
+    eq(got, 'foodesc\n')
+    st = os.stat(os.path.join(path, 'description'))
+    eq(prop.trigger(cfg, tmp, 'foo', 'foo'), False)
+    eq(os.stat(os.path.join(path, 'description')).st_ino, st.st_ino)
+    eq(prop.trigger(cfg, tmp, 'foo', 'bar'), None)
+
+def test_ownerProp_noop():
+    from gitosis.gitoliteConfig import GitoliteConfig
+    tmp = maketemp()
+    path = os.path.join(tmp, 'foo.git')
+    os.mkdir(path)
+    config = os.path.join(path, 'config')
+    writeFile(config, '[core]\n\tbare = true\n[gitweb]\n\towner = Old\n')
+    cfg = GitoliteConfig()
+    cfg.load(['repo foo', 'owner = John Doe'])
+    prop = gitweb.OwnerProp()
+    eq(prop.trigger(cfg, tmp, 'foo', 'foo'), True)
+    eq(readFile(config),
+       '[core]\n\tbare = true\n[gitweb]\n\towner = John Doe\n')
+    st = os.stat(config)
+    eq(prop.trigger(cfg, tmp, 'foo', 'foo'), False)
+    eq(os.stat(config).st_ino, st.st_ino)
+
+def test_set_owner():
+    got = gitweb.set_owner(['[core]\n', '\tbare = true\n'], 'jdoe')
+    eq(got, ['[core]\n', '\tbare = true\n', '[gitweb]\n', '\towner = jdoe\n'])
+    got = gitweb.set_owner(
+        ['[gitweb]\n', '\towner = x\n', '[core]\n'], 'jdoe')
+    eq(got, ['[gitweb]\n', '\towner = jdoe\n', '[core]\n'])
+    got = gitweb.set_owner(['[gitweb]\n', '[core]\n'], 'jdoe')
+    eq(got, ['[gitweb]\n', '\towner = jdoe\n', '[core]\n'])
+
+def test_projectList_update():
+    tmp = maketemp()
+    path = os.path.join(tmp, 'projects.list')
+    writeFile(path, 'zed.git\nfoo.git John+Doe\n\nbar.git\nold.git\n')
+    prop = gitweb.GitwebProp()
+    prop.action(tmp, 'new', 'new', True)
+    prop.action(tmp, 'bar', 'bar', True)
+    prop.action(tmp, 'old', 'old', False)
+    prop.action(tmp, 'never', 'never', False)
+    gitweb.ProjectList(path).update(prop.projects)
+    eq(readFile(path), 'bar.git\nfoo.git John+Doe\nnew.git\nzed.git')
+
+    st = os.stat(path)
+    gitweb.ProjectList(path).update(prop.projects)
+    eq(os.stat(path).st_ino, st.st_ino)
+
+def test_projectList_update_sorted():
+    tmp = maketemp()
+    path = os.path.join(tmp, 'projects.list')
+    writeFile(path, 'a.git\nc.git John+Doe\nc.git John+Doe\ne.git\n')
+    projects = gitweb.Projects()
+    projects.add('d.git', True)
+    projects.add('b.git', True)
+    projects.add('e.git', False)
+    gitweb.ProjectList(path).update(projects)
+    eq(readFile(path), 'a.git\nb.git\nc.git John+Doe\nd.git')
+
+def test_projectList_refresh():
+    tmp = maketemp()
+    path = os.path.join(tmp, 'projects.list')
+    writeFile(path, 'old.git\n')
+    prop = gitweb.GitwebProp()
+    prop.action(tmp, 'b', 'b', True)
+    prop.action(tmp, 'a', 'a', True)
+    gitweb.ProjectList(path).refresh(prop.projects)
+    eq(readFile(path), 'a.git\nb.git')
+
+def test_projects_separate():
+    # props of different runs don't see each other's projects
+    tmp = maketemp()
+    one = gitweb.GitwebProp()
+    two = gitweb.GitwebProp()
+    one.action(tmp, 'foo', 'foo', True)
+    two.action(tmp, 'bar', 'bar', True)
+    two.action(tmp, 'bar', 'bar', False)
+    eq(one.projects.allow, set(['foo.git']))
+    eq(two.projects.allow, set())
+    eq(two.projects.disallow, set(['bar.git']))
+
+def test_ownerProp_variants():
+    from gitosis.gitoliteConfig import GitoliteConfig
+    tmp = maketemp()
+    path = os.path.join(tmp, 'foo.git')
+    os.mkdir(path)
+    config = os.path.join(path, 'config')
+    writeFile(config, '[gitweb ]\n\towner = Old\n[core]\n\tbare = true\n'
+              + '[gitweb]\n\towner = Older\n')
+    cfg = GitoliteConfig()
+    cfg.load(['repo foo', 'owner = John Doe'])
+    prop = gitweb.OwnerProp()
+    eq(prop.trigger(cfg, tmp, 'foo', 'foo'), True)
+    eq(readFile(config),
+       '[gitweb ]\n[core]\n\tbare = true\n[gitweb]\n\towner = John Doe\n')
+    eq(prop.trigger(cfg, tmp, 'foo', 'foo'), False)
+
+def test_ownerProp_duplicate():
+    from gitosis.gitoliteConfig import GitoliteConfig
+    tmp = maketemp()
+    path = os.path.join(tmp, 'foo.git')
+    os.mkdir(path)
+    config = os.path.join(path, 'config')
+    # the last one is right already, the first still has to go
+    writeFile(config, '[gitweb]\n\towner = Old\n'
+              + '[gitweb]\n\towner = John Doe\n')
+    cfg = GitoliteConfig()
+    cfg.load(['repo foo', 'owner = John Doe'])
+    prop = gitweb.OwnerProp()
+    eq(prop.trigger(cfg, tmp, 'foo', 'foo'), True)
+    eq(readFile(config), '[gitweb]\n[gitweb]\n\towner = John Doe\n')
+    eq(prop.trigger(cfg, tmp, 'foo', 'foo'), False)
+
+def test_ownerProp_badConfig():
+    from gitosis.gitoliteConfig import GitoliteConfig
+    tmp = maketemp()
+    path = os.path.join(tmp, 'foo.git')
+    os.mkdir(path)
+    config = os.path.join(path, 'config')
+    writeFile(config, 'owner = Old\n')
+    cfg = GitoliteConfig()
+    cfg.load(['repo foo', 'owner = John Doe'])
+    prop = gitweb.OwnerProp()
+    # skipped, not raised out of the hook
+    eq(prop.trigger(cfg, tmp, 'foo', 'foo'), None)
+    eq(readFile(config), 'owner = Old\n')
+
+def test_gitwebProp_noop():
+    tmp = maketemp()
+    path = os.path.join(tmp, 'projects.list')
+    writeFile(path, 'foo.git John+Doe\nbar.git\n')
+    projects = gitweb.Projects(gitweb.ProjectList(path).listed())
+    prop = gitweb.GitwebProp(projects)
+    # already listed, or not listed and denied: nothing to change
+    eq(prop.apply(tmp, 'foo', 'foo', True), False)
+    eq(prop.apply(tmp, 'baz', 'baz', False), False)
+    eq(prop.apply(tmp, 'bar', 'bar', False), True)
+    eq(prop.apply(tmp, 'new', 'new', True), True)
+    eq(prop.apply(tmp, 'new', 'new', True), False)
+    # nothing known without the list
+    eq(gitweb.GitwebProp().apply(tmp, 'foo', 'foo', True), True)
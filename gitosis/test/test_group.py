@@ -1,8 +1,11 @@
 from nose.tools import eq_ as eq, assert_raises
 
+import pickle
 from ConfigParser import RawConfigParser
+from collections import OrderedDict
 
 from gitosis import group
+from gitosis.test.util import gitolite
 
 def test_no_emptyConfig():
     cfg = RawConfigParser()
@@ -136,3 +139,122 @@ def test_no_recurse_loop():
     gen = group.getMembership(config=cfg, user='jdoe')
     eq(gen.next(), 'all')
     assert_raises(StopIteration, gen.next)
+
+def test_index_none():
+    cfg = gitolite('')
+    eq(list(group.getMembership(config=cfg, user='jdoe')), ['@all'])
+
+def test_index_recurse():
+    cfg = gitolite("""\
+@hackers = wsmith @smackers
+@smackers = danny @snackers
+@snackers = @whackers foo
+@whackers = jdoe
+@other = danny
+""")
+    eq(list(group.getMembership(config=cfg, user='jdoe')),
+       ['@whackers', '@snackers', '@smackers', '@hackers', '@all'])
+    eq(cfg.get_membership('danny'), ('@smackers', '@hackers', '@other', '@all'))
+    eq(cfg.get_group_closure('@snackers'), ('@smackers', '@hackers'))
+    eq(cfg.get_group_closure('@hackers'), ())
+
+def test_index_all():
+    cfg = gitolite("""\
+@everybody = @all
+@readers = @everybody
+@admins = jdoe
+""")
+    eq(cfg.get_membership('nobody'), ('@everybody', '@readers', '@all'))
+    eq(cfg.get_membership('jdoe'),
+       ('@admins', '@everybody', '@readers', '@all'))
+    eq(cfg.get_group_closure('@admins'), ('@everybody', '@readers'))
+
+def test_index_loop():
+    cfg = gitolite("""\
+@hackers = @smackers
+@smackers = @hackers jdoe
+""")
+    eq(cfg.get_membership('jdoe'), ('@smackers', '@hackers', '@all'))
+    eq(cfg.get_membership('wsmith'), ('@all',))
+
+def test_index_reload():
+    cfg = gitolite('@hackers = jdoe\n')
+    eq(cfg.get_membership('jdoe'), ('@hackers', '@all'))
+    cfg.set_group_members('@hackers', ['wsmith'])
+    eq(cfg.get_membership('jdoe'), ('@all',))
+
+def test_resolver_cycle():
+    resolver = group.GroupResolver(OrderedDict([
+        ('jdoe', ['@a']),
+        ('@a', ['@b']),
+        ('@b', ['@c']),
+        ('@c', ['@a', '@top']),
+        ]))
+    eq(resolver.resolve('jdoe'), ('@a', '@b', '@c', '@top'))
+    eq(resolver.resolve('@b'), ('@c', '@a', '@top'))
+    eq(resolver.resolve('@top'), ())
+    eq(resolver.find_cycles(), [['@a', '@b', '@c', '@a']])
+    # reported once, not again on the next lookup
+    eq(len(resolver.find_cycles()), 1)
+
+def test_resolver_selfLoop():
+    resolver = group.GroupResolver({'@a': ['@a', '@b']})
+    eq(resolver.resolve('@a'), ('@b',))
+    eq(resolver.find_cycles(), [['@a', '@a']])
+
+def test_resolver_diamond():
+    resolver = group.GroupResolver({
+        'jdoe': ['@left', '@right'],
+        '@left': ['@top'],
+        '@right': ['@top'],
+        '@top': ['@roof'],
+        })
+    eq(resolver.resolve('jdoe'), ('@left', '@top', '@roof', '@right'))
+    eq(resolver.find_cycles(), [])
+
+def test_resolver_deep():
+    depth = 5000
+    parents = dict(('@g%d' % i, ['@g%d' % (i + 1)]) for i in xrange(depth))
+    resolver = group.GroupResolver(parents)
+    got = resolver.resolve('@g0')
+    eq(len(got), depth)
+    eq(got[-1], '@g%d' % depth)
+    eq(resolver.find_cycles(), [])
+    # as in a config snapshot
+    again = pickle.loads(pickle.dumps(resolver, pickle.HIGHEST_PROTOCOL))
+    eq(again.closures, {})
+    eq(again.resolve('@g0'), got)
+    eq(again.resolve('@g1'), got[1:])
+
+class CountingDict(dict):
+    looked_up = 0
+
+    def get(self, *a):
+        self.looked_up += 1
+        return dict.get(self, *a)
+
+def test_resolver_shared():
+    # many users under one deep hierarchy walk it once, not each
+    depth = 50
+    users = 100
+    parents = CountingDict(('@g%d' % i, ['@g%d' % (i + 1)])
+                           for i in xrange(depth))
+    for i in xrange(users):
+        parents['u%d' % i] = ['@x', '@g0']
+    parents['@x'] = ['@g%d' % (depth // 2), '@y']
+    resolver = group.GroupResolver(parents)
+    for i in xrange(users):
+        got = resolver.resolve('u%d' % i)
+        eq(len(got), depth + 3)
+        eq(got[:3], ('@x', '@g%d' % (depth // 2), '@g%d' % (depth // 2 + 1)))
+    eq(resolver.resolve('@g0'), tuple('@g%d' % i
+                                      for i in xrange(1, depth + 1)))
+    assert parents.looked_up <= 2 * (users + depth + 3), parents.looked_up
+
+def test_index_cycleAll():
+    cfg = gitolite("""\
+@a = @b @all
+@b = @a
+""")
+    eq(cfg.get_membership('jdoe'), ('@a', '@b', '@all'))
+    eq(cfg.get_group_closure('@a'), ('@b',))
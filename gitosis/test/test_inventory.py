@@ -0,0 +1,73 @@
+from nose.tools import eq_ as eq
+
+import os
+
+from gitosis import inventory
+from gitosis import util
+from gitosis.test.util import gitolite, maketemp, readFile
+
+class CountingProp(util.RepoProp):
+    name = 'description'
+
+    def __init__(self):
+        self.seen = []
+
+    def action(self, repobase, name, reponame, val):
+        self.seen.append(name)
+
+CONFIG = """\
+gitosis
+	repositories = %(tmp)s/repositories
+	generate-files-in = %(tmp)s
+repo foo
+	description = %(description)s
+repo sub
+	path_regex = ^sub/
+	description = sub
+"""
+
+def _config(tmp, description='stuff'):
+    return gitolite(CONFIG % dict(tmp=tmp, description=description))
+
+def test_update_replace():
+    tmp = maketemp()
+    path = os.path.join(tmp, 'repositories.list')
+    inv = inventory.Inventory(path)
+    eq(inv.read(), None)
+    # only a full scan starts one
+    inv.update({'foo': ('foo', 'abc')})
+    eq(inv.read(), None)
+
+    inv.replace({'foo': ('foo', 'abc'), 'sub/bar': ('sub', 'def')})
+    eq(readFile(path), 'foo\tfoo\tabc\nsub/bar\tsub\tdef\n')
+    inv.update({'foo': ('foo', 'ghi'), 'baz': ('', '')})
+    eq(inv.read(), {'foo': ('foo', 'ghi'),
+                    'sub/bar': ('sub', 'def'),
+                    'baz': ('', '')})
+    eq(inv.names(), ['baz', 'foo', 'sub/bar'])
+
+def test_rescan():
+    tmp = maketemp()
+    repos = os.path.join(tmp, 'repositories')
+    os.mkdir(repos)
+    os.mkdir(os.path.join(repos, 'foo.git'))
+    os.mkdir(os.path.join(repos, 'sub'))
+    os.mkdir(os.path.join(repos, 'sub', 'bar.git'))
+
+    prop = CountingProp()
+    eq(inventory.rescan(_config(tmp), [prop]), 2)
+    eq(sorted(prop.seen), ['foo', 'sub/bar'])
+    inv = inventory.Inventory(os.path.join(tmp, 'repositories.list'))
+    eq(inv.names(), ['foo', 'sub/bar'])
+
+    # only what is new or configured differently gets visited
+    os.mkdir(os.path.join(repos, 'sub', 'baz.git'))
+    os.rmdir(os.path.join(repos, 'sub', 'bar.git'))
+    prop = CountingProp()
+    eq(inventory.rescan(_config(tmp, 'other stuff'), [prop]), 2)
+    eq(sorted(prop.seen), ['foo', 'sub/baz'])
+    eq(inv.names(), ['foo', 'sub/baz'])
+
+    prop = CountingProp()
+    eq(inventory.rescan(_config(tmp, 'other stuff'), [prop]), 0)
+    eq(prop.seen, [])
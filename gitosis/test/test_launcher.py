@@ -0,0 +1,69 @@
+from nose.tools import eq_ as eq
+
+import os
+import subprocess
+import zipfile
+
+from gitosis import init
+from gitosis import launcher
+from gitosis.test.util import maketemp, readFile, writeFile
+
+def _run(path, *args):
+    child = subprocess.Popen(
+        args=[path] + list(args),
+        stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT,
+        )
+    got = child.communicate()[0]
+    return (child.returncode, got)
+
+def test_write_launcher():
+    tmp = maketemp()
+    path = os.path.join(tmp, 'gitosis-serve')
+    launcher.write_launcher(path, 'gitosis.serve')
+    got = readFile(path)
+    assert 'pkg_resources' not in got
+    assert 'from gitosis.serve import Main\n' in got
+    assert os.access(path, os.X_OK)
+    returncode, got = _run(path, '--help')
+    eq(returncode, 0)
+    assert got.startswith('Usage: gitosis-serve [OPTS] USER\n'), got
+
+def test_write_launcher_noSite():
+    tmp = maketemp()
+    path = os.path.join(tmp, 'gitosis-run-hook')
+    launcher.write_launcher(path, 'gitosis.run_hook', no_site=True)
+    eq(readFile(path).splitlines()[0], '#!%s -S' % launcher.sys.executable)
+    config = os.path.join(tmp, 'gitosis.conf')
+    writeFile(config, '')
+    returncode, got = _run(path, '--config', config)
+    eq(returncode, 2)
+    assert 'Missing argument HOOK' in got, got
+
+def test_install_zipapp():
+    tmp = maketemp()
+    bindir = os.path.join(tmp, 'bin')
+    os.mkdir(bindir)
+    zipapp = os.path.join(tmp, 'gitosis.pyz')
+    launcher.install(bindir=bindir, zipapp=zipapp, no_site=True)
+
+    names = zipfile.ZipFile(zipapp).namelist()
+    assert '__main__.py' in names
+    assert 'gitosis/serve.pyc' in names
+    assert not [n for n in names if n.startswith('gitosis/test/')]
+
+    for name in launcher.ZIPAPP_COMMANDS:
+        eq(os.readlink(os.path.join(bindir, name)), zipapp)
+    assert not os.path.islink(os.path.join(bindir, 'gitosis-init'))
+
+    returncode, got = _run(os.path.join(bindir, 'gitosis-serve'), '--help')
+    eq(returncode, 0)
+    assert got.startswith('Usage: gitosis-serve [OPTS] USER\n'), got
+
+    returncode, got = _run(zipapp)
+    eq(returncode, 1)
+    assert got.startswith('gitosis.pyz: run as one of gitosis-accessd'), got
+
+def test_template_dir():
+    got = init.template_dir('admin')
+    assert os.path.isfile(os.path.join(got, 'hooks', 'post-update'))
@@ -0,0 +1,89 @@
+from nose.tools import eq_ as eq
+
+import re
+
+from gitosis.pathmatch import PathMatcher, literal_prefix
+
+def _matcher(*patterns):
+    return PathMatcher([(re.compile(p), repo) for p, repo in patterns])
+
+def test_empty():
+    m = _matcher()
+    eq(m.match('foo'), None)
+
+def test_folded():
+    m = _matcher(('^[f]oo/', 'foo'), ('^.ar/', 'bar'), ('^(baz)', 'baz'))
+    eq(len(m.steps), 1)
+    eq(m.match('foo/x'), 'foo')
+    eq(m.match('bar/x'), 'bar')
+    eq(m.match('bazooka'), 'baz')
+    eq(m.match('quux'), None)
+
+def test_literal_prefix():
+    def check(pattern, want):
+        eq(literal_prefix(re.compile(pattern)), want)
+    check('^team-a/', 'team-a/')
+    check('mirrors/.*', 'mirrors/')
+    check(r'^a\.b/c', 'a.b/c')
+    check('^ab*c', 'a')
+    check('^ab?', 'a')
+    check('^a{2}', '')
+    check('^a/|^b/', '')
+    check('^(a)/', '')
+    check('^[ab]/', '')
+    check('(?i)^a/', '')
+    check('', '')
+
+def test_prefixed():
+    m = _matcher(('^foo/', 'foo'), ('^foo/bar/', 'foobar'), ('^bar', 'bar'))
+    eq(len(m.steps), 0)
+    eq(m.candidates('foo/bar/x'), [0, 1])
+    eq(m.candidates('bar'), [2])
+    eq(m.candidates('quux'), [])
+    eq(m.match('foo/bar/x'), 'foo')
+    eq(m.match('barn'), 'bar')
+    eq(m.match('fo'), None)
+
+def test_prefixedAndNot():
+    m = _matcher(
+        ('^[a-z]+/special', 'early'),
+        ('^team/', 'team'),
+        ('^.*', 'catchall'),
+        ('^team/x', 'late'),
+        )
+    eq(m.match('team/special'), 'early')
+    eq(m.match('team/x'), 'team')
+    eq(m.match('TEAM/x'), 'catchall')
+
+def test_firstDeclaredWins():
+    m = _matcher(('^a/b/', 'narrow'), ('^a/', 'wide'), ('^a/b/c', 'late'))
+    eq(m.match('a/b/c'), 'narrow')
+    eq(m.match('a/x'), 'wide')
+
+def test_innerGroups():
+    m = _matcher(('^(x|y)/(z)?', 'xy'), ('^w(v)', 'w'))
+    eq(m.match('y/'), 'xy')
+    eq(m.match('wv'), 'w')
+
+def test_unfoldable():
+    m = _matcher(
+        ('^a/', 'a'),
+        (r'^(b)\1/', 'bb'),
+        ('^(?P<name>c)/', 'c'),
+        ('^(?i)d/', 'd'),
+        ('^b', 'b'),
+        )
+    eq(m.match('a/'), 'a')
+    eq(m.match('bb/'), 'bb')
+    eq(m.match('b/'), 'b')
+    eq(m.match('c/'), 'c')
+    eq(m.match('D/'), 'd')
+
+def test_manyPatterns():
+    patterns = [('^team%d/' % i, 'team%d' % i) for i in xrange(500)]
+    patterns.append(('^(((t)))', 'fallback'))
+    m = _matcher(*patterns)
+    assert len(m.steps) < 10
+    eq(m.match('team0/x'), 'team0')
+    eq(m.match('team499/x'), 'team499')
+    eq(m.match('team500/x'), 'fallback')
@@ -311,6 +311,12 @@ exec git "$@"
         os.environ['PATH'] = '%s:%s' % (mockbindir, good_path)
         os.environ['GITOSIS_UNITTEST_COOKIE'] = magic_cookie
         got = repository.has_initial_commit(git_dir=tmp)
+        eq(got, True)
+        # read from the files, git did not run
+        assert not os.path.exists(os.path.join(tmp, 'cookie'))
+        # but does for refs it can't read
+        os.mkdir(os.path.join(tmp, 'reftable'))
+        got = repository.has_initial_commit(git_dir=tmp)
     finally:
         os.environ['PATH'] = good_path
         os.environ.pop('GITOSIS_UNITTEST_COOKIE', None)
@@ -346,3 +352,138 @@ def test_fast_import_parent():
         )
     eq(sorted(os.listdir(export)),
        sorted(['foo', 'quux']))
+
+def test_read_files():
+    tmp = maketemp()
+    git_dir = os.path.join(tmp, 'repo.git')
+    repository.init(path=git_dir)
+    repository.fast_import(
+        git_dir=git_dir,
+        commit_msg='foo initial bar',
+        committer='Mr. Unit Test <unit.test@example.com>',
+        files=[
+            ('foo', 'content'),
+            ('bar/quux', 'another\n'),
+            ('bar/empty', ''),
+            ('bar/deeper/thing', 'deep'),
+            ],
+        )
+    got = repository.read_files(git_dir, 'HEAD', ['foo', 'bar'])
+    eq(got, {
+        'foo': 'content',
+        'bar/quux': 'another\n',
+        'bar/empty': '',
+        'bar/deeper/thing': 'deep',
+        })
+    eq(repository.read_files(git_dir, 'HEAD', ['missing']), {})
+    # no index or work tree involved
+    assert not os.path.exists(os.path.join(git_dir, 'index'))
+
+def test_read_files_badRev():
+    tmp = maketemp()
+    git_dir = os.path.join(tmp, 'repo.git')
+    repository.init(path=git_dir)
+    assert_raises(
+        repository.GitLsTreeError,
+        repository.read_files, git_dir, 'HEAD', ['foo'])
+
+def _tree(path):
+    got = []
+    for dirpath, dirnames, filenames in os.walk(path):
+        for name in dirnames + filenames:
+            p = os.path.join(dirpath, name)
+            got.append((p[len(path):], os.stat(p).st_mode))
+    return sorted(got)
+
+def test_init_skeleton():
+    tmp = maketemp()
+    mockgit = os.path.join(tmp, 'git')
+    writeFile(mockgit, '''\
+#!/bin/sh
+echo ran >>"$(dirname "$0")/ran"
+PATH="${PATH#*:}" exec git "$@"
+''')
+    os.chmod(mockgit, 0755)
+    skeleton = os.path.join(tmp, 'skeleton.git')
+    plain = os.path.join(tmp, 'plain.git')
+    repository.init(plain, _git=mockgit)
+
+    one = os.path.join(tmp, 'one.git')
+    repository.init(one, _git=mockgit, skeleton=skeleton)
+    eq(readFile(os.path.join(tmp, 'ran')), 'ran\nran\n')
+    two = os.path.join(tmp, 'two.git')
+    repository.init(two, _git=mockgit, skeleton=skeleton)
+    # copied, git did not run again
+    eq(readFile(os.path.join(tmp, 'ran')), 'ran\nran\n')
+
+    check_mode(two, 0750, is_dir=True)
+    check_bare(two)
+    eq(_tree(two), _tree(plain))
+    eq(_tree(one), _tree(plain))
+    assert os.path.exists(os.path.join(skeleton, repository.SKELETON_STAMP))
+
+    # a different git makes the skeleton stale
+    writeFile(mockgit, readFile(mockgit) + '# upgraded\n')
+    os.chmod(mockgit, 0755)
+    three = os.path.join(tmp, 'three.git')
+    repository.init(three, _git=mockgit, skeleton=skeleton)
+    eq(readFile(os.path.join(tmp, 'ran')), 'ran\nran\nran\n')
+    eq(_tree(three), _tree(plain))
+    eq(sorted(n for n in os.listdir(tmp)
+              if n.endswith('.tmp') or n.endswith('.old')), [])
+
+def test_init_skeleton_copyFails():
+    tmp = maketemp()
+    skeleton = os.path.join(tmp, 'skeleton.git')
+    eq(repository.prepare_skeleton(skeleton), True)
+    # cannot be copied, as if it went away half way through
+    os.symlink(os.path.join(tmp, 'nonexistent'),
+               os.path.join(skeleton, 'broken'))
+    path = os.path.join(tmp, 'repo.git')
+    repository.init(path, skeleton=skeleton)
+    check_bare(path)
+    assert not os.path.lexists(os.path.join(path, 'broken'))
+    eq(sorted(n for n in os.listdir(tmp) if n.endswith('.tmp')), [])
+
+def test_init_skeleton_noGit():
+    tmp = maketemp()
+    skeleton = os.path.join(tmp, 'skeleton.git')
+    path = os.path.join(tmp, 'repo.git')
+    assert_raises(
+        OSError,
+        repository.init,
+        path, _git=os.path.join(tmp, 'nonexistent'), skeleton=skeleton)
+    assert not os.path.exists(skeleton)
+
+def test_resolve_ref():
+    tmp = maketemp()
+    repository.init(path=tmp)
+    eq(repository.resolve_ref(tmp), None)
+    branch = repository.head_ref(tmp)
+    assert branch.startswith('refs/heads/'), branch
+    repository.fast_import(
+        git_dir=tmp,
+        commit_msg='fakecommit',
+        committer='John Doe <jdoe@example.com>',
+        files=[],
+        )
+    head = repository.resolve_ref(tmp)
+    eq(len(head), 40)
+    eq(repository.resolve_ref(tmp, branch), head)
+    eq(repository.rev_parse(tmp, 'HEAD'), head)
+
+    # packed, with a symbolic ref on the way
+    subprocess.check_call(['git', '--git-dir=.', 'pack-refs', '--all'],
+                          cwd=tmp)
+    assert not os.path.exists(os.path.join(tmp, branch))
+    writeFile(os.path.join(tmp, 'refs', 'heads', 'alias'),
+              'ref: %s\n' % branch)
+    writeFile(os.path.join(tmp, 'HEAD'), 'ref: refs/heads/alias\n')
+    eq(repository.resolve_ref(tmp), head)
+    eq(repository.has_initial_commit(tmp), True)
+    eq(repository.resolve_ref(tmp, 'refs/heads/nonexistent'), None)
+
+    # detached
+    writeFile(os.path.join(tmp, 'HEAD'), head + '\n')
+    eq(repository.resolve_ref(tmp), head)
+    eq(repository.head_ref(tmp), None)
@@ -1,11 +1,12 @@
 from nose.tools import eq_ as eq
 
 import os
+import sys
 from ConfigParser import RawConfigParser
 from cStringIO import StringIO
 
-from gitosis import init, repository, run_hook
-from gitosis.test.util import maketemp, readFile
+from gitosis import init, inventory, repository, run_hook
+from gitosis.test.util import gitolite, maketemp, readFile, writeFile
 
 def test_post_update_simple():
     tmp = maketemp()
@@ -93,3 +94,224 @@ forweb.git John+Doe
     got = readFile(os.path.join(ssh, 'authorized_keys')).splitlines(True)
     assert 'command="gitosis-serve jdoe",no-port-forwarding,no-X11-forwarding,no-agent-forwarding,no-pty ssh-somealgo 0123456789ABCDEFBBBBBBBBBBBBBBBBBBBBBBBBBBBBBBBBBBBBBBBBBBBBBBBBBBBBBBBBBBBBBBBBBBBBBBBBBBBBBBBBBBBBBBBBBBBBBBBBBBBBBBBBBBBBBBBBBBBBBBBBBBBBBBBBBBBBBBBBBBBBBBBBBBBBBBBBBBBBBBBBBBBBBBBBBBBBBBBBBBBBBBBBBBBBBBBBBBBBBBB= jdoe@host.example.com\n' in got, \
         "SSH authorized_keys line for jdoe not found: %r" % got
+
+from gitosis.gitoliteConfig import GitoliteConfig
+from gitosis.test.util import writeFile
+
+KEY_JDOE = 'ssh-somealgo 0123456789ABCDEFBBBB= jdoe@host.example.com'
+KEY_WSMITH = 'ssh-somealgo 0123456789ABCDEFCCCC= wsmith@host.example.com'
+
+CONFIG = """\
+gitosis
+	repositories = %(tmp)s/repositories
+	generate-files-in = %(tmp)s/generated
+	ssh-authorized-keys-path = %(tmp)s/ssh/authorized_keys
+@gitosis-admin = theadmin
+@web = wsmith
+repo gitosis-admin
+	RW+ = @gitosis-admin
+repo fordaemon
+	R = daemon
+repo forweb
+	R = gitweb @web
+	owner = John Doe
+	description = blah blah
+repo other
+	description = other stuff
+"""
+
+def _setup(tmp):
+    repos = os.path.join(tmp, 'repositories')
+    os.mkdir(repos)
+    os.mkdir(os.path.join(tmp, 'generated'))
+    os.mkdir(os.path.join(tmp, 'ssh'))
+    admin = os.path.join(repos, 'gitosis-admin.git')
+    repository.init(path=admin)
+    for name in ('forweb', 'fordaemon', 'other'):
+        repository.init(path=os.path.join(repos, name + '.git'))
+    _commit(tmp, CONFIG, KEY_JDOE, parent=None)
+    return admin
+
+def _commit(tmp, config, key, parent='refs/heads/master^0'):
+    repository.fast_import(
+        git_dir=os.path.join(tmp, 'repositories', 'gitosis-admin.git'),
+        committer='John Doe <jdoe@example.com>',
+        commit_msg='stuff\n',
+        parent=parent,
+        files=[
+            ('gitosis.conf', config % dict(tmp=tmp)),
+            ('keydir/jdoe.pub', key + '\n'),
+            ],
+        )
+
+def _post_update(admin, **kw):
+    run_hook.post_update(cfg=GitoliteConfig(), git_dir=admin, **kw)
+
+def test_post_update_applied():
+    tmp = maketemp()
+    admin = _setup(tmp)
+    eq(run_hook.read_applied(admin), None)
+    _post_update(admin)
+    eq(run_hook.read_applied(admin), repository.rev_parse(admin, 'HEAD'))
+
+    got = readFile(os.path.join(tmp, 'repositories', 'other.git',
+                                'description'))
+    eq(got, 'other stuff\n')
+    got = readFile(os.path.join(tmp, 'generated', 'projects.list'))
+    eq(got, 'forweb.git')
+    got = readFile(os.path.join(tmp, 'ssh', 'authorized_keys'))
+    assert KEY_JDOE in got
+    # read from the object store, nothing checked out
+    assert not os.path.exists(os.path.join(admin, 'index'))
+    assert not os.path.exists(os.path.join(admin, 'gitosis-export'))
+
+def test_post_update_incremental():
+    tmp = maketemp()
+    admin = _setup(tmp)
+    _post_update(admin)
+    repos = os.path.join(tmp, 'repositories')
+    # so we can tell which got visited
+    os.unlink(os.path.join(repos, 'other.git', 'description'))
+    os.unlink(os.path.join(repos, 'forweb.git', 'description'))
+    os.unlink(os.path.join(tmp, 'ssh', 'authorized_keys'))
+
+    _commit(tmp, CONFIG.replace('blah blah', 'more blah'), KEY_JDOE)
+    _post_update(admin)
+    got = readFile(os.path.join(repos, 'forweb.git', 'description'))
+    eq(got, 'more blah\n')
+    assert not os.path.exists(os.path.join(repos, 'other.git', 'description'))
+    # keydir did not change
+    assert not os.path.exists(os.path.join(tmp, 'ssh', 'authorized_keys'))
+    got = readFile(os.path.join(admin, 'gitosis.conf'))
+    assert 'more blah' in got
+    eq(run_hook.read_applied(admin), repository.rev_parse(admin, 'HEAD'))
+
+def test_post_update_incremental_group():
+    tmp = maketemp()
+    admin = _setup(tmp)
+    _post_update(admin)
+    repos = os.path.join(tmp, 'repositories')
+    os.unlink(os.path.join(repos, 'other.git', 'description'))
+    os.unlink(os.path.join(repos, 'forweb.git', 'description'))
+
+    _commit(tmp, CONFIG.replace('@web = wsmith', '@web = jdoe'), KEY_JDOE)
+    _post_update(admin)
+    # forweb grants access to @web
+    got = readFile(os.path.join(repos, 'forweb.git', 'description'))
+    eq(got, 'blah blah\n')
+    assert not os.path.exists(os.path.join(repos, 'other.git', 'description'))
+    got = readFile(os.path.join(tmp, 'generated', 'projects.list'))
+    eq(got, 'forweb.git')
+
+def test_post_update_incremental_keys():
+    tmp = maketemp()
+    admin = _setup(tmp)
+    _post_update(admin)
+    repos = os.path.join(tmp, 'repositories')
+    os.unlink(os.path.join(repos, 'other.git', 'description'))
+
+    _commit(tmp, CONFIG, KEY_WSMITH)
+    _post_update(admin)
+    got = readFile(os.path.join(tmp, 'ssh', 'authorized_keys'))
+    assert KEY_WSMITH in got
+    assert KEY_JDOE not in got
+    assert not os.path.exists(os.path.join(repos, 'other.git', 'description'))
+
+def test_post_update_removed_repo():
+    tmp = maketemp()
+    admin = _setup(tmp)
+    _post_update(admin)
+
+    config = CONFIG.replace(
+        'repo forweb\n', 'repo unrelated\n')
+    _commit(tmp, config, KEY_JDOE)
+    _post_update(admin)
+    got = readFile(os.path.join(tmp, 'generated', 'projects.list'))
+    eq(got, '')
+
+def test_post_update_full():
+    tmp = maketemp()
+    admin = _setup(tmp)
+    _post_update(admin)
+    repos = os.path.join(tmp, 'repositories')
+    os.unlink(os.path.join(repos, 'other.git', 'description'))
+
+    _post_update(admin)
+    assert not os.path.exists(os.path.join(repos, 'other.git', 'description'))
+    _post_update(admin, full=True)
+    got = readFile(os.path.join(repos, 'other.git', 'description'))
+    eq(got, 'other stuff\n')
+
+def test_received_head():
+    tmp = maketemp()
+    admin = _setup(tmp)
+    head = repository.rev_parse(admin, 'HEAD')
+    got = run_hook._received_head(admin, StringIO(
+        '%s %s refs/heads/other\n%s %s refs/heads/master\n'
+        % ('1' * 40, head, '2' * 40, head)))
+    eq(got, '2' * 40)
+    got = run_hook._received_head(admin, StringIO(
+        '%s %s refs/heads/master\n' % ('0' * 40, head)))
+    eq(got, None)
+
+def test_post_update_threads():
+    tmp = maketemp()
+    admin = _setup(tmp)
+    _commit(tmp, CONFIG.replace(
+        'gitosis\n', 'gitosis\n\tprop-threads = 3\n'), KEY_JDOE)
+    _post_update(admin)
+    repos = os.path.join(tmp, 'repositories')
+    got = readFile(os.path.join(repos, 'other.git', 'description'))
+    eq(got, 'other stuff\n')
+    got = readFile(os.path.join(repos, 'forweb.git', 'description'))
+    eq(got, 'blah blah\n')
+    assert os.path.exists(
+        os.path.join(repos, 'fordaemon.git', 'git-daemon-export-ok'))
+    got = readFile(os.path.join(tmp, 'generated', 'projects.list'))
+    eq(got, 'forweb.git')
+
+def test_post_update_inventory():
+    tmp = maketemp()
+    admin = _setup(tmp)
+    config = CONFIG + 'repo sub\n\tpath_regex = ^sub/\n\tdescription = sub\n'
+    _commit(tmp, config, KEY_JDOE)
+    repos = os.path.join(tmp, 'repositories')
+    os.mkdir(os.path.join(repos, 'sub'))
+    repository.init(path=os.path.join(repos, 'sub', 'one.git'))
+    _post_update(admin)
+    got = inventory.Inventory(
+        os.path.join(tmp, 'generated', 'repositories.list')).names()
+    eq(got, ['fordaemon', 'forweb', 'gitosis-admin', 'other', 'sub/one'])
+
+    # found through the inventory, not by looking at the disk
+    repository.init(path=os.path.join(repos, 'sub', 'two.git'))
+    _commit(tmp, config.replace('= sub\n', '= more sub\n'), KEY_JDOE)
+    _post_update(admin)
+    got = readFile(os.path.join(repos, 'sub', 'one.git', 'description'))
+    eq(got, 'more sub\n')
+    got = readFile(os.path.join(repos, 'sub', 'two.git', 'description'))
+    assert got != 'more sub\n'
+
+def test_load_props_extProps():
+    tmp = maketemp()
+    writeFile(os.path.join(tmp, 'gitosis_test_ext_props.py'), """\
+from gitosis import util
+
+class ExtProp(util.RepoProp):
+    name = 'ext'
+
+def get_props():
+    return (ExtProp(),)
+""")
+    cfg = gitolite('gitosis\n\textProps = %s\n'
+                   % os.path.join(tmp, 'gitosis_test_ext_props.py'))
+    before = len(sys.path)
+    try:
+        for i in xrange(3):
+            props = run_hook.load_props(cfg)
+            eq([p.name for p in props],
+               ['daemon', 'gitweb', 'description', 'owner', 'ext'])
+        # added once, not for every repository created
+        eq(sys.path[before:], [tmp])
+    finally:
+        del sys.path[before:]
@@ -553,3 +553,100 @@ def test_typo_writeable():
         "Repository 'foo' config has typo \"writeable\", shou"
         +"ld be \"writable\"\n",
         )
+
+def test_gitolite_readOnly():
+    tmp = util.maketemp()
+    repository.init(os.path.join(tmp, 'foo.git'))
+    cfg = util.gitolite("""\
+gitosis
+	repositories = %s
+repo foo
+	R = jdoe
+""" % tmp)
+    got = serve.serve(
+        cfg=cfg,
+        user='jdoe',
+        command="git-upload-pack 'foo'",
+        )
+    eq(got, "git-upload-pack '%s/foo.git'" % tmp)
+    assert_raises(
+        serve.WriteAccessDenied,
+        serve.serve,
+        cfg=cfg,
+        user='jdoe',
+        command="git-receive-pack 'foo'",
+        )
+    assert_raises(
+        serve.ReadAccessDenied,
+        serve.serve,
+        cfg=cfg,
+        user='wsmith',
+        command="git-upload-pack 'foo'",
+        )
+
+def test_gitolite_writeImpliesRead():
+    tmp = util.maketemp()
+    repository.init(os.path.join(tmp, 'foo.git'))
+    cfg = util.gitolite("""\
+gitosis
+	repositories = %s
+@devs = jdoe
+repo foo
+	RW+ = @devs
+""" % tmp)
+    for command in ("git-upload-pack 'foo'", "git receive-pack 'foo.git'"):
+        got = serve.serve(cfg=cfg, user='jdoe', command=command)
+        eq(got, "%s '%s/foo.git'" % (command.split(" '")[0], tmp))
+
+# imported by the hot path, these only pull in what access checking needs
+HOT_PATH = """\
+import sys
+sys.argv = ['gitosis-serve', 'jdoe']
+from gitosis import serve
+from gitosis.gitoliteConfig import GitoliteConfig
+parser, options, args = serve.Main().parse_args()
+assert parser is None and args == ['jdoe'], (parser, args)
+cfg = GitoliteConfig()
+cfg.load(['repo foo', 'R = wsmith'])
+try:
+    serve.serve(cfg=cfg, user='jdoe', command="git-upload-pack 'foo'")
+except serve.ReadAccessDenied:
+    pass
+print ' '.join(sorted(sys.modules))
+"""
+
+def test_hotPath_imports():
+    import subprocess, sys
+    child = subprocess.Popen(
+        args=[sys.executable, '-c', HOT_PATH],
+        cwd=os.path.dirname(os.path.dirname(os.path.dirname(
+            os.path.abspath(__file__)))),
+        stdout=subprocess.PIPE,
+        )
+    got = child.stdout.read().split()
+    eq(child.wait(), 0)
+    for module in ('optparse', 'base64', 'subprocess', 'SocketServer',
+                   'gitosis.repository', 'gitosis.gitweb',
+                   'gitosis.gitdaemon', 'gitosis.accessd'):
+        assert module not in got, \
+            '%s imported on the gitosis-serve hot path' % module
+
+def test_gitolite_create_inventory():
+    tmp = util.maketemp()
+    repositories = os.path.join(tmp, 'repositories')
+    os.mkdir(repositories)
+    cfg = util.gitolite("""\
+gitosis
+	repositories = %s
+	generate-files-in = %s
+repo foo/bar
+	RW+ = jdoe
+	description = bar stuff
+""" % (repositories, tmp))
+    from gitosis import inventory
+    inv = inventory.Inventory(os.path.join(tmp, 'repositories.list'))
+    inv.replace({})
+    serve.serve(cfg=cfg, user='jdoe', command="git-receive-pack 'foo/bar'")
+    (reponame, fingerprint) = inv.read()['foo/bar']
+    eq(reponame, 'foo/bar')
+    assert fingerprint
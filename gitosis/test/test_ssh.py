@@ -98,6 +98,35 @@ class ReadKeys_Test(object):
             ('jdoe', KEY_2),
             ]))
 
+class ReadKeyBlobs_Test(object):
+    def test_simple(self):
+        got = list(ssh.readKeyBlobs({
+            'wsmith.pub': KEY_2+'\n',
+            'jdoe.pub': KEY_1+'\n'+KEY_2,
+            '.hidden.pub': KEY_1+'\n',
+            'README': 'junk\n',
+            'jd"oe.pub': KEY_1+'\n',
+            'empty.pub': '',
+            }))
+        eq(got, [
+            ('jdoe', KEY_1),
+            ('jdoe', KEY_2),
+            ('wsmith', KEY_2),
+            ])
+
+    def test_sameAsReadKeys(self):
+        tmp = maketemp()
+        keydir = os.path.join(tmp, 'keys')
+        mkdir(keydir)
+        blobs = {
+            'jdoe.pub': KEY_1+'\n\n'+KEY_2+'\n',
+            'wsmith.pub': KEY_2,
+            }
+        for filename, data in blobs.items():
+            writeFile(os.path.join(keydir, filename), data)
+        eq(list(ssh.readKeyBlobs(blobs)), list(ssh.readKeys(keydir)))
+
+
 class GenerateAuthorizedKeys_Test(object):
     def test_simple(self):
         def k():
@@ -199,3 +228,77 @@ baz
 command="gitosis-serve jdoe",no-port-forwarding,\
 no-X11-forwarding,no-agent-forwarding,no-pty %(key_1)s
 ''' % dict(key_1=KEY_1))
+
+    def test_unchanged(self):
+        tmp = maketemp()
+        path = os.path.join(tmp, 'authorized_keys')
+        writeFile(path, '# foo\n')
+        keydir = os.path.join(tmp, 'one')
+        mkdir(keydir)
+        writeFile(os.path.join(keydir, 'jdoe.pub'), KEY_1+'\n')
+
+        eq(ssh.writeAuthorizedKeys(path=path, keydir=keydir), True)
+        st = os.stat(path)
+        eq(ssh.writeAuthorizedKeys(path=path, keydir=keydir), False)
+        eq(os.stat(path).st_ino, st.st_ino)
+
+        writeFile(os.path.join(keydir, 'wsmith.pub'), KEY_2+'\n')
+        eq(ssh.writeAuthorizedKeys(path=path, keydir=keydir), True)
+        assert os.stat(path).st_ino != st.st_ino
+        eq(readFile(path).splitlines()[-1],
+           list(ssh.generateAuthorizedKeys([('wsmith', KEY_2)]))[1])
+
+
+KEY_ED25519 = ('ssh-ed25519 AAAAC3NzaC1lZDI1NTE5AAAAIKynxjqtl1ToD1bf3i3hUT5u1'
+               '9lCp7Zpy3uE/JZBthVg jdoe@host')
+
+class KeyFingerprint_Test(object):
+    def test_simple(self):
+        # as printed by ssh-keygen -l
+        got = ssh.keyFingerprint(KEY_ED25519)
+        eq(got, 'SHA256:NI93Uc1CvCk2KFOmOWXGjXOYD1rTRXi7XoBBJUOde54')
+
+    def test_noComment(self):
+        got = ssh.keyFingerprint(KEY_ED25519.rsplit(None, 1)[0])
+        eq(got, 'SHA256:NI93Uc1CvCk2KFOmOWXGjXOYD1rTRXi7XoBBJUOde54')
+
+    def test_junk(self):
+        eq(ssh.keyFingerprint(''), None)
+        eq(ssh.keyFingerprint('junk'), None)
+        eq(ssh.keyFingerprint('ssh-rsa AAAAB'), None)
+
+
+class WriteKeyIndex_Test(object):
+    def test_simple(self):
+        tmp = maketemp()
+        keydir = os.path.join(tmp, 'keys')
+        mkdir(keydir)
+        writeFile(os.path.join(keydir, 'jdoe.pub'), KEY_ED25519+'\n\n')
+        writeFile(os.path.join(keydir, 'wsmith.pub'), KEY_2+'\n')
+        writeFile(os.path.join(keydir, 'broken.pub'), 'junk\n')
+        path = os.path.join(tmp, 'authorized_keys.cdb')
+
+        ssh.writeKeyIndex(path=path, keydir=keydir)
+
+        eq(sorted(os.listdir(tmp)), ['authorized_keys.cdb', 'keys'])
+        got = ssh.lookupKeyIndex(
+            path, 'SHA256:NI93Uc1CvCk2KFOmOWXGjXOYD1rTRXi7XoBBJUOde54')
+        eq(got, [
+            'command="gitosis-serve jdoe",no-port-forwarding,'
+            +'no-X11-forwarding,no-agent-forwarding,no-pty %s'
+            % KEY_ED25519])
+        got = ssh.lookupKeyIndex(path, ssh.keyFingerprint(KEY_2))
+        eq(got, list(ssh.generateAuthorizedKeys([('wsmith', KEY_2)]))[1:])
+        eq(ssh.lookupKeyIndex(path, ssh.keyFingerprint(KEY_1)), [])
+
+    def test_unchanged(self):
+        tmp = maketemp()
+        keydir = os.path.join(tmp, 'keys')
+        mkdir(keydir)
+        writeFile(os.path.join(keydir, 'jdoe.pub'), KEY_ED25519+'\n')
+        path = os.path.join(tmp, 'authorized_keys.cdb')
+
+        eq(ssh.writeKeyIndex(path=path, keydir=keydir), True)
+        st = os.stat(path)
+        eq(ssh.writeKeyIndex(path=path, keydir=keydir), False)
+        eq(os.stat(path).st_ino, st.st_ino)
@@ -0,0 +1,139 @@
+from nose.tools import eq_ as eq
+
+import os
+import threading
+
+from gitosis import util
+from gitosis.test.util import gitolite, maketemp
+
+class RecordingProp(util.RepoProp):
+    name = 'record'
+
+    def __init__(self):
+        self.seen = []
+        self.threads = set()
+
+    def _get(self, config, reponame):
+        return reponame
+
+    def action(self, repobase, name, reponame, val):
+        self.seen.append((name, val))
+        self.threads.add(threading.currentThread().getName())
+
+def _config(tmp, threads=None):
+    lines = ['gitosis', 'repositories = %s' % tmp]
+    if threads is not None:
+        lines.append('prop-threads = %s' % threads)
+    lines.extend(['repo foo', 'R = jdoe',
+                  'repo sub', 'path_regex = ^sub/'])
+    return gitolite('\n'.join(lines))
+
+def _repos(tmp):
+    os.mkdir(os.path.join(tmp, 'foo.git'))
+    os.mkdir(os.path.join(tmp, 'sub'))
+    for i in xrange(50):
+        os.mkdir(os.path.join(tmp, 'sub', 'r%d.git' % i))
+
+def test_getPropThreads():
+    tmp = maketemp()
+    eq(util.getPropThreads(_config(tmp)), 1)
+    eq(util.getPropThreads(_config(tmp, 8)), 8)
+    eq(util.getPropThreads(_config(tmp, 0)), 1)
+    eq(util.getPropThreads(_config(tmp, 'many')), 1)
+
+def test_travel_serial():
+    tmp = maketemp()
+    _repos(tmp)
+    prop = RecordingProp()
+    repodir = util.RepositoryDir(_config(tmp), [prop])
+    repodir.travel()
+    eq(len(prop.seen), 51)
+    eq(prop.threads, set([threading.currentThread().getName()]))
+    eq(repodir.stats['record'][0], 51)
+
+def test_travel_threads():
+    tmp = maketemp()
+    _repos(tmp)
+    prop = RecordingProp()
+    repodir = util.RepositoryDir(_config(tmp, 4), [prop])
+    eq(repodir.threads, 4)
+    repodir.travel()
+    eq(sorted(prop.seen),
+       sorted([('foo', 'foo')]
+              + [('sub/r%d' % i, 'sub') for i in xrange(50)]))
+    assert threading.currentThread().getName() not in prop.threads
+    eq(repodir.stats['record'][0], 51)
+
+def test_write_file_if_changed():
+    tmp = maketemp()
+    path = os.path.join(tmp, 'foo')
+    eq(util.read_file(path), None)
+    eq(util.write_file_if_changed(path, 'one\n'), True)
+    st = os.stat(path)
+    eq(util.write_file_if_changed(path, 'one\n'), False)
+    eq(os.stat(path).st_ino, st.st_ino)
+    eq(util.write_file_if_changed(path, 'two\n', sync=True), True)
+    eq(util.read_file(path), 'two\n')
+
+class SkippingProp(RecordingProp):
+    def current(self, repobase, name, reponame, val):
+        return name.endswith('1')
+
+    def action(self, repobase, name, reponame, val):
+        RecordingProp.action(self, repobase, name, reponame, val)
+        if name.endswith('2'):
+            return False
+
+def test_visit_stats():
+    tmp = maketemp()
+    _repos(tmp)
+    prop = SkippingProp()
+    repodir = util.RepositoryDir(_config(tmp), [prop])
+    repodir.travel()
+    # r1, r11, ... r41 are current, r2, r12, ... r42 found nothing to do
+    eq(repodir.stats['record'][:2], [41, 10])
+    eq(len(prop.seen), 46)
+
+class TriggerOnlyProp(object):
+    # what extProps could always provide: a name and trigger()
+    name = 'R'
+
+    def __init__(self):
+        self.seen = []
+
+    def trigger(self, config, repobase, name, reponame):
+        self.seen.append(name)
+
+class OverridingProp(RecordingProp):
+    def trigger(self, config, repobase, name, reponame):
+        self.seen.append((name, 'overridden'))
+
+def test_visit_calls_trigger():
+    tmp = maketemp()
+    _repos(tmp)
+    props = [TriggerOnlyProp(), OverridingProp()]
+    repodir = util.RepositoryDir(_config(tmp), props)
+    repodir.visit(['foo', 'sub/r1'])
+    eq(props[0].seen, ['foo', 'sub/r1'])
+    eq(props[1].seen, [('foo', 'overridden'), ('sub/r1', 'overridden')])
+    eq(repodir.visited['foo'],
+       ('foo', util.prop_fingerprint([('R', frozenset(['jdoe'])),
+                                      ('record', 'foo')])))
+
+def test_walk_repositories():
+    tmp = maketemp()
+    _repos(tmp)
+    # not looked into: the insides of repositories and symlinked dirs
+    os.mkdir(os.path.join(tmp, 'foo.git', 'inner.git'))
+    os.mkdir(os.path.join(tmp, 'sub', 'deeper'))
+    os.mkdir(os.path.join(tmp, 'sub', 'deeper', 'bar.git'))
+    os.symlink(os.path.join(tmp, 'sub'), os.path.join(tmp, 'link'))
+    os.symlink(os.path.join(tmp, 'foo.git'), os.path.join(tmp, 'alias.git'))
+    file(os.path.join(tmp, 'notdir.git'), 'w').close()
+    eq(sorted(util.walk_repositories(tmp)),
+       sorted(['foo', 'alias', 'sub/deeper/bar']
+              + ['sub/r%d' % i for i in xrange(50)]))
+
+def test_walk_repositories_missing():
+    tmp = maketemp()
+    eq(list(util.walk_repositories(os.path.join(tmp, 'nonexistent'))), [])
@@ -52,6 +52,15 @@ def readFile(path):
         f.close()
     return data
 
+def gitolite(text):
+    """
+    Return a GitoliteConfig loaded from ``text``.
+    """
+    from gitosis.gitoliteConfig import GitoliteConfig
+    cfg = GitoliteConfig()
+    cfg.load(text.splitlines())
+    return cfg
+
 def assert_raises(excClass, callableObj, *args, **kwargs):
     """
     Like unittest.TestCase.assertRaises, but returns the exception.
@@ -2,8 +2,10 @@ import errno
 import os
 import logging
 import re
+import time
 from gitosis.gitoliteConfig import GitoliteConfigException
-from base64 import urlsafe_b64decode
+
+log = logging.getLogger('gitosis.util')
 
 def mkdir(*a, **kw):
     try:
@@ -14,6 +16,51 @@ def mkdir(*a, **kw):
         else:
             raise
 
+def read_file(path):
+    """
+    Return the contents of ``path``, or ``None`` if it doesn't exist.
+    """
+    try:
+        f = file(path, 'rb')
+    except IOError, e:
+        if e.errno == errno.ENOENT:
+            return None
+        else:
+            raise
+    try:
+        return f.read()
+    finally:
+        f.close()
+
+def write_file_if_changed(path, data, old=None, sync=False):
+    """
+    Replace ``path`` with ``data`` through a temporary file and a
+    rename, unless it holds exactly that already.
+
+    @param old: the current contents of ``path`` if the caller read
+    them already.
+
+    @param sync: fsync the new file before renaming it into place.
+
+    Returns whether ``path`` was written.
+    """
+    if old is None:
+        old = read_file(path)
+    if data == old:
+        return False
+
+    tmp = '%s.%d.tmp' % (path, os.getpid())
+    f = file(tmp, 'wb')
+    try:
+        f.write(data)
+        if sync:
+            f.flush()
+            os.fsync(f.fileno())
+    finally:
+        f.close()
+    os.rename(tmp, path)
+    return True
+
 def getRepositoryDir(config):
     repositories = os.path.expanduser('~')
 
@@ -36,19 +83,155 @@ def getSSHAuthorizedKeysPath(config):
         path = os.path.expanduser('~/.ssh/authorized_keys')
     return path
 
-def _extract_reldir(topdir, dirpath):
-    if topdir == dirpath:
-        return '.'
-    prefix = topdir + '/'
-    assert dirpath.startswith(prefix)
-    reldir = dirpath[len(prefix):]
-    return reldir
+def getPropThreads(config):
+    """
+    How many repositories to apply props to at a time.
+    """
+    threads = config.get_gitosis('prop-threads')
+    if threads == None:
+        return 1
+    try:
+        threads = int(threads)
+    except ValueError:
+        log.warning('Ignored invalid prop-threads: %r', threads)
+        return 1
+    return max(threads, 1)
+
+def getSSHKeyIndexPath(config):
+    """
+    Where to keep the key index for gitosis-authorized-keys, ``None``
+    if it is not wanted.
+    """
+    return config.get_gitosis('ssh-key-index-path')
+
+def getInventoryPath(config):
+    """
+    Where the inventory of repositories on disk is kept.
+    """
+    generated = getGeneratedFilesDir(config)
+    return os.path.join(generated, 'repositories.list')
+
+def getSkeletonPath(config):
+    """
+    Where the repository new ones are copied from is kept.
+    """
+    generated = getGeneratedFilesDir(config)
+    return os.path.join(generated, 'skeleton.git')
+
+def prop_fingerprint(values):
+    """
+    Fingerprint the (prop name, value) pairs applied to a repository.
+    """
+    import hashlib
+    return hashlib.sha1(repr(sorted(values))).hexdigest()
+
+def prop_value(prop, config, reponame):
+    """
+    The value of ``prop`` for ``reponame``, as fingerprinted for the
+    inventory.
+
+    Props that don't derive from RepoProp, only having ``name`` and
+    ``trigger()``, are taken to follow the repo option ``name``.
+    """
+    get = getattr(prop, '_get', None)
+    if get is not None:
+        return get(config, reponame)
+    try:
+        return config.get_repo(reponame, prop.name)
+    except GitoliteConfigException:
+        return None
+
+def _get_scandir():
+    try:
+        return os.scandir
+    except AttributeError:
+        pass
+    try:
+        from scandir import scandir
+    except ImportError:
+        return None
+    return scandir
+
+def _scan_dirs(scandir, path):
+    # d_type tells directories and symlinks apart without a stat,
+    # except for symlinks, which is_dir() has to follow
+    dirs = []
+    for entry in scandir(path):
+        if entry.is_dir():
+            dirs.append((entry.name, entry.is_symlink()))
+    return dirs
+
+def _list_dirs(path):
+    dirs = []
+    for name in os.listdir(path):
+        full = os.path.join(path, name)
+        if os.path.isdir(full):
+            # repositories are never descended into, no need to lstat
+            is_link = not name.endswith('.git') and os.path.islink(full)
+            dirs.append((name, is_link))
+    return dirs
+
+def walk_repositories(topdir):
+    """
+    Generate the name of every repository under ``topdir``, relative
+    to it and without ``.git``.
+
+    Directories named ``*.git`` are repositories and are not looked
+    into; other directories are, unless they are symlinks. Uses
+    ``scandir`` (``os.scandir``, or the backport module) when it is
+    available, so only symlinks need a stat.
+    """
+    scandir = _get_scandir()
+    stack = [(topdir, '')]
+    while stack:
+        path, prefix = stack.pop()
+        try:
+            if scandir is None:
+                dirs = _list_dirs(path)
+            else:
+                dirs = _scan_dirs(scandir, path)
+        except OSError, e:
+            if e.errno == errno.ENOENT:
+                continue
+            raise
+
+        subdirs = []
+        for name, is_link in dirs:
+            if name.endswith('.git'):
+                if name != '.git':
+                    yield prefix + name[:-len('.git')]
+            elif not is_link:
+                subdirs.append((os.path.join(path, name),
+                                prefix + name + '/'))
+        # depth first, in directory order
+        subdirs.reverse()
+        stack.extend(subdirs)
 
 class RepoProp(object):
+    """
+    A per-repository setting, applied to the repositories on disk.
+
+    Applying should be a no-op when the repository already matches:
+    ``action()`` returns ``False`` when it found nothing to change (or
+    ``current()`` can tell up front), so runs over repositories that
+    are up to date don't rewrite anything.
+    """
     name = "Unknown"
- 
+
     def action(self, repobase, name, reponame, val):
-        """action for this prop"""
+        """
+        action for this prop
+
+        Returns ``False`` if nothing needed changing; anything else
+        counts as applied.
+        """
+
+    def current(self, repobase, name, reponame, val):
+        """
+        Whether ``val`` is already in effect, so action() can be
+        skipped; override if that is cheaper to tell than to act.
+        """
+        return False
 
     def _get(self, config, reponame):
         try:
@@ -59,57 +242,106 @@ class RepoProp(object):
         return val
 
     def trigger(self, config, repobase, name, reponame):
+        """
+        Returns ``None`` if the prop is not set for ``reponame``,
+        ``False`` if it was in effect already and ``True`` if it was
+        applied.
+        """
         # repobas -- repositories dir
         # name    -- repositories relative path with '.git' stripped
         # reponame -- name of the repo which @name belongs to
         val = self._get(config, reponame)
-        if val != None:
-            self.action(repobase, name, reponame, val)
-    
+        return self.apply(repobase, name, reponame, val)
+
+    def apply(self, repobase, name, reponame, val):
+        """
+        Like trigger(), for ``val`` looked up already.
+        """
+        if val == None:
+            return None
+        if self.current(repobase, name, reponame, val):
+            return False
+        return self.action(repobase, name, reponame, val) is not False
+
+class ReaderProp(RepoProp):
+    """
+    A prop that is on when the config repo lets ``reader`` read it.
+
+    The R list is a shared frozenset held by the config, so looking it
+    up for every repository costs a dict lookup.
+    """
+    reader = None
+
+    def _get(self, config, reponame):
+        try:
+            users = config.get_repo(reponame, 'R')
+        except GitoliteConfigException:
+            log.exception('Failed to get users that can read(Only) repo \'%s\'' % reponame)
+            return None
+        return bool(users and self.reader in users)
+
 class RepositoryDir(object):
     log = logging.getLogger('gitosis.RepositoryDir')
 
-    def __init__(self, config, props):
+    def __init__(self, config, props, threads=None):
+        """
+        @param threads: how many repositories to visit at a time,
+        ``prop-threads`` from the gitosis section by default. Props
+        are then triggered from that many threads, and have to be
+        safe for it.
+        """
         self.repositories = getRepositoryDir(config)
         self.config = config
         self.props = props
+        if threads is None:
+            threads = getPropThreads(config)
+        self.threads = threads
+        # prop name -> [applied, unchanged, seconds]
+        self.stats = {}
+        # name -> (config repo, prop fingerprint), what visit_one()
+        # saw, for the inventory
+        self.visited = {}
+        self.__lock = None
+
+    def names(self):
+        """
+        Generate the name of every repository on disk, relative to the
+        repositories dir and without ``.git``.
+        """
+        return walk_repositories(self.repositories)
 
     def travel(self):
-        repositories = self.repositories
-        def _error(e):
-            if e.errno == errno.ENOENT:
-                pass
-            else:
-                raise e
-
-        for (dirpath, dirnames, filenames) \
-                in os.walk(repositories, onerror=_error):
-            # oh how many times i have wished for os.walk to report
-            # topdir and reldir separately, instead of dirpath
-            reldir = _extract_reldir(
-                topdir=repositories,
-                dirpath=dirpath,
-                )
-
-            self.log.debug('Walking %r, seeing %r', reldir, dirnames)
-
-            to_recurse = []
-            repos = []
-            for dirname in dirnames:
-                if dirname.endswith('.git'):
-                    repos.append(dirname)
-                else:
-                    to_recurse.append(dirname)
-            dirnames[:] = to_recurse
-
-            for repo in repos:
-                name, ext = os.path.splitext(repo)
-                if reldir != '.':
-                    name = os.path.join(reldir, name)
-                assert ext == '.git'
+        self.visit(self.names())
 
+    def visit(self, names):
+        """
+        visit_one() every repository in ``names``, ``self.threads`` at
+        a time, then log how long each prop took.
+        """
+        start = time.time()
+        if self.threads > 1:
+            import threading
+            from multiprocessing.pool import ThreadPool
+            self.__lock = threading.Lock()
+            pool = ThreadPool(self.threads)
+            try:
+                for _ in pool.imap_unordered(self.visit_one, names, 16):
+                    pass
+            finally:
+                pool.terminate()
+                pool.join()
+                self.__lock = None
+        else:
+            for name in names:
                 self.visit_one(name)
- 
+
+        self.log.info('Visited repositories in %.3f s, %d at a time',
+                      time.time() - start, self.threads)
+        for prop_name in sorted(self.stats):
+            applied, unchanged, seconds = self.stats[prop_name]
+            self.log.info('Prop %r: %d applied, %d unchanged, %.3f s',
+                          prop_name, applied, unchanged, seconds)
+
     def visit_one(self, name):
         repositories = self.repositories
         config = self.config
@@ -124,10 +356,35 @@ class RepositoryDir(object):
 
         if not repo:
             self.log.warning("No repo contains '%s'" % name)
+            self._add_visited(name, '', '')
             return
 
+        values = []
         for p in props:
-            p.trigger(config, repositories, name, repo)
+            start = time.time()
+            applied = p.trigger(config, repositories, name, repo)
+            self._add_stats(p.name, applied, time.time() - start)
+            values.append((p.name, prop_value(p, config, repo)))
+        self._add_visited(name, repo, prop_fingerprint(values))
+
+    def _add_visited(self, name, reponame, fingerprint):
+        # a single dict assignment needs no lock
+        self.visited[name] = (reponame, fingerprint)
+
+    def _add_stats(self, prop_name, applied, seconds):
+        lock = self.__lock
+        if lock is not None:
+            lock.acquire()
+        try:
+            stats = self.stats.setdefault(prop_name, [0, 0, 0.0])
+            if applied:
+                stats[0] += 1
+            elif applied is not None:
+                stats[1] += 1
+            stats[2] += seconds
+        finally:
+            if lock is not None:
+                lock.release()
 
 def parse_bool(val):
     if val in ('Yes',   'yes',  'YES',
@@ -139,6 +396,8 @@ def parse_bool(val):
     return False
 
 def decode_id(encoded_id):
+    from base64 import urlsafe_b64decode
+
     prefix = 'git'
     _id = ''
 
@@ -45,6 +45,10 @@ arbitrary commands.
             'gitosis-serve = gitosis.serve:Main.run',
             'gitosis-run-hook = gitosis.run_hook:Main.run',
             'gitosis-init = gitosis.init:Main.run',
+            'gitosis-accessd = gitosis.accessd:Main.run',
+            'gitosis-authorized-keys = gitosis.authorized_keys:Main.run',
+            'gitosis-rescan = gitosis.inventory:Main.run',
+            'gitosis-daemon-access = gitosis.daemon_access:Main.run',
             ],
         },
 